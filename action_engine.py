@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+
+class ActionEngine(object):
+    """Dispatches the actions found on every frame as press and hold events.
+
+    The actions of a frame are compared with those of the previous frame,
+    and a handler is called only when an action is pressed, when its
+    parameters change while it is held (for example the zoom speed), and
+    when a held action repeats. An action repeats only if it has a repeat
+    rate, first after repeat_delay seconds and then rate times per second.
+    A released action is forgotten and fires again when pressed again, so
+    held memory recalls and toggles are sent once however much the axes
+    move meanwhile.
+
+    Handlers are called as handler(action, **params) like the command
+    handlers of Foo.
+    """
+
+    def __init__(self, handlers, repeat_rates=None, repeat_delay=0.5):
+        object.__init__(self)
+
+        self.handlers = handlers
+        # Repeats per second by action, actions not listed don't repeat
+        self.repeat_rates = repeat_rates or {}
+        self.repeat_delay = repeat_delay
+
+        # Parameters of the actions held on the previous frame by action
+        self.active = {}
+        # Time of the next repeat by held action
+        self.next_repeats = {}
+
+        self.pressed_count = 0
+        self.changed_count = 0
+        self.repeated_count = 0
+        self.released_count = 0
+
+    def configure(self, repeat_rates, repeat_delay):
+        self.repeat_rates = repeat_rates
+        self.repeat_delay = repeat_delay
+        self.next_repeats = {}
+
+    def update(self, actions, now):
+        """Dispatch the changes from the previous frame and the repeats which are due."""
+        for action in [action for action in self.active if action not in actions]:
+            del self.active[action]
+            self.next_repeats.pop(action, None)
+            self.released_count += 1
+
+        for action, params in actions.iteritems():
+            if action not in self.active:
+                self.active[action] = params
+                rate = self.repeat_rates.get(action)
+                if rate:
+                    self.next_repeats[action] = now + self.repeat_delay
+                self.pressed_count += 1
+                self.dispatch(action, params)
+            elif self.active[action] != params:
+                self.active[action] = params
+                self.changed_count += 1
+                self.dispatch(action, params)
+
+        self.repeat(now)
+
+    def repeat(self, now):
+        """Dispatch the held actions whose repeat is due, also on frames without input changes."""
+        for action, repeat_time in self.next_repeats.items():
+            if now < repeat_time:
+                continue
+            interval = 1.0 / self.repeat_rates[action]
+            next_repeat_time = repeat_time + interval
+            if next_repeat_time <= now:
+                # Repeats missed while the loop was busy are not made up for
+                next_repeat_time = now + interval
+            self.next_repeats[action] = next_repeat_time
+            self.repeated_count += 1
+            self.dispatch(action, self.active[action])
+
+    def refresh(self, actions):
+        """Dispatch those of the actions which are held again with their current parameters."""
+        for action in actions:
+            params = self.active.get(action)
+            if params is not None:
+                self.dispatch(action, params)
+
+    def forget(self, actions):
+        """Treat the actions as released, so that they are pressed again on the next frame."""
+        for action in actions:
+            self.active.pop(action, None)
+            self.next_repeats.pop(action, None)
+
+    def get_next_repeat_time(self):
+        """Time when the next held action repeats, None if no action repeats."""
+        if not self.next_repeats:
+            return None
+        return min(self.next_repeats.values())
+
+    def dispatch(self, action, params):
+        handler = self.handlers.get(action)
+        handler(action, **params)
+
+    def get_stats(self):
+        return {
+            'pressed': self.pressed_count,
+            'changed': self.changed_count,
+            'repeated': self.repeated_count,
+            'released': self.released_count,
+        }
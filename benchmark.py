@@ -0,0 +1,271 @@
+#!/usr/bin/env python2
+
+"""Benchmark of the control pipeline.
+
+Drives Foo with synthetic or recorded input against simulated cameras and
+prints the results as JSON, for example:
+
+    python benchmark.py --frames 20000 --joysticks 2 --extra-bindings 100
+    python benchmark.py --recording session.rec --output results.json
+
+The pipeline is run three times: without instrumentation to measure frames
+per second, with every stage timed, and with the garbage collector off to
+count the objects the frames leave behind.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import timeit
+
+import pygame
+
+from metrics import LatencyStats
+import recorder
+import viscapi
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stage names and the Foo methods they time
+STAGES = [
+    ('input', 'proc_event'),
+    ('snapshot', 'take_snapshot'),
+    ('ptz-from-axes', 'get_ptz_from_axes'),
+    ('actions', 'get_actions'),
+    ('actions.joystick-layout', 'get_joystick_layout'),
+    ('actions.keyboard-layout', 'get_keyboard_layout'),
+    ('actions.active-hats', 'get_active_hats'),
+    ('actions.pressed-buttons', 'get_pressed_buttons'),
+    ('actions.hats', 'find_actions_for_hats'),
+    ('actions.buttons', 'find_actions_for_buttons'),
+    ('actions.keys', 'find_actions_for_keys'),
+    ('zoom-and-focus', 'handle_zoom_and_focus'),
+    ('pan-and-tilt', 'handle_pan_and_tilt'),
+    ('dispatch', 'dispatch_commands'),
+    ('frame', 'process_frame'),
+]
+
+# Share of synthetic events of each type
+AXIS_EVENTS = 0.7
+BUTTON_EVENTS = 0.1
+HAT_EVENTS = 0.1
+
+
+def timed(function, name, stats):
+    def wrapper(*args, **kwargs):
+        started = timeit.default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.record(name, timeit.default_timer() - started)
+    return wrapper
+
+
+def instrument(foo, stats):
+    for name, method in STAGES:
+        setattr(foo, method, timed(getattr(foo, method), name, stats))
+
+
+def add_extra_bindings(foo, count):
+    """Bind count more memory recalls to the buttons of every joystick."""
+    for joystick_index, joystick_config in enumerate(foo.joystick_configs):
+        num_buttons = len(foo.joystick_states[joystick_index].buttons_value)
+        buttons = joystick_config[viscapi.DEFAULT_LAYOUT].setdefault(viscapi.CONFIG_BUTTONS, {})
+        entries = buttons.get(viscapi.MEMORY_RECALL, [])
+        if not isinstance(entries, list):
+            entries = [entries if isinstance(entries, dict) else {"button": entries}]
+        for i in range(0, count):
+            entries.append({"button": i % num_buttons, "params": {"mem": i % 128}})
+        buttons[viscapi.MEMORY_RECALL] = entries
+
+
+def count_bindings(foo):
+    count = 0
+    for compiled_config in foo.joystick_bindings + [foo.keyboard_bindings]:
+        layouts = [compiled_config.default_layout] + [layout for _, layout in compiled_config.layouts]
+        for layout in layouts:
+            for bindings in (layout.buttons, layout.hats, layout.keys):
+                count += sum(len(input_bindings) for input_bindings in bindings.values())
+    return count
+
+
+def generate_events(foo, count, seed):
+    """Random axis, button, hat and key events for the joysticks of foo."""
+    rng = random.Random(seed)
+    keys = sorted(foo.keyboard_bindings.default_layout.keys.keys())
+    pressed = set()
+    events = []
+
+    for _ in range(0, count):
+        joy = rng.randrange(0, len(foo.joystick_states))
+        joystick_state = foo.joystick_states[joy]
+        # Pressing all kill buttons would end the benchmark
+        kill_buttons = foo.joystick_configs[joy][viscapi.CONFIG_PARAMETERS].get(viscapi.KILL, None) or []
+        buttons = [i for i in range(0, len(joystick_state.buttons_value)) if i not in kill_buttons]
+        num_hats = len(joystick_state.hats_value) // 2
+        choice = rng.random()
+
+        if choice < AXIS_EVENTS and len(joystick_state.axes_value):
+            axis = rng.randrange(0, len(joystick_state.axes_value))
+            event = pygame.event.Event(pygame.JOYAXISMOTION, {"joy": joy, "axis": axis, "value": rng.uniform(-1.0, 1.0)})
+        elif choice < AXIS_EVENTS + BUTTON_EVENTS and buttons:
+            button = rng.choice(buttons)
+            event_type = pygame.JOYBUTTONUP if (joy, button) in pressed else pygame.JOYBUTTONDOWN
+            pressed.symmetric_difference_update([(joy, button)])
+            event = pygame.event.Event(event_type, {"joy": joy, "button": button})
+        elif choice < AXIS_EVENTS + BUTTON_EVENTS + HAT_EVENTS and num_hats:
+            value = (rng.randint(-1, 1), rng.randint(-1, 1))
+            event = pygame.event.Event(pygame.JOYHATMOTION, {"joy": joy, "hat": rng.randrange(0, num_hats), "value": value})
+        elif keys:
+            key = rng.choice(keys)
+            event_type = pygame.KEYUP if key in pressed else pygame.KEYDOWN
+            pressed.symmetric_difference_update([key])
+            event = pygame.event.Event(event_type, {"key": key})
+        else:
+            continue
+        events.append(event)
+
+    return events
+
+
+def create_foo(args, joysticks):
+    foo = viscapi.Foo()
+    foo.load_settings()
+    foo.simulate_cameras()
+    for joystick in joysticks:
+        foo.add_joystick(joystick["name"], joystick["axes"], joystick["hats"], joystick["buttons"])
+    if args.extra_bindings:
+        add_extra_bindings(foo, args.extra_bindings)
+    foo.load_keyboard_config()
+    foo.initialize_pipeline()
+    foo.initialize_cameras()
+    return foo
+
+
+def run_frames(foo, events):
+    for event in events:
+        foo.proc_event(event)
+        foo.process_frame()
+
+
+def stop(foo):
+    for command_queue in foo.command_queues:
+        command_queue.stop()
+
+
+def get_peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def benchmark(args, joysticks, events):
+    results = {}
+
+    # Throughput without instrumentation
+    foo = create_foo(args, joysticks)
+    results['bindings'] = count_bindings(foo)
+    if events is None:
+        events = generate_events(foo, args.frames, args.seed)
+    run_frames(foo, events[:args.warmup])
+    started = timeit.default_timer()
+    run_frames(foo, events)
+    elapsed = timeit.default_timer() - started
+    results['frames'] = len(events)
+    results['seconds'] = elapsed
+    results['frames-per-second'] = len(events) / elapsed if elapsed else None
+    results['commands'] = dict((command_queue.name, command_queue.get_stats()) for command_queue in foo.command_queues)
+    stop(foo)
+
+    # Cost of every stage
+    foo = create_foo(args, joysticks)
+    stats = LatencyStats()
+    instrument(foo, stats)
+    run_frames(foo, events)
+    results['stages'] = dict(
+        (name, dict(summary, total=stats.histograms[name].total))
+        for name, summary in stats.get_summaries().items()
+    )
+    stop(foo)
+
+    # Objects left behind by the frames. Only containers tracked by the garbage
+    # collector are counted, in all threads including the command queue workers.
+    foo = create_foo(args, joysticks)
+    run_frames(foo, events[:args.warmup])
+    gc.collect()
+    gc.disable()
+    try:
+        objects_before = len(gc.get_objects())
+        # Without collections the count is the tracked objects allocated and not yet freed
+        count_before = gc.get_count()[0]
+        run_frames(foo, events)
+        count_after = gc.get_count()[0]
+        gc.collect()
+        objects_after = len(gc.get_objects())
+    finally:
+        gc.enable()
+    frames = len(events)
+    # Not freed by reference counting: retained, or garbage in reference cycles
+    results['unfreed-gc-objects-per-frame'] = (count_after - count_before) / frames if frames else None
+    # Still alive after a full collection
+    results['retained-gc-objects-per-frame'] = (objects_after - objects_before) / frames if frames else None
+    stop(foo)
+
+    results['peak-rss-bytes'] = get_peak_rss()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the viscapi control pipeline')
+    parser.add_argument('--frames', type=int, default=10000, help='number of synthetic input events')
+    parser.add_argument('--warmup', type=int, default=1000, help='events run before measuring')
+    parser.add_argument('--joysticks', type=int, default=1, help='number of synthetic joysticks')
+    parser.add_argument('--joystick', default='Microsoft X-Box 360 pad', help='config of the synthetic joysticks')
+    parser.add_argument('--axes', type=int, default=6)
+    parser.add_argument('--hats', type=int, default=1)
+    parser.add_argument('--buttons', type=int, default=11)
+    parser.add_argument('--extra-bindings', type=int, default=0, help='bindings added to every joystick config')
+    parser.add_argument('--recording', help='replay the events of a recording instead of synthetic input')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to a file instead of stdout')
+    args = parser.parse_args()
+
+    if args.recording:
+        header, recorded_events = recorder.read_recording(args.recording)
+        joysticks = header["joysticks"]
+        events = [event for _, event in recorded_events]
+    else:
+        joysticks = [
+            {"name": args.joystick, "axes": args.axes, "hats": args.hats, "buttons": args.buttons}
+        ] * args.joysticks
+        events = None
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'joysticks': joysticks,
+        'recording': args.recording,
+        'extra-bindings': args.extra_bindings,
+    }
+    results.update(benchmark(args, joysticks, events))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'wt') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
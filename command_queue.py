@@ -0,0 +1,313 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+from collections import deque
+import threading
+import time
+
+# Priority classes, lower is sent first
+PRIORITY_STOP = 0
+PRIORITY_MOTION = 1
+PRIORITY_LENS = 2
+PRIORITY_IMAGE = 3
+PRIORITY_IDLE = 4
+NUM_PRIORITIES = 5
+
+# Bytes on the link of a command and its ACK and completion when not known
+DEFAULT_COMMAND_BYTES = 12
+# Bytes kept free for a motion command when sending image adjustments
+MOTION_RESERVE_BYTES = 15
+# Burst allowed by the byte budget in seconds of link capacity
+BUDGET_BURST = 0.1
+
+
+def default_priority(name, args, kwargs):
+    return PRIORITY_MOTION
+
+
+class Command(object):
+    __slots__ = (
+        'key', 'function', 'args', 'kwargs', 'cancelled', 'origin_time', 'queued_time', 'priority', 'size', 'signature',
+    )
+
+    def __init__(self, key, function, args, kwargs, origin_time):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        # Time of the input event which caused the command
+        self.origin_time = origin_time
+        self.queued_time = time.time()
+        self.priority = PRIORITY_MOTION
+        self.size = DEFAULT_COMMAND_BYTES
+        # Function name and arguments, equal for identical commands
+        self.signature = None
+
+
+class CommandQueue(object):
+    """Queue of VISCA commands sent by a dedicated worker thread.
+
+    The control loop puts commands to the queue and never waits for the
+    serial line. Discrete commands (memory set/recall, white balance steps)
+    are sent in the order they were put, and the oldest of them is dropped
+    if the queue is full. Continuous commands (pan/tilt, zoom and focus
+    drive) are put with a key, and a newer command with the same key
+    replaces the one still waiting in the queue, so that only the latest
+    value is sent. A continuous command identical to the one waiting with
+    the same key, or to the latest one taken for sending, is suppressed, as
+    the camera is already doing it. A command which fails is forgotten so
+    that it is sent again, and invalidate() forgets all of them after the
+    link was reconnected.
+
+    Every command belongs to a priority class given by priority(name, args,
+    kwargs), and waiting commands of a higher class are always sent first.
+    With bytes_per_second the link has a byte budget: stop and motion
+    commands are always sent, lens commands only when the budget allows it
+    and image adjustments and idle commands like inquiries only when room
+    for one more motion command is left. Idle commands are sent only when
+    nothing else is waiting. Image adjustments don't wait for the
+    completion, so that they hold the link as short as possible. Commands listed in min_intervals
+    are dropped if the same command was put less than the given number of
+    seconds before.
+
+    Without wait_for_completion no command waits for the completion, only
+    for the ACK, for transports which keep several commands executing and
+    match the completions to them.
+    """
+
+    def __init__(self, name='visca-command-thread', max_depth=32, latency=None, bytes_per_second=None,
+                 priority=default_priority, command_bytes=None, min_intervals=None, wait_for_completion=True):
+        object.__init__(self)
+
+        self.name = name
+        self.max_depth = max_depth
+        # LatencyStats where the latencies of the commands are recorded
+        self.latency = latency
+        # Time of the input event causing the commands put next, set by the control loop
+        self.origin_time = None
+
+        self.bytes_per_second = bytes_per_second
+        self.priority = priority
+        # Bytes of a command and its replies by function name
+        self.command_bytes = command_bytes or {}
+        # Minimum seconds between two identical commands by function name
+        self.min_intervals = min_intervals or {}
+        self.wait_for_completion = wait_for_completion
+        self.last_put_times = {}
+        self.budget_capacity = None
+        if bytes_per_second:
+            self.budget_capacity = max(bytes_per_second * BUDGET_BURST, 2 * MOTION_RESERVE_BYTES)
+        self.budget = self.budget_capacity
+        self.budget_time = time.time()
+
+        # A queue for each priority class
+        self.queues = [deque() for _ in range(0, NUM_PRIORITIES)]
+        # Continuous commands waiting in the queue by key
+        self.pending = {}
+        # Signature of the latest continuous command taken for sending by key
+        self.last_sent = {}
+        self.lock = threading.Condition()
+        self.keep_running = False
+        self.thread = None
+
+        # Time when the command being sent was started, None when idle, read by the link watchdog
+        self.busy_since = None
+        # Failed commands since the last successful one
+        self.consecutive_errors = 0
+
+        self.depth = 0
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self.rate_limited_count = 0
+        self.suppressed_count = 0
+        self.error_count = 0
+        # Written by the worker only, read by the metrics endpoint
+        self.sent_counts = {}
+        self.error_counts = {}
+        # Seconds spent in the transport, blocked in the calls for pysca
+        self.busy_time = 0.0
+
+    def start(self):
+        self.keep_running = True
+        self.thread = threading.Thread(target=self._worker, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        with self.lock:
+            self.keep_running = False
+            self.lock.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def put(self, function, *args, **kwargs):
+        """Put a discrete command which is always sent."""
+        self._put(Command(None, function, args, kwargs, self.origin_time))
+
+    def put_latest(self, key, function, *args, **kwargs):
+        """Put a continuous command replacing a queued command with the same key."""
+        self._put(Command(key, function, args, kwargs, self.origin_time))
+
+    def _put(self, command):
+        name = command.function.__name__
+        command.priority = self.priority(name, command.args, command.kwargs)
+        command.size = self.command_bytes.get(name, DEFAULT_COMMAND_BYTES)
+        command.signature = (name, command.args, tuple(sorted(command.kwargs.items())))
+
+        with self.lock:
+            min_interval = self.min_intervals.get(name)
+            if min_interval is not None:
+                # Repeating commands like white balance steps while a button is held
+                last_put_time = self.last_put_times.get(command.signature)
+                if last_put_time is not None and command.queued_time - last_put_time < min_interval:
+                    self.rate_limited_count += 1
+                    return
+                self.last_put_times[command.signature] = command.queued_time
+
+            if command.key is not None:
+                previous = self.pending.get(command.key)
+                if previous is not None:
+                    if previous.signature == command.signature:
+                        self.suppressed_count += 1
+                        return
+                    # The previous command is skipped by the worker, the new one is appended
+                    # so that it is still sent after any discrete command put before it
+                    previous.cancelled = True
+                    del self.pending[command.key]
+                    self.depth -= 1
+                    self.coalesced_count += 1
+                if self.last_sent.get(command.key) == command.signature:
+                    self.suppressed_count += 1
+                    return
+                self.pending[command.key] = command
+
+            if self.depth >= self.max_depth:
+                self._drop_oldest()
+
+            self.queues[command.priority].append(command)
+            self.depth += 1
+            self.lock.notify()
+
+    def _drop_oldest(self):
+        # Continuous commands are never dropped, there is at most one of each in the queue.
+        # Commands of the lowest priority are dropped first.
+        for queue in reversed(self.queues):
+            for command in queue:
+                if not command.cancelled and command.key is None:
+                    command.cancelled = True
+                    self.depth -= 1
+                    self.dropped_count += 1
+                    return
+
+    def _refill_budget(self):
+        now = time.time()
+        self.budget = min(self.budget + (now - self.budget_time) * self.bytes_per_second, self.budget_capacity)
+        self.budget_time = now
+
+    def _next_command(self):
+        """Return the command to send next, or the seconds to wait for the budget."""
+        if self.bytes_per_second:
+            self._refill_budget()
+
+        for priority, queue in enumerate(self.queues):
+            while queue and queue[0].cancelled:
+                queue.popleft()
+            if not queue:
+                continue
+
+            command = queue[0]
+            if self.bytes_per_second and priority >= PRIORITY_LENS:
+                needed = command.size + (MOTION_RESERVE_BYTES if priority >= PRIORITY_IMAGE else 0)
+                if self.budget < needed:
+                    # Lower classes need even more, wait for the budget or a more important command
+                    return None, (needed - self.budget) / self.bytes_per_second
+
+            queue.popleft()
+            if self.bytes_per_second:
+                # Motion may overdraw the budget, delaying the other classes
+                self.budget -= command.size
+            return command, None
+
+        return None, None
+
+    def _get(self):
+        with self.lock:
+            while self.keep_running:
+                command, wait_time = self._next_command()
+                if command is not None:
+                    if command.key is not None:
+                        del self.pending[command.key]
+                        self.last_sent[command.key] = command.signature
+                    self.depth -= 1
+                    return command
+                self.lock.wait(wait_time)
+        return None
+
+    def _worker(self):
+        while self.keep_running:
+            command = self._get()
+            if command is None:
+                break
+
+            sent_time = time.time()
+            self.busy_since = sent_time
+            name = command.function.__name__
+            try:
+                blocking = self.wait_for_completion and command.priority < PRIORITY_IMAGE
+                command.function(*command.args, blocking=blocking, **command.kwargs)
+                self.sent_count += 1
+                self.sent_counts[name] = self.sent_counts.get(name, 0) + 1
+                self.consecutive_errors = 0
+            except Exception as e:
+                self.error_count += 1
+                # By exception class, timeouts are ViscaTimeout
+                error_name = type(e).__name__
+                self.error_counts[error_name] = self.error_counts.get(error_name, 0) + 1
+                self.consecutive_errors += 1
+                if command.key is not None:
+                    self.forget(command)
+                print('Command {} failed: {}'.format(name, e))
+                continue
+            finally:
+                self.busy_since = None
+                self.busy_time += time.time() - sent_time
+
+            if self.latency is not None:
+                self.record_latency(command, sent_time, time.time())
+
+    def forget(self, command):
+        # The camera may not be doing what the failed command asked for
+        with self.lock:
+            if self.last_sent.get(command.key) == command.signature:
+                del self.last_sent[command.key]
+
+    def invalidate(self):
+        """Send the next continuous commands even if identical to the ones sent before."""
+        with self.lock:
+            self.last_sent.clear()
+
+    def record_latency(self, command, sent_time, completed_time):
+        name = command.function.__name__
+        if command.origin_time is not None:
+            self.latency.record(name + '.input-to-send', sent_time - command.origin_time)
+        self.latency.record(name + '.queue', sent_time - command.queued_time)
+        self.latency.record(name + '.completion', completed_time - sent_time)
+
+        # pysca functions don't report when the ACK was received
+        ack_time = getattr(getattr(command.function, '__self__', None), 'ack_time', None)
+        if ack_time is not None and ack_time >= sent_time:
+            self.latency.record(name + '.ack', ack_time - sent_time)
+
+    def get_stats(self):
+        return {
+            'depth': self.depth,
+            'sent': self.sent_count,
+            'coalesced': self.coalesced_count,
+            'dropped': self.dropped_count,
+            'rate-limited': self.rate_limited_count,
+            'suppressed': self.suppressed_count,
+            'errors': self.error_count,
+        }
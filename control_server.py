@@ -0,0 +1,327 @@
+#!/usr/bin/env python2
+
+"""Network control of viscapi for remote operator consoles.
+
+Clients send JSON messages, one per UDP datagram or one per line over TCP:
+
+    {"ptz": [pan, tilt, zoom]}
+    {"press": "memory-recall", "params": {"mem": 2}}
+    {"release": "memory-recall"}
+    {"action": "camera-select", "params": {"camera": 1}}
+
+"ptz" sets the continuous pan, tilt and zoom speeds of the client, the
+latest message wins. "press" holds an action down until "release", and
+"action" presses and releases it within one frame. Every TCP message is
+answered with {"ok": true} or {"error": "..."}, UDP messages are answered
+only on errors.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import json
+import math
+import threading
+import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    # Python 3
+    import socketserver
+
+# Longest TCP message line
+MAX_LINE_LENGTH = 4096
+
+
+class ClientInputs(object):
+    __slots__ = ('ptz', 'held', 'pulses', 'last_seen', 'expires', 'tokens', 'tokens_time')
+
+    def __init__(self, expires, rate):
+        self.ptz = (0, 0, 0)
+        # Params by action held down
+        self.held = {}
+        # (action, params) pressed and released within the next frame
+        self.pulses = []
+        self.last_seen = time.time()
+        # Inputs of clients without a connection are dropped when they stop sending
+        self.expires = expires
+        self.tokens = rate
+        self.tokens_time = self.last_seen
+
+
+class RemoteInputs(object):
+    """Inputs of all network clients, merged for the control loop.
+
+    The pan, tilt and zoom of the first client with a non-zero value win,
+    like with several joysticks. on_change() is called after every change,
+    so that the control loop reads the inputs with its next frame.
+    """
+
+    def __init__(self, on_change, rate=20.0, timeout=1.0):
+        object.__init__(self)
+
+        self.on_change = on_change
+        # Discrete messages per second a client may send, continuous ones are never limited
+        self.rate = rate
+        # Seconds after which the inputs of a silent UDP client are released
+        self.timeout = timeout
+        self.clients = {}
+        self.lock = threading.Lock()
+
+        self.message_count = 0
+        self.rate_limited_count = 0
+        self.expired_count = 0
+
+    def get_client(self, client, expires):
+        inputs = self.clients.get(client)
+        if inputs is None:
+            inputs = ClientInputs(expires, self.rate)
+            self.clients[client] = inputs
+        inputs.last_seen = time.time()
+        return inputs
+
+    def take_token(self, inputs):
+        now = time.time()
+        inputs.tokens = min(inputs.tokens + (now - inputs.tokens_time) * self.rate, self.rate)
+        inputs.tokens_time = now
+        if inputs.tokens < 1.0:
+            self.rate_limited_count += 1
+            return False
+        inputs.tokens -= 1.0
+        return True
+
+    def set_ptz(self, client, ptz, expires=False):
+        with self.lock:
+            self.message_count += 1
+            self.get_client(client, expires).ptz = ptz
+        self.on_change()
+
+    def press(self, client, action, params, expires=False):
+        with self.lock:
+            self.message_count += 1
+            inputs = self.get_client(client, expires)
+            if not self.take_token(inputs):
+                return False
+            inputs.held[action] = params
+        self.on_change()
+        return True
+
+    def release(self, client, action, expires=False):
+        # Never rate limited, a lost release would leave the action held
+        with self.lock:
+            self.message_count += 1
+            self.get_client(client, expires).held.pop(action, None)
+        self.on_change()
+
+    def pulse(self, client, action, params, expires=False):
+        with self.lock:
+            self.message_count += 1
+            inputs = self.get_client(client, expires)
+            if not self.take_token(inputs):
+                return False
+            inputs.pulses.append((action, params))
+        self.on_change()
+        return True
+
+    def keep_alive(self, client, expires=False):
+        with self.lock:
+            self.get_client(client, expires)
+
+    def remove_client(self, client):
+        with self.lock:
+            removed = self.clients.pop(client, None)
+        if removed is not None:
+            self.on_change()
+
+    def expire(self, now):
+        with self.lock:
+            expired = [
+                client for client, inputs in self.clients.items()
+                if inputs.expires and now - inputs.last_seen > self.timeout
+            ]
+            for client in expired:
+                del self.clients[client]
+            self.expired_count += len(expired)
+        if expired:
+            self.on_change()
+
+    def snapshot(self):
+        """Return the merged (pan, tilt, zoom), actions and whether pulses were consumed.
+
+        A consumed pulse must be released by another snapshot, even if no
+        client sends anything meanwhile.
+        """
+        pan = 0
+        tilt = 0
+        zoom = 0
+        actions = {}
+        pulsed = False
+        with self.lock:
+            for inputs in self.clients.values():
+                if pan == 0:
+                    pan = inputs.ptz[0]
+                if tilt == 0:
+                    tilt = inputs.ptz[1]
+                if zoom == 0:
+                    zoom = inputs.ptz[2]
+                actions.update(inputs.held)
+                for action, params in inputs.pulses:
+                    actions[action] = params
+                    pulsed = True
+                del inputs.pulses[:]
+        return (pan, tilt, zoom), actions, pulsed
+
+    def get_stats(self):
+        return {
+            'clients': len(self.clients),
+            'messages': self.message_count,
+            'rate-limited': self.rate_limited_count,
+            'expired': self.expired_count,
+        }
+
+
+class MessageError(Exception):
+    pass
+
+
+class ControlServer(object):
+    """UDP and TCP servers feeding client messages to RemoteInputs.
+
+    action_params lists the parameters every accepted action may have, all
+    of them integers. ptz_limits are the largest pan, tilt and zoom speeds.
+    Each TCP connection is served by a thread of its own, and its inputs are
+    released when it is closed.
+    """
+
+    def __init__(self, remote_inputs, action_params, ptz_limits, host='127.0.0.1', port=5678):
+        object.__init__(self)
+
+        self.remote_inputs = remote_inputs
+        self.action_params = action_params
+        self.ptz_limits = ptz_limits
+        self.host = host
+        self.port = port
+
+        self.tcp_server = None
+        self.udp_server = None
+        self.threads = []
+        self.keep_running = False
+
+    def start(self):
+        control_server = self
+
+        class TcpHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                client = ('tcp',) + tuple(self.client_address)
+                try:
+                    while True:
+                        line = self.rfile.readline(MAX_LINE_LENGTH)
+                        if not line:
+                            break
+                        if not line.strip():
+                            continue
+                        error = control_server.handle_message(client, line, expires=False)
+                        reply = {"ok": True} if error is None else {"error": error}
+                        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+                except (IOError, OSError):
+                    pass
+                finally:
+                    control_server.remote_inputs.remove_client(client)
+
+        class UdpHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                client = ('udp',) + tuple(self.client_address)
+                error = control_server.handle_message(client, data, expires=True)
+                if error is not None:
+                    sock.sendto((json.dumps({"error": error}) + '\n').encode('utf-8'), self.client_address)
+
+        socketserver.TCPServer.allow_reuse_address = True
+        self.tcp_server = socketserver.ThreadingTCPServer((self.host, self.port), TcpHandler)
+        self.tcp_server.daemon_threads = True
+        # Same port number for UDP, or the one picked for TCP when port is 0
+        self.udp_server = socketserver.UDPServer((self.host, self.tcp_server.server_address[1]), UdpHandler)
+        self.port = self.tcp_server.server_address[1]
+
+        self.keep_running = True
+        for name, target in (
+                ('control-tcp-thread', self.tcp_server.serve_forever),
+                ('control-udp-thread', self.udp_server.serve_forever),
+                ('control-expiry-thread', self._expire)):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        print('Control server on {}:{}'.format(self.host, self.port))
+
+    def stop(self):
+        self.keep_running = False
+        for server in (self.tcp_server, self.udp_server):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    def _expire(self):
+        while self.keep_running:
+            time.sleep(self.remote_inputs.timeout / 4)
+            self.remote_inputs.expire(time.time())
+
+    def handle_message(self, client, data, expires):
+        """Apply one message of a client, return an error message or None."""
+        try:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            message = json.loads(data)
+            if not isinstance(message, dict):
+                raise MessageError('message must be an object')
+            return self.apply_message(client, message, expires)
+        except (ValueError, MessageError) as e:
+            return '{}'.format(e)
+
+    def apply_message(self, client, message, expires):
+        inputs = self.remote_inputs
+        if "ptz" in message:
+            inputs.set_ptz(client, self.parse_ptz(message["ptz"]), expires)
+        elif "press" in message:
+            if not inputs.press(client, self.parse_action(message["press"]), self.parse_params(message), expires):
+                return 'rate limited'
+        elif "release" in message:
+            inputs.release(client, self.parse_action(message["release"]), expires)
+        elif "action" in message:
+            if not inputs.pulse(client, self.parse_action(message["action"]), self.parse_params(message), expires):
+                return 'rate limited'
+        elif "ping" in message:
+            inputs.keep_alive(client, expires)
+        else:
+            raise MessageError('unknown message')
+        return None
+
+    def parse_ptz(self, ptz):
+        if not isinstance(ptz, list) or len(ptz) != 3:
+            raise MessageError('ptz must be [pan, tilt, zoom]')
+        values = []
+        for value, limit in zip(ptz, self.ptz_limits):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise MessageError('ptz values must be numbers')
+            # json accepts Infinity and NaN
+            if math.isinf(value) or math.isnan(value):
+                raise MessageError('ptz values must be finite')
+            values.append(max(-limit, min(int(value), limit)))
+        return tuple(values)
+
+    def parse_action(self, action):
+        if action not in self.action_params:
+            raise MessageError('unknown action {}'.format(action))
+        return action
+
+    def parse_params(self, message):
+        action = message.get("press", message.get("action"))
+        params = message.get("params", {})
+        if not isinstance(params, dict):
+            raise MessageError('params must be an object')
+        for name, value in params.items():
+            if name not in self.action_params[action]:
+                raise MessageError('unknown parameter {} of {}'.format(name, action))
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise MessageError('parameter {} must be an integer'.format(name))
+        return dict((str(name), value) for name, value in params.items())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python2
+
+"""Joystick and keyboard input read directly from the Linux input devices.
+
+Replaces the pygame event loop, which needs a display and thus an X
+server, on headless installations. Joysticks are read from the joystick
+interface (/dev/input/js*) and keyboards from the event interface
+(/dev/input/event*). The events are converted to the same pygame events
+with the same axis, hat and button numbers as pygame uses, so the joystick
+configs work unchanged.
+
+A device can also be a pipe or a regular file containing js_event structs,
+then the name and the number of axes and buttons of the joystick have to be
+given as they cannot be read from the device. The number of axes includes
+the hats, which are the last two axes of each hat:
+
+    "joystick-devices": [{"path": "/tmp/js.fifo", "name": "Microsoft X-Box 360 pad", "axes": 8, "hats": 1, "buttons": 11}]
+
+A FIFO is opened for reading and writing, so that it does not reach the
+end of file while no program has it open for writing. Writers can then
+come and go, and viscapi can be started before them.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import array
+import errno
+import fcntl
+import glob
+import os
+import select
+import stat
+import struct
+import threading
+
+import pygame
+
+JOYSTICK_DEVICES = '/dev/input/js*'
+KEYBOARD_DEVICES = '/dev/input/event*'
+
+# struct js_event from linux/joystick.h
+JS_EVENT = struct.Struct(str('IhBB'))
+JS_EVENT_BUTTON = 0x01
+JS_EVENT_AXIS = 0x02
+JS_EVENT_INIT = 0x80
+
+# struct input_event from linux/input.h
+INPUT_EVENT = struct.Struct(str('llHHi'))
+EV_KEY = 0x01
+KEY_RELEASE = 0
+KEY_PRESS = 1
+
+# Absolute axis codes of hats, pygame reports them as hats instead of axes
+ABS_HAT0X = 0x10
+ABS_HAT3Y = 0x17
+ABS_CNT = 0x40
+KEY_CNT = 0x300
+AXIS_MAX = 32768.0
+
+IOC_READ = 2
+
+
+def ioc_read(type, nr, size):
+    return (IOC_READ << 30) | (size << 16) | (ord(type) << 8) | nr
+
+
+JSIOCGAXES = ioc_read('j', 0x11, 1)
+JSIOCGBUTTONS = ioc_read('j', 0x12, 1)
+JSIOCGAXMAP = ioc_read('j', 0x32, ABS_CNT)
+NAME_LENGTH = 128
+JSIOCGNAME = ioc_read('j', 0x13, NAME_LENGTH)
+EVIOCGBIT_KEY = ioc_read('E', 0x20 + EV_KEY, KEY_CNT // 8)
+
+# Linux key codes and the names of the pygame keys
+KEY_NAMES = {
+    1: 'K_ESCAPE', 14: 'K_BACKSPACE', 15: 'K_TAB', 28: 'K_RETURN', 57: 'K_SPACE',
+    2: 'K_1', 3: 'K_2', 4: 'K_3', 5: 'K_4', 6: 'K_5', 7: 'K_6', 8: 'K_7', 9: 'K_8', 10: 'K_9', 11: 'K_0',
+    16: 'K_q', 17: 'K_w', 18: 'K_e', 19: 'K_r', 20: 'K_t', 21: 'K_y', 22: 'K_u', 23: 'K_i', 24: 'K_o', 25: 'K_p',
+    30: 'K_a', 31: 'K_s', 32: 'K_d', 33: 'K_f', 34: 'K_g', 35: 'K_h', 36: 'K_j', 37: 'K_k', 38: 'K_l',
+    44: 'K_z', 45: 'K_x', 46: 'K_c', 47: 'K_v', 48: 'K_b', 49: 'K_n', 50: 'K_m',
+    59: 'K_F1', 60: 'K_F2', 61: 'K_F3', 62: 'K_F4', 63: 'K_F5', 64: 'K_F6', 65: 'K_F7', 66: 'K_F8',
+    67: 'K_F9', 68: 'K_F10', 87: 'K_F11', 88: 'K_F12',
+    103: 'K_UP', 105: 'K_LEFT', 106: 'K_RIGHT', 108: 'K_DOWN',
+    82: 'K_KP0', 79: 'K_KP1', 80: 'K_KP2', 81: 'K_KP3', 75: 'K_KP4', 76: 'K_KP5', 77: 'K_KP6',
+    71: 'K_KP7', 72: 'K_KP8', 73: 'K_KP9', 83: 'K_KP_PERIOD', 98: 'K_KP_DIVIDE', 55: 'K_KP_MULTIPLY',
+    74: 'K_KP_MINUS', 78: 'K_KP_PLUS', 96: 'K_KP_ENTER',
+}
+# Keys of which a device needs at least one to be used as a keyboard
+KEYBOARD_KEYS = (30, 82)
+
+
+def open_device(path):
+    flags = os.O_RDONLY
+    if stat.S_ISFIFO(os.stat(path).st_mode):
+        # Keeps a writer open, without one a read returns the end of file at once
+        flags = os.O_RDWR
+    return os.open(path, flags | os.O_NONBLOCK)
+
+
+def sign(value):
+    return 1 if value > 0 else -1 if value < 0 else 0
+
+
+class JoystickDevice(object):
+    """A joystick read through the joystick interface.
+
+    The joystick interface numbers hats as axes, they are separated and the
+    remaining axes renumbered the same way pygame does.
+    """
+
+    def __init__(self, path, joy, name=None, num_axes=None, num_buttons=None, num_hats=0):
+        object.__init__(self)
+
+        self.path = path
+        self.joy = joy
+        self.fd = open_device(path)
+        self.buffer = b''
+
+        self.name = name if name is not None else self.read_name()
+        if num_axes is None:
+            num_axes = self.read_count(JSIOCGAXES)
+        if num_buttons is None:
+            num_buttons = self.read_count(JSIOCGBUTTONS)
+        self.num_buttons = num_buttons
+
+        axis_codes = self.read_axis_map(num_axes, num_hats)
+        # (False, axis) or (True, hat * 2 + 0 for x or 1 for y) by js axis number
+        self.axis_map = []
+        num_pygame_axes = 0
+        for code in axis_codes:
+            if ABS_HAT0X <= code <= ABS_HAT3Y:
+                self.axis_map.append((True, code - ABS_HAT0X))
+            else:
+                self.axis_map.append((False, num_pygame_axes))
+                num_pygame_axes += 1
+        self.num_axes = num_pygame_axes
+        self.num_hats = max([hat // 2 + 1 for is_hat, hat in self.axis_map if is_hat] or [0])
+        self.hats_value = [0] * (2 * self.num_hats)
+
+    def ioctl(self, request, buffer):
+        try:
+            fcntl.ioctl(self.fd, request, buffer, True)
+            return True
+        except (IOError, OSError):
+            # Not a joystick device, a pipe for example
+            return False
+
+    def read_name(self):
+        buffer = array.array(str('B'), [0] * NAME_LENGTH)
+        if not self.ioctl(JSIOCGNAME, buffer):
+            raise ValueError('Name of joystick {} must be given'.format(self.path))
+        return bytes(bytearray(buffer)).split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+    def read_count(self, request):
+        buffer = array.array(str('B'), [0])
+        if not self.ioctl(request, buffer):
+            raise ValueError('Number of axes and buttons of joystick {} must be given'.format(self.path))
+        return buffer[0]
+
+    def read_axis_map(self, num_axes, num_hats):
+        buffer = array.array(str('B'), [0] * ABS_CNT)
+        if not self.ioctl(JSIOCGAXMAP, buffer):
+            # Without the map the hats are assumed to be the last axes
+            return [0] * (num_axes - 2 * num_hats) + [ABS_HAT0X + i for i in range(0, 2 * num_hats)]
+        return list(buffer[:num_axes])
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, JS_EVENT.size * 64)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        if not data:
+            raise EOFError(self.path)
+
+        self.buffer += data
+        events = []
+        while len(self.buffer) >= JS_EVENT.size:
+            _, value, event_type, number = JS_EVENT.unpack(self.buffer[:JS_EVENT.size])
+            self.buffer = self.buffer[JS_EVENT.size:]
+            event = self.convert(value, event_type & ~JS_EVENT_INIT, number)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def convert(self, value, event_type, number):
+        if event_type == JS_EVENT_BUTTON and number < self.num_buttons:
+            return pygame.event.Event(pygame.JOYBUTTONDOWN if value else pygame.JOYBUTTONUP,
+                                      {"joy": self.joy, "button": number})
+
+        if event_type == JS_EVENT_AXIS and number < len(self.axis_map):
+            is_hat, index = self.axis_map[number]
+            if not is_hat:
+                return pygame.event.Event(pygame.JOYAXISMOTION,
+                                          {"joy": self.joy, "axis": index, "value": value / AXIS_MAX})
+            # Negative y of a hat is up, in pygame up is 1
+            self.hats_value[index] = sign(value) if index % 2 == 0 else -sign(value)
+            hat = index // 2
+            return pygame.event.Event(pygame.JOYHATMOTION, {
+                "joy": self.joy,
+                "hat": hat,
+                "value": (self.hats_value[2 * hat], self.hats_value[2 * hat + 1]),
+            })
+
+        return None
+
+    def close(self):
+        os.close(self.fd)
+
+
+class KeyboardDevice(object):
+    def __init__(self, path):
+        object.__init__(self)
+
+        self.path = path
+        self.fd = open_device(path)
+        self.buffer = b''
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, INPUT_EVENT.size * 64)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        if not data:
+            raise EOFError(self.path)
+
+        self.buffer += data
+        events = []
+        while len(self.buffer) >= INPUT_EVENT.size:
+            _, _, event_type, code, value = INPUT_EVENT.unpack(self.buffer[:INPUT_EVENT.size])
+            self.buffer = self.buffer[INPUT_EVENT.size:]
+            # Autorepeat with value 2 is ignored
+            if event_type != EV_KEY or value not in (KEY_PRESS, KEY_RELEASE):
+                continue
+            key = getattr(pygame, KEY_NAMES.get(code, ''), None)
+            if key is not None:
+                events.append(pygame.event.Event(pygame.KEYDOWN if value == KEY_PRESS else pygame.KEYUP, {"key": key}))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_keyboard(path):
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    try:
+        buffer = array.array(str('B'), [0] * (KEY_CNT // 8))
+        fcntl.ioctl(fd, EVIOCGBIT_KEY, buffer, True)
+        return any(buffer[key // 8] & (1 << (key % 8)) for key in KEYBOARD_KEYS)
+    except (IOError, OSError):
+        return False
+    finally:
+        os.close(fd)
+
+
+def open_joysticks(device_configs):
+    """Open the joysticks listed in device_configs.
+
+    Every entry is a glob pattern or a dict with "path" and optionally
+    "name", "axes", "hats" and "buttons".
+    """
+    joysticks = []
+    for device_config in device_configs:
+        if not isinstance(device_config, dict):
+            device_config = {"path": device_config}
+        for path in sorted(glob.glob(device_config["path"])):
+            joysticks.append(JoystickDevice(
+                path,
+                len(joysticks),
+                name=device_config.get("name", None),
+                num_axes=device_config.get("axes", None),
+                num_buttons=device_config.get("buttons", None),
+                num_hats=device_config.get("hats", 0),
+            ))
+    return joysticks
+
+
+def open_keyboards(paths):
+    """Open the keyboards matching the glob patterns in paths.
+
+    Input devices which do not have letter or keypad keys are skipped.
+    """
+    keyboards = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            # Pipes and files are used as they are
+            if stat.S_ISCHR(os.stat(path).st_mode) and not is_keyboard(path):
+                continue
+            keyboards.append(KeyboardDevice(path))
+    return keyboards
+
+
+class EvdevInput(object):
+    """Reads the devices and feeds the events to proc_event."""
+
+    def __init__(self, joysticks, keyboards, proc_event):
+        object.__init__(self)
+
+        self.devices = list(joysticks) + list(keyboards)
+        self.proc_event = proc_event
+        self.keep_running = True
+
+        # Devices replacing the current ones, taken into use by run()
+        self.new_devices = None
+        self.lock = threading.Lock()
+        # Wakes up run() from select when the devices are replaced
+        self.wakeup_read, self.wakeup_write = os.pipe()
+
+    def set_devices(self, joysticks, keyboards):
+        with self.lock:
+            # Replaced again before run() took them into use
+            for device in self.new_devices or ():
+                device.close()
+            self.new_devices = list(joysticks) + list(keyboards)
+        os.write(self.wakeup_write, b'\0')
+
+    def run(self):
+        devices_by_fd = dict((device.fd, device) for device in self.devices)
+        # Wakes up regularly to notice keep_running
+        timeout = 0.5
+
+        while self.keep_running:
+            fds = list(devices_by_fd.keys()) + [self.wakeup_read]
+            readable, _, _ = select.select(fds, [], [], timeout)
+            if not readable:
+                continue
+
+            if self.wakeup_read in readable:
+                os.read(self.wakeup_read, 64)
+                with self.lock:
+                    if self.new_devices is None:
+                        continue
+                    old_devices = self.devices
+                    self.devices = self.new_devices
+                    self.new_devices = None
+                for device in old_devices:
+                    device.close()
+                devices_by_fd = dict((device.fd, device) for device in self.devices)
+                continue
+
+            for fd in readable:
+                device = devices_by_fd[fd]
+                try:
+                    events = device.read_events()
+                except (EOFError, OSError) as e:
+                    print('Input device {} closed: {}'.format(device.path, e))
+                    del devices_by_fd[fd]
+                    continue
+                for event in events:
+                    self.proc_event(event)
+
+    def stop(self):
+        self.keep_running = False
+
+    def close(self):
+        for device in self.devices:
+            device.close()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
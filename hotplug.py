@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+
+"""Notification of device nodes being added and removed.
+
+Used to pick up joysticks and serial adapters which are plugged in or out
+while viscapi is running, without restarting the process.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import threading
+import time
+
+IN_NONBLOCK = 0o4000
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library(str('c')), use_errno=True)
+    libc.inotify_init1
+except (OSError, AttributeError):
+    # Not Linux
+    libc = None
+
+
+class DeviceMonitor(object):
+    """Calls callback(added, removed) when paths matching the patterns change.
+
+    Directories of the patterns are watched with inotify when available,
+    and otherwise listed every poll_interval seconds. The callback returns
+    the added paths it could not open, for example because udev has not yet
+    set their permissions, and they are reported again after poll_interval.
+    """
+
+    def __init__(self, patterns, callback, poll_interval=1.0, settle_time=0.1):
+        object.__init__(self)
+
+        self.patterns = list(patterns)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        # Time to wait after a change for udev to finish setting up the device
+        self.settle_time = settle_time
+
+        self.known = set()
+        self.mask = WATCH_MASK
+        self.thread_name = 'device-monitor-thread'
+        self.inotify_fd = None
+        self.thread = None
+        self.keep_running = False
+
+    def scan(self):
+        paths = set()
+        for pattern in self.patterns:
+            paths.update(glob.glob(pattern))
+        return paths
+
+    def start(self):
+        self.known = self.scan()
+        self.inotify_fd = self.open_inotify()
+        self.keep_running = True
+        self.thread = threading.Thread(target=self._monitor, name=self.thread_name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.keep_running = False
+        if self.thread is not None:
+            self.thread.join(self.poll_interval * 2)
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def retry(self, path):
+        """Report path as added on the next check if it exists."""
+        self.known.discard(path)
+
+    def open_inotify(self):
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            return None
+        for directory in set(os.path.dirname(pattern) for pattern in self.patterns):
+            if libc.inotify_add_watch(fd, directory.encode('utf-8'), self.mask) < 0:
+                print('Cannot watch {}, polling for devices'.format(directory))
+                os.close(fd)
+                return None
+        return fd
+
+    def wait(self):
+        if self.inotify_fd is None:
+            time.sleep(self.poll_interval)
+            return
+
+        readable, _, _ = select.select([self.inotify_fd], [], [], self.poll_interval)
+        if readable:
+            try:
+                # Only the fact that something changed matters
+                while os.read(self.inotify_fd, 4096):
+                    pass
+            except OSError:
+                pass
+            time.sleep(self.settle_time)
+
+    def _monitor(self):
+        while self.keep_running:
+            self.wait()
+            current = self.scan()
+            added = current - self.known
+            removed = self.known - current
+            if not added and not removed:
+                continue
+
+            self.known = current
+            try:
+                failed = self.callback(added, removed)
+            except Exception as e:
+                print('Handling device changes failed: {}'.format(e))
+                failed = added
+            for path in failed or ():
+                self.known.discard(path)
+
+
+class FileMonitor(DeviceMonitor):
+    """Calls callback(paths) when files matching the patterns are created, written or deleted.
+
+    A written file is found by its modification time, so files replaced by
+    editors with a rename are noticed as well as files written in place.
+    """
+
+    def __init__(self, patterns, callback, poll_interval=1.0, settle_time=0.1):
+        DeviceMonitor.__init__(self, patterns, self._on_changed, poll_interval, settle_time)
+
+        self.file_callback = callback
+        self.mask = WATCH_MASK | IN_CLOSE_WRITE
+        self.thread_name = 'file-monitor-thread'
+
+    def scan(self):
+        # A written file is both removed with its old and added with its new time
+        files = set()
+        for path in DeviceMonitor.scan(self):
+            try:
+                files.add((path, os.path.getmtime(path)))
+            except OSError:
+                # Deleted meanwhile
+                pass
+        return files
+
+    def _on_changed(self, added, removed):
+        self.file_callback(set(path for path, _ in added | removed))
+        # Files are not retried, a broken file is reported again when it is fixed
+        return ()
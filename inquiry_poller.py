@@ -0,0 +1,165 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import threading
+import time
+
+from visca import CameraError, ERROR_SYNTAX, ERROR_NOT_EXECUTABLE
+
+# Transport methods returning the value of each inquiry, by inquiry name
+INQUIRY_METHODS = {
+    'pan-tilt': 'get_pan_tilt_position',
+    'zoom': 'get_zoom_position',
+    'focus': 'get_focus_position',
+    'focus-mode': 'get_focus_mode',
+    'wb-mode': 'get_wb_mode',
+    'power': 'get_power',
+}
+DEFAULT_INQUIRIES = ('pan-tilt', 'zoom', 'focus', 'focus-mode', 'wb-mode', 'power')
+# Error replies meaning that the camera does not support an inquiry, the link itself works
+REJECTION_ERRORS = (ERROR_SYNTAX, ERROR_NOT_EXECUTABLE)
+# Rejections in a row after which an inquiry is no longer put to the camera
+MAX_REJECTIONS = 3
+
+
+class CameraState(object):
+    """Latest values reported by a camera, with the time they were received.
+
+    Written by the command queue workers and read by the control loop.
+    Every value is replaced as a whole, so no lock is needed.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        # (value, time received) by inquiry name
+        self.values = {}
+
+    def update(self, name, value):
+        self.values[name] = (value, time.time())
+
+    def get(self, name, max_age=None):
+        """Return the value, None if not known or older than max_age seconds."""
+        entry = self.values.get(name)
+        if entry is None:
+            return None
+        value, received = entry
+        if max_age is not None and time.time() - received > max_age:
+            return None
+        return value
+
+    def get_age(self, name):
+        entry = self.values.get(name)
+        return None if entry is None else time.time() - entry[1]
+
+    def get_values(self):
+        return dict((name, value) for name, (value, received) in list(self.values.items()))
+
+    def to_dict(self):
+        return dict((name, {"value": value, "time": received}) for name, (value, received) in self.values.items())
+
+
+class InquiryPoller(object):
+    """Keeps the CameraState of every camera up to date in the background.
+
+    Every interval seconds the inquiries of each camera are put to the
+    command queue of its link, where they have the idle priority and are
+    sent only when no other command is waiting and the byte budget leaves
+    room for a motion command. An inquiry is put again only after the
+    previous one was answered or failed, so they never pile up in the
+    queue. Cameras behind transports without inquiries, like pysca, are
+    skipped. on_change(camera, name) is called from the worker whenever an
+    answer differs from the cached value.
+
+    An inquiry rejected by the camera with a syntax or not executable error
+    does not fail the command, so it does not count towards the watchdog.
+    After MAX_REJECTIONS rejections in a row it is turned off for the camera.
+    """
+
+    def __init__(self, cameras, interval=1.0, inquiries=DEFAULT_INQUIRIES, on_change=None):
+        object.__init__(self)
+
+        self.cameras = cameras
+        self.interval = interval
+        self.inquiries = inquiries
+        self.on_change = on_change
+
+        # Time when an inquiry was put by (camera, inquiry name), until it is answered
+        self.outstanding = {}
+        # Rejections in a row by (camera, inquiry name), and the inquiries turned off
+        self.rejections = {}
+        self.disabled = set()
+        self.thread = None
+        self.keep_running = False
+
+        self.answered_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+
+    def start(self):
+        self.keep_running = True
+        self.thread = threading.Thread(target=self._poll, name='inquiry-poller-thread')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.keep_running = False
+        if self.thread is not None:
+            self.thread.join(self.interval * 2)
+
+    def _poll(self):
+        while self.keep_running:
+            time.sleep(self.interval)
+            self.poll(time.time())
+
+    def poll(self, now):
+        for camera in list(self.cameras):
+            if not hasattr(camera.transport, 'inquire'):
+                continue
+            for name in self.inquiries:
+                if (camera, name) in self.disabled:
+                    continue
+                put_time = self.outstanding.get((camera, name))
+                # An inquiry dropped from a full queue is put again after a while
+                if put_time is not None and now - put_time < self.interval * 10:
+                    continue
+                self.outstanding[(camera, name)] = now
+                camera.command_queue.put(self.inquire, camera, name)
+
+    def inquire(self, camera, name, blocking=False):
+        """Run by the command queue worker of the camera."""
+        try:
+            value = getattr(camera.transport, INQUIRY_METHODS[name])(camera.address)
+            changed = camera.state.get(name) != value
+            camera.state.update(name, value)
+            self.answered_count += 1
+            self.rejections.pop((camera, name), None)
+            if changed and self.on_change is not None:
+                self.on_change(camera, name)
+        except CameraError as e:
+            if e.code not in REJECTION_ERRORS:
+                self.failed_count += 1
+                raise
+            self.reject(camera, name, e)
+        except Exception:
+            self.failed_count += 1
+            raise
+        finally:
+            self.outstanding.pop((camera, name), None)
+
+    def reject(self, camera, name, error):
+        self.rejected_count += 1
+        rejections = self.rejections.get((camera, name), 0) + 1
+        self.rejections[(camera, name)] = rejections
+        if rejections >= MAX_REJECTIONS:
+            self.disabled.add((camera, name))
+            print('Inquiry {} turned off for {}: {}'.format(name, camera.name, error))
+
+    def get_stats(self):
+        return {
+            'answered': self.answered_count,
+            'failed': self.failed_count,
+            'rejected': self.rejected_count,
+            'disabled': len(self.disabled),
+        }
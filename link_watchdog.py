@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import threading
+import time
+
+
+class LinkWatchdog(object):
+    """Detects camera links which are stuck or have stopped answering.
+
+    A link is stuck when its command queue has been sending the same
+    command for longer than stuck_timeout, which catches transports without
+    deadlines of their own like pysca. A camera is considered missing after
+    max_errors failed commands in a row. recover(link) is then called from
+    the watchdog thread, at most once every recovery_interval seconds for
+    each link. A stuck link counts as recovered only once its worker has
+    returned from the stuck command, until then it is recovered again.
+    """
+
+    def __init__(self, command_queues, recover, interval=0.5, stuck_timeout=10.0, max_errors=3,
+                 recovery_interval=2.0):
+        object.__init__(self)
+
+        # Command queue by link name
+        self.command_queues = command_queues
+        self.recover = recover
+        self.interval = interval
+        self.stuck_timeout = stuck_timeout
+        self.max_errors = max_errors
+        self.recovery_interval = recovery_interval
+
+        # Links to recover right away, requested by the operator
+        self.requested = set()
+        self.recovery_times = {}
+        # busy_since of the stuck command by link being recovered, None if it was not stuck
+        self.recovering = {}
+        self.recovery_count = 0
+        self.recovered_count = 0
+        self.thread = None
+        self.keep_running = False
+
+    def start(self):
+        self.keep_running = True
+        self.thread = threading.Thread(target=self._watch, name='link-watchdog-thread')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.keep_running = False
+        if self.thread is not None:
+            self.thread.join(self.interval * 2)
+
+    def request_recovery(self, link):
+        self.requested.add(link)
+
+    def check(self, link, command_queue, now):
+        if link in self.requested:
+            self.requested.discard(link)
+            return 'requested'
+        if now - self.recovery_times.get(link, 0.0) < self.recovery_interval:
+            return None
+        busy_since = command_queue.busy_since
+        if busy_since is not None and now - busy_since > self.stuck_timeout:
+            return 'stuck for {:.1f} s'.format(now - busy_since)
+        if command_queue.consecutive_errors >= self.max_errors:
+            return '{} failed commands'.format(command_queue.consecutive_errors)
+        return None
+
+    def verify(self, link, command_queue):
+        """Report a link recovered once its worker is no longer in the stuck command."""
+        if link not in self.recovering:
+            return
+        stuck_since = self.recovering[link]
+        if stuck_since is not None and command_queue.busy_since == stuck_since:
+            return
+        del self.recovering[link]
+        self.recovered_count += 1
+        print('Link {} recovered'.format(link))
+
+    def _watch(self):
+        while self.keep_running:
+            time.sleep(self.interval)
+            now = time.time()
+            for link, command_queue in list(self.command_queues.items()):
+                self.verify(link, command_queue)
+                reason = self.check(link, command_queue, now)
+                if reason is None:
+                    continue
+                if link in self.recovering:
+                    reason += ', the previous reconnect did not free it'
+                print('Link {} {}, reconnecting'.format(link, reason))
+                self.recovery_times[link] = now
+                self.recovery_count += 1
+                busy_since = command_queue.busy_since
+                if busy_since is not None and now - busy_since <= self.stuck_timeout:
+                    busy_since = None
+                self.recovering[link] = busy_since
+                command_queue.consecutive_errors = 0
+                try:
+                    self.recover(link)
+                except Exception as e:
+                    print('Recovering link {} failed: {}'.format(link, e))
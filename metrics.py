@@ -0,0 +1,206 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import math
+import threading
+from array import array
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Buckets per power of two
+BUCKET_RESOLUTION = 4
+# Smallest and largest recorded latency are 2 ** MIN_EXPONENT and 2 ** MAX_EXPONENT seconds
+MIN_EXPONENT = -20
+MAX_EXPONENT = 6
+NUM_BUCKETS = (MAX_EXPONENT - MIN_EXPONENT) * BUCKET_RESOLUTION + 1
+# Quantiles of the latency summaries served to Prometheus
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class LatencyHistogram(object):
+    """Histogram of latencies with logarithmic buckets.
+
+    Recording a value is a constant time array update, so it can be done in
+    the joystick and command threads. Several threads record into the same
+    histogram, the link workers for example, so updates and summaries hold
+    the lock. Percentiles are accurate to the bucket width, about 19 % of
+    the value.
+    """
+    __slots__ = ('counts', 'count', 'total', 'max', 'lock')
+
+    def __init__(self):
+        self.counts = array(str('L'), [0] * NUM_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        if value <= 0.0:
+            bucket = 0
+        else:
+            mantissa, exponent = math.frexp(value)
+            bucket = (exponent - MIN_EXPONENT) * BUCKET_RESOLUTION + int((mantissa - 0.5) * 2 * BUCKET_RESOLUTION)
+            bucket = max(0, min(bucket, NUM_BUCKETS - 1))
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def bucket_upper_bound(self, bucket):
+        exponent = bucket // BUCKET_RESOLUTION + MIN_EXPONENT
+        mantissa = 0.5 + (bucket % BUCKET_RESOLUTION + 1) / (2 * BUCKET_RESOLUTION)
+        return math.ldexp(mantissa, exponent)
+
+    def percentile(self, percent):
+        # Called with the lock held
+        if self.count == 0:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(self.bucket_upper_bound(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max,
+            }
+
+
+class LatencyStats(object):
+    """Latency histograms by name.
+
+    Names are stages of the control pipeline, for example
+    'input-to-actions', or a command type and stage like 'pan_tilt.ack'.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.histograms = {}
+
+    def record(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        histogram.record(value)
+
+    def get_summaries(self):
+        return dict((name, histogram.summary()) for name, histogram in list(self.histograms.items()))
+
+    def format(self):
+        lines = ['{:<32} {:>8} {:>9} {:>9} {:>9} {:>9}'.format('latency (ms)', 'count', 'p50', 'p95', 'p99', 'max')]
+        for name, summary in sorted(self.get_summaries().items()):
+            lines.append('{:<32} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                name,
+                summary['count'],
+                summary['p50'] * 1000,
+                summary['p95'] * 1000,
+                summary['p99'] * 1000,
+                summary['max'] * 1000,
+            ))
+        return '\n'.join(lines)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, '{}'.format(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in sorted(labels.items())
+    ) + '}'
+
+
+def format_prometheus(families):
+    """Prometheus text format of metric families.
+
+    A family is (name, type, help, samples), and every sample is
+    (sample name, labels dict, value), where the sample name differs from
+    the family name only for the _sum and _count of summaries.
+    """
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for sample_name, labels, value in samples:
+            lines.append('{}{} {}'.format(sample_name, format_labels(labels), repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+def latency_family(name, help_text, latency_stats, label):
+    """Summary family of the histograms of latency_stats, labelled by histogram name."""
+    samples = []
+    for histogram_name, histogram in sorted(list(latency_stats.histograms.items())):
+        with histogram.lock:
+            for quantile in QUANTILES:
+                labels = {label: histogram_name, 'quantile': quantile}
+                samples.append((name, labels, histogram.percentile(quantile * 100)))
+            samples.append((name + '_sum', {label: histogram_name}, histogram.total))
+            samples.append((name + '_count', {label: histogram_name}, histogram.count))
+    return (name, 'summary', help_text, samples)
+
+
+class MetricsServer(object):
+    """HTTP endpoint serving collect() in Prometheus text format on /metrics.
+
+    collect() is called from the server thread on every scrape and returns
+    the metric families. It only reads counters, so scrapes take no locks
+    of the control loop or the joystick thread.
+    """
+
+    def __init__(self, collect, host='127.0.0.1', port=9101):
+        object.__init__(self)
+
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = format_prometheus(metrics_server.collect()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes would fill the log
+                pass
+
+        self.server = HTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-thread')
+        self.thread.daemon = True
+        self.thread.start()
+        print('Metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
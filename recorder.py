@@ -0,0 +1,207 @@
+#!/usr/bin/env python2
+
+"""Recording and replaying of controller input.
+
+A recording starts with MAGIC, the length of the header as a 32 bit little
+endian integer and a JSON header describing the joysticks. It is followed
+by fixed size records of the joystick and keyboard events in the order
+they were received.
+
+Replay a recording through the control pipeline against simulated cameras:
+
+    python recorder.py session.rec
+    python recorder.py session.rec --fast --print
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import argparse
+from collections import deque
+import json
+import struct
+import threading
+import time
+
+import pygame
+
+MAGIC = b'VISCAPI-REC1'
+HEADER_LENGTH = struct.Struct(str('<I'))
+# Timestamp, event type, joystick, axis/button/hat/key, value, second value of a hat
+RECORD = struct.Struct(str('<dBBIff'))
+
+EVENT_AXIS = 0
+EVENT_BUTTON_DOWN = 1
+EVENT_BUTTON_UP = 2
+EVENT_HAT = 3
+EVENT_KEY_DOWN = 4
+EVENT_KEY_UP = 5
+
+
+def pack_event(event, timestamp):
+    if event.type == pygame.JOYAXISMOTION:
+        return RECORD.pack(timestamp, EVENT_AXIS, event.joy, event.axis, event.value, 0.0)
+    if event.type == pygame.JOYBUTTONDOWN:
+        return RECORD.pack(timestamp, EVENT_BUTTON_DOWN, event.joy, event.button, 0.0, 0.0)
+    if event.type == pygame.JOYBUTTONUP:
+        return RECORD.pack(timestamp, EVENT_BUTTON_UP, event.joy, event.button, 0.0, 0.0)
+    if event.type == pygame.JOYHATMOTION:
+        return RECORD.pack(timestamp, EVENT_HAT, event.joy, event.hat, event.value[0], event.value[1])
+    if event.type == pygame.KEYDOWN:
+        return RECORD.pack(timestamp, EVENT_KEY_DOWN, 0, event.key, 0.0, 0.0)
+    if event.type == pygame.KEYUP:
+        return RECORD.pack(timestamp, EVENT_KEY_UP, 0, event.key, 0.0, 0.0)
+    return None
+
+
+def unpack_event(data):
+    timestamp, event_type, joy, index, value, value2 = RECORD.unpack(data)
+    if event_type == EVENT_AXIS:
+        event = pygame.event.Event(pygame.JOYAXISMOTION, {"joy": joy, "axis": index, "value": value})
+    elif event_type == EVENT_BUTTON_DOWN:
+        event = pygame.event.Event(pygame.JOYBUTTONDOWN, {"joy": joy, "button": index})
+    elif event_type == EVENT_BUTTON_UP:
+        event = pygame.event.Event(pygame.JOYBUTTONUP, {"joy": joy, "button": index})
+    elif event_type == EVENT_HAT:
+        event = pygame.event.Event(pygame.JOYHATMOTION, {"joy": joy, "hat": index, "value": (int(value), int(value2))})
+    elif event_type == EVENT_KEY_DOWN:
+        event = pygame.event.Event(pygame.KEYDOWN, {"key": index})
+    elif event_type == EVENT_KEY_UP:
+        event = pygame.event.Event(pygame.KEYUP, {"key": index})
+    else:
+        raise ValueError('Unknown event type {}'.format(event_type))
+    return timestamp, event
+
+
+class EventRecorder(object):
+    """Appends input events to a recording file.
+
+    record() is called in the joystick thread and only packs the event and
+    appends it to a deque, the file is written by a separate thread.
+    """
+
+    def __init__(self, path, joysticks, flush_interval=0.5):
+        object.__init__(self)
+
+        self.path = path
+        self.joysticks = joysticks
+        self.flush_interval = flush_interval
+
+        self.records = deque()
+        self.file = None
+        self.thread = None
+        self.keep_running = False
+
+    def start(self):
+        header = json.dumps({"joysticks": self.joysticks}).encode('utf-8')
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+
+        self.keep_running = True
+        self.thread = threading.Thread(target=self._writer, name='event-recorder-thread')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.keep_running = False
+        if self.thread is not None:
+            self.thread.join(self.flush_interval * 2)
+        self.flush()
+        self.file.close()
+
+    def record(self, event, timestamp):
+        record = pack_event(event, timestamp)
+        if record is not None:
+            self.records.append(record)
+
+    def flush(self):
+        chunk = []
+        while self.records:
+            chunk.append(self.records.popleft())
+        if chunk:
+            self.file.write(b''.join(chunk))
+            self.file.flush()
+
+    def _writer(self):
+        while self.keep_running:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def read_recording(path):
+    """Return the header and a list of (timestamp, event) of a recording."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError('{} is not a viscapi recording'.format(path))
+    offset = len(MAGIC)
+    header_length = HEADER_LENGTH.unpack_from(data, offset)[0]
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+    offset += header_length
+
+    events = []
+    # A partially written last record is ignored
+    while offset + RECORD.size <= len(data):
+        events.append(unpack_event(data[offset:offset + RECORD.size]))
+        offset += RECORD.size
+    return header, events
+
+
+def replay(foo, events, realtime=True, on_frame=None):
+    """Feed recorded events to foo and process a frame after each of them."""
+    started = time.time()
+    first_timestamp = events[0][0] if events else 0.0
+
+    for timestamp, event in events:
+        if realtime:
+            delay = started + (timestamp - first_timestamp) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        foo.proc_event(event)
+        result = foo.process_frame()
+        if on_frame is not None and result is not None:
+            on_frame(timestamp - first_timestamp, result)
+
+
+def main():
+    # Imported here, viscapi imports this module
+    import viscapi
+
+    parser = argparse.ArgumentParser(description='Replay a viscapi recording')
+    parser.add_argument('recording')
+    parser.add_argument('--fast', action='store_true', help='replay as fast as possible instead of real time')
+    parser.add_argument('--print', dest='print_frames', action='store_true', help='print pan, tilt and actions')
+    parser.add_argument('--live', action='store_true', help='send commands to the configured cameras')
+    args = parser.parse_args()
+
+    header, events = read_recording(args.recording)
+
+    foo = viscapi.Foo()
+    foo.load_settings()
+    if not args.live:
+        foo.simulate_cameras()
+
+    for joystick in header["joysticks"]:
+        foo.add_joystick(joystick["name"], joystick["axes"], joystick["hats"], joystick["buttons"])
+    foo.load_keyboard_config()
+    foo.initialize_pipeline()
+    foo.initialize_cameras()
+
+    def print_frame(timestamp, result):
+        # One line for every route
+        for route, (pan, tilt, actions) in zip(foo.routes, result):
+            print(json.dumps({"time": round(timestamp, 6), "route": route.name, "pan": int(pan), "tilt": int(tilt),
+                              "actions": actions}, sort_keys=True))
+
+    try:
+        replay(foo, events, realtime=not args.fast, on_frame=print_frame if args.print_frames else None)
+    finally:
+        for command_queue in foo.command_queues:
+            command_queue.stop()
+
+    print(foo.latency.format())
+
+
+if __name__ == "__main__":
+    main()
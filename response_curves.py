@@ -0,0 +1,163 @@
+#!/usr/bin/env python2
+
+"""Response curves of the joystick axes compiled into lookup tables.
+
+An axis value in [-1, 1] is quantised to one of 2 * AXIS_STEPS + 1 table
+indexes. The dead zone and the curve are applied to the magnitude of the
+value, so that every curve is symmetric and keeps its sign.
+
+Speed tables have a row for every quantised sensitivity, and contain the
+final VISCA speed with the multipliers, inversion and speed limits
+applied, so that the speed of an axis is a single array lookup per frame.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+from array import array
+import json
+
+# Table entries for each direction of an axis
+AXIS_STEPS = 128
+# Rows of the speed tables for sensitivities from 0.0 to 2.0
+SENSITIVITY_STEPS = 32
+MAX_SENSITIVITY = 2.0
+
+CURVE_LINEAR = 'linear'
+CURVE_EXPO = 'expo'
+CURVE_S_CURVE = 's-curve'
+CURVE_PIECEWISE = 'piecewise'
+
+
+def linear_curve(x):
+    return x
+
+
+def expo_curve(amount):
+    # Flatter around the center, amount 0.0 is linear and 1.0 cubic
+    return lambda x: (1.0 - amount) * x + amount * x * x * x
+
+
+def s_curve(amount):
+    # Flatter around the center and near the end, amount 0.0 is linear and 1.0 smoothstep
+    return lambda x: (1.0 - amount) * x + amount * x * x * (3.0 - 2.0 * x)
+
+
+def piecewise_curve(points):
+    points = sorted((float(x), float(y)) for x, y in points)
+
+    def curve(x):
+        if x <= points[0][0]:
+            return points[0][1]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            if x <= x1:
+                return y0 + (y1 - y0) * (x - x0) / (x1 - x0) if x1 > x0 else y1
+        return points[-1][1]
+    return curve
+
+
+def curve_error(config, reason):
+    return ValueError('Invalid response curve {}: {}, expected "linear", {{"type": "expo" or "s-curve", '
+                      '"amount": 0.0 to 1.0}} or {{"type": "piecewise", "points": [[input, output], ...]}}'.format(
+                          json_value(config), reason))
+
+
+def json_value(config):
+    try:
+        return json.dumps(config, sort_keys=True)
+    except (TypeError, ValueError):
+        return repr(config)
+
+
+def is_number(value):
+    return not isinstance(value, bool) and isinstance(value, (int, float))
+
+
+def get_curve(config):
+    """Curve function of the magnitude of an axis from its config.
+
+    The config is "linear", or a dict with "type" "expo" or "s-curve" and
+    an "amount" from 0.0 to 1.0, or "type" "piecewise" and "points", a list
+    of [input, output] pairs between 0.0 and 1.0. Raises ValueError for
+    any other config.
+    """
+    if config is None or config == CURVE_LINEAR:
+        return linear_curve
+    if not isinstance(config, dict):
+        raise curve_error(config, 'not a curve')
+    curve_type = config.get("type", CURVE_LINEAR)
+    if curve_type == CURVE_LINEAR:
+        return linear_curve
+    if curve_type in (CURVE_EXPO, CURVE_S_CURVE):
+        amount = config.get("amount", 0.5)
+        if not is_number(amount) or not 0.0 <= amount <= 1.0:
+            raise curve_error(config, 'amount must be from 0.0 to 1.0')
+        return expo_curve(amount) if curve_type == CURVE_EXPO else s_curve(amount)
+    if curve_type == CURVE_PIECEWISE:
+        points = config.get("points")
+        if not isinstance(points, list) or not points or not all(
+                isinstance(point, list) and len(point) == 2 and all(is_number(value) for value in point)
+                for point in points):
+            raise curve_error(config, 'points must be a list of [input, output] pairs')
+        return piecewise_curve(points)
+    raise curve_error(config, 'unknown type')
+
+
+def axis_index(value):
+    index = int(round((value + 1.0) * AXIS_STEPS))
+    return 0 if index < 0 else 2 * AXIS_STEPS if index > 2 * AXIS_STEPS else index
+
+
+def shaped_values(dead_zone, curve):
+    """Axis value after the dead zone and the curve for every table index."""
+    values = []
+    for index in range(0, 2 * AXIS_STEPS + 1):
+        value = index / AXIS_STEPS - 1.0
+        if abs(value) <= dead_zone:
+            values.append(0.0)
+        elif value < 0:
+            values.append(-curve(-value))
+        else:
+            values.append(curve(value))
+    return values
+
+
+def sensitivity_row(sensitivity):
+    row = int(round(sensitivity / MAX_SENSITIVITY * SENSITIVITY_STEPS))
+    return 0 if row < 0 else SENSITIVITY_STEPS if row > SENSITIVITY_STEPS else row
+
+
+class SensitivityTable(object):
+    """Sensitivity and speed table row for every index of the sensitivity axis."""
+
+    def __init__(self, dead_zone, curve, invert):
+        object.__init__(self)
+
+        self.values = array(str('d'))
+        self.rows = array(str('B'))
+        for value in shaped_values(dead_zone, curve):
+            sensitivity = value * -1 + 1.0
+            if invert:
+                sensitivity = -1 * (sensitivity - 2.0)
+            self.values.append(sensitivity)
+            self.rows.append(sensitivity_row(sensitivity))
+
+
+class SpeedTable(object):
+    """Speed for every sensitivity row and axis index.
+
+    speed(value, sensitivity) computes the speed of a shaped axis value,
+    and is only called while compiling the table.
+    """
+
+    def __init__(self, dead_zone, curve, speed):
+        object.__init__(self)
+
+        values = shaped_values(dead_zone, curve)
+        self.width = len(values)
+        self.speeds = array(str('b'))
+        for row in range(0, SENSITIVITY_STEPS + 1):
+            sensitivity = row * MAX_SENSITIVITY / SENSITIVITY_STEPS
+            self.speeds.extend(speed(value, sensitivity) for value in values)
+
+    def lookup(self, row, value):
+        return self.speeds[row * self.width + axis_index(value)]
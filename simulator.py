@@ -0,0 +1,404 @@
+#!/usr/bin/env python2
+
+"""Simulated VISCA camera.
+
+The simulated camera understands the commands sent by viscapi and the
+position inquiries, models the time it takes to transfer bytes over a
+serial line and the ACK and completion delays of a real camera, and keeps
+track of its simulated position.
+
+It can be used in process with transport "simulator", or run standalone on
+a pty or as a VISCA over IP stand-in:
+
+    python simulator.py --pty
+    python simulator.py --udp 52381
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import argparse
+import os
+import pty
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+
+from visca import (
+    SerialTransport, REPLY_ACK, REPLY_COMPLETION, REPLY_ERROR, PAYLOAD_COMMAND, PAYLOAD_INQUIRY, PAYLOAD_REPLY,
+    PAYLOAD_CONTROL_COMMAND, PAYLOAD_CONTROL_REPLY, VISCA_UDP_PORT,
+)
+
+# Error codes
+ERROR_SYNTAX = 0x02
+ERROR_BUFFER_FULL = 0x03
+ERROR_NOT_EXECUTABLE = 0x41
+
+# Simulated ranges and speeds in position units
+PAN_RANGE = 2448
+TILT_RANGE = 1296
+PAN_TILT_UNITS_PER_SPEED = 50.0
+ZOOM_RANGE = 0x4000
+ZOOM_UNITS_PER_SPEED = 1000.0
+FOCUS_MIN = 0x1000
+FOCUS_MAX = 0xC000
+FOCUS_UNITS_PER_SPEED = 2000.0
+# Longest sleep of a read waiting for replies, a reply may be written by another thread meanwhile
+READ_POLL_INTERVAL = 0.001
+# Command sockets of a camera
+COMMAND_SOCKETS = (1, 2)
+
+
+def clamp(value, minimum, maximum):
+    return max(minimum, min(value, maximum))
+
+
+def drive_speed(value):
+    """Signed speed of a zoom or focus drive command, standard speed is 3."""
+    if value in (0x02, 0x03):
+        direction, speed = value, 3
+    elif value & 0xF0 in (0x20, 0x30):
+        direction, speed = value >> 4, (value & 0x0F) + 1
+    else:
+        return 0
+    return speed if direction == 0x02 else -speed
+
+
+def nibbles(value, count=4):
+    value &= (1 << (4 * count)) - 1
+    return [(value >> shift) & 0x0F for shift in range(4 * (count - 1), -4, -4)]
+
+
+class SimulatedCamera(object):
+    """State of a simulated camera.
+
+    handle_packet() returns the replies to a command as a list of
+    (delay, reply) tuples where delay is the time in seconds after the
+    command was received. Like a real camera it executes at most two
+    commands at a time, one on each command socket, and answers a third
+    one with a buffer full error.
+    """
+
+    def __init__(self, address=1, ack_delay=0.002, completion_delay=0.01, recall_delay=0.5):
+        object.__init__(self)
+
+        self.address = address
+        self.ack_delay = ack_delay
+        self.completion_delay = completion_delay
+        self.recall_delay = recall_delay
+
+        self.lock = threading.Lock()
+        self.updated = time.time()
+
+        self.power = False
+        self.pan = 0.0
+        self.tilt = 0.0
+        self.pan_speed = 0
+        self.tilt_speed = 0
+        self.zoom = 0.0
+        self.zoom_speed = 0
+        self.focus = float(FOCUS_MIN)
+        self.focus_speed = 0
+        self.focus_mode = "auto"
+        self.wb_mode = "auto"
+        self.red_gain = 0x80
+        self.blue_gain = 0x80
+        self.memories = {}
+        # Time when the command executing on a socket completes
+        self.sockets_busy_until = dict((socket_number, 0.0) for socket_number in COMMAND_SOCKETS)
+
+        self.command_count = 0
+        self.inquiry_count = 0
+
+    def update(self, now=None):
+        """Move the camera according to the current speeds."""
+        now = time.time() if now is None else now
+        elapsed = now - self.updated
+        self.updated = now
+        self.pan = clamp(self.pan + self.pan_speed * PAN_TILT_UNITS_PER_SPEED * elapsed, -PAN_RANGE, PAN_RANGE)
+        self.tilt = clamp(self.tilt + self.tilt_speed * PAN_TILT_UNITS_PER_SPEED * elapsed, -TILT_RANGE, TILT_RANGE)
+        self.zoom = clamp(self.zoom + self.zoom_speed * ZOOM_UNITS_PER_SPEED * elapsed, 0, ZOOM_RANGE)
+        self.focus = clamp(self.focus + self.focus_speed * FOCUS_UNITS_PER_SPEED * elapsed, FOCUS_MIN, FOCUS_MAX)
+
+    def reply(self, reply_type, socket_number=0, data=()):
+        return bytearray([0x80 | (self.address << 4), reply_type | socket_number] + list(data) + [0xFF])
+
+    def free_socket(self, now):
+        for socket_number in COMMAND_SOCKETS:
+            if self.sockets_busy_until[socket_number] <= now + self.ack_delay:
+                return socket_number
+        return None
+
+    def handle_packet(self, packet):
+        if len(packet) < 3 or packet[-1] != 0xFF:
+            return [(self.ack_delay, self.reply(REPLY_ERROR, 0, [ERROR_SYNTAX]))]
+
+        with self.lock:
+            now = time.time()
+            self.update(now)
+            if packet[1] == 0x09:
+                self.inquiry_count += 1
+                data = self.handle_inquiry(packet[2:-1])
+                if data is None:
+                    return [(self.ack_delay, self.reply(REPLY_ERROR, 0, [ERROR_SYNTAX]))]
+                return [(self.ack_delay, self.reply(REPLY_COMPLETION, 0, data))]
+
+            socket_number = self.free_socket(now)
+            if socket_number is None:
+                return [(self.ack_delay, self.reply(REPLY_ERROR, 0, [ERROR_BUFFER_FULL]))]
+
+            self.command_count += 1
+            completion_delay = self.handle_command(packet[1:-1])
+            if completion_delay is None:
+                return [(self.ack_delay, self.reply(REPLY_ERROR, 0, [ERROR_NOT_EXECUTABLE]))]
+            self.sockets_busy_until[socket_number] = now + self.ack_delay + completion_delay
+            return [
+                (self.ack_delay, self.reply(REPLY_ACK, socket_number)),
+                (self.ack_delay + completion_delay, self.reply(REPLY_COMPLETION, socket_number)),
+            ]
+
+    def handle_command(self, command):
+        """Execute a command and return its completion delay, None if not understood."""
+        if list(command[:3]) == [0x01, 0x06, 0x01] and len(command) == 7:
+            pan_speed, tilt_speed, pan_direction, tilt_direction = command[3:7]
+            self.pan_speed = {0x01: -pan_speed, 0x02: pan_speed}.get(pan_direction, 0)
+            # Tilt up is negative like in viscapi
+            self.tilt_speed = {0x01: -tilt_speed, 0x02: tilt_speed}.get(tilt_direction, 0)
+            return self.completion_delay
+
+        if len(command) < 4 or command[0] != 0x01 or command[1] != 0x04:
+            return None
+
+        category, value = command[2], command[3]
+        if category == 0x07:
+            self.zoom_speed = drive_speed(value)
+        elif category == 0x08:
+            self.focus_speed = drive_speed(value)
+        elif category == 0x38:
+            self.focus_mode = {0x02: "auto", 0x03: "manual"}.get(value, self.focus_mode)
+        elif category == 0x18:
+            pass
+        elif category == 0x35:
+            self.wb_mode = {0x00: "auto", 0x01: "indoor", 0x02: "outdoor", 0x03: "onepush", 0x05: "manual"}.get(
+                value, self.wb_mode)
+        elif category == 0x03:
+            self.red_gain = clamp(self.red_gain + {0x02: 1, 0x03: -1}.get(value, 0), 0, 0xFF)
+        elif category == 0x04:
+            self.blue_gain = clamp(self.blue_gain + {0x02: 1, 0x03: -1}.get(value, 0), 0, 0xFF)
+        elif category == 0x3F and len(command) == 5:
+            mem = command[4]
+            if value == 0x01:
+                self.memories[mem] = (self.pan, self.tilt, self.zoom, self.focus)
+            elif value == 0x02:
+                if mem in self.memories:
+                    self.pan, self.tilt, self.zoom, self.focus = self.memories[mem]
+                return self.recall_delay
+        elif category == 0x00:
+            self.power = value == 0x02
+        else:
+            return None
+
+        return self.completion_delay
+
+    def handle_inquiry(self, inquiry):
+        """Return the data of an inquiry reply, None if not understood."""
+        inquiry = list(inquiry)
+        if inquiry == [0x06, 0x12]:
+            return nibbles(int(self.pan)) + nibbles(int(self.tilt))
+        if inquiry == [0x04, 0x47]:
+            return nibbles(int(self.zoom))
+        if inquiry == [0x04, 0x48]:
+            return nibbles(int(self.focus))
+        if inquiry == [0x04, 0x38]:
+            return [{"auto": 0x02, "manual": 0x03}[self.focus_mode]]
+        if inquiry == [0x04, 0x35]:
+            return [{"auto": 0x00, "indoor": 0x01, "outdoor": 0x02, "onepush": 0x03, "manual": 0x05}[self.wb_mode]]
+        if inquiry == [0x04, 0x00]:
+            return [0x02 if self.power else 0x03]
+        return None
+
+
+class SimulatedSerial(object):
+    """Object with the parts of the serial.Serial interface used by SerialTransport.
+
+    Writing and reading take the time the bytes would take on a serial line
+    with the given baud rate, and replies become readable after the delays
+    given by the camera. A camera is created for every address commands are
+    sent to, so several cameras can be daisy chained on one line.
+    """
+
+    def __init__(self, baudrate=9600, timeout=1.0, ack_delay=0.002, completion_delay=0.01):
+        object.__init__(self)
+
+        # SimulatedCamera by address
+        self.cameras = {}
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ack_delay = ack_delay
+        self.completion_delay = completion_delay
+        self.lock = threading.Lock()
+        # List of (time when readable, byte)
+        self.replies = []
+        # (start, end) of the replies being sent or scheduled on the line
+        self.line_busy = []
+
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def byte_time(self, count):
+        # 8 data bits, start and stop bit
+        return 0 if not self.baudrate else count * 10.0 / self.baudrate
+
+    def get_camera(self, address):
+        camera = self.cameras.get(address)
+        if camera is None:
+            camera = SimulatedCamera(address, ack_delay=self.ack_delay, completion_delay=self.completion_delay)
+            self.cameras[address] = camera
+        return camera
+
+    def schedule_reply(self, start, duration):
+        """Return when a reply ready at start can be sent without overlapping the others."""
+        for busy_start, busy_end in sorted(self.line_busy):
+            if start < busy_end and start + duration > busy_start:
+                start = busy_end
+        self.line_busy.append((start, start + duration))
+        return start
+
+    def write(self, data):
+        packet = bytearray(data)
+        time.sleep(self.byte_time(len(packet)))
+        received = time.time()
+        self.bytes_written += len(packet)
+
+        # Broadcasts are not answered
+        if not packet or packet[0] & 0x07 == 0 or packet[0] & 0x08:
+            return len(packet)
+        camera = self.get_camera(packet[0] & 0x07)
+
+        with self.lock:
+            self.line_busy = [(start, end) for start, end in self.line_busy if end > received]
+            for delay, reply in camera.handle_packet(packet):
+                available = self.schedule_reply(received + delay, self.byte_time(len(reply)))
+                for value in reply:
+                    available += self.byte_time(1)
+                    self.replies.append((available, value))
+            self.replies.sort(key=lambda reply_byte: reply_byte[0])
+        return len(packet)
+
+    def read(self, size=1):
+        data = bytearray()
+        deadline = time.time() + (self.timeout if self.timeout is not None else 1e9)
+        while len(data) < size:
+            with self.lock:
+                if self.replies:
+                    available, value = self.replies[0]
+                    if available <= time.time():
+                        self.replies.pop(0)
+                        data.append(value)
+                        continue
+                    wait = available - time.time()
+                else:
+                    wait = deadline - time.time()
+            if time.time() >= deadline:
+                break
+            time.sleep(max(0.0, min(wait, deadline - time.time(), READ_POLL_INTERVAL)))
+        self.bytes_read += len(data)
+        return bytes(data)
+
+    def close(self):
+        pass
+
+
+class SimulatedTransport(SerialTransport):
+    """SerialTransport talking to simulated cameras instead of a serial port."""
+
+    def __init__(self, baudrate=9600, timeout=1.0, ack_delay=0.002, completion_delay=0.01, pipelined=False):
+        SerialTransport.__init__(self, 'simulator', baudrate=baudrate, timeout=timeout, pipelined=pipelined)
+
+        self.ack_delay = ack_delay
+        self.completion_delay = completion_delay
+
+    def open_serial(self):
+        return SimulatedSerial(
+            baudrate=self.baudrate,
+            timeout=self.timeout,
+            ack_delay=self.ack_delay,
+            completion_delay=self.completion_delay,
+        )
+
+    def get_camera(self, address):
+        return self.serial.get_camera(address)
+
+
+def serve_pty(line):
+    """Serve simulated cameras on a pty which can be opened like a serial port."""
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    print('Simulated cameras on {}'.format(os.ttyname(slave)))
+
+    packet = bytearray()
+    while True:
+        readable, _, _ = select.select([master], [], [], 0.001)
+        if readable:
+            packet += bytearray(os.read(master, 64))
+            while b'\xff' in packet:
+                end = packet.index(b'\xff') + 1
+                line.write(packet[:end])
+                packet = packet[end:]
+        reply = line.read(64)
+        if reply:
+            os.write(master, reply)
+
+
+def serve_udp(camera, port):
+    """Serve a simulated camera as a VISCA over IP stand-in."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', port))
+    print('Simulated camera on udp port {}'.format(server.getsockname()[1]))
+
+    while True:
+        data, client = server.recvfrom(1024)
+        if len(data) < 8:
+            continue
+        payload_type, length, sequence_number = struct.unpack(str('>HHI'), data[:8])
+        payload = bytearray(data[8:8 + length])
+
+        if payload_type == PAYLOAD_CONTROL_COMMAND:
+            server.sendto(struct.pack(str('>HHI'), PAYLOAD_CONTROL_REPLY, 1, sequence_number) + b'\x01', client)
+            continue
+        if payload_type != PAYLOAD_COMMAND and payload_type != PAYLOAD_INQUIRY:
+            continue
+
+        started = time.time()
+        for delay, reply in camera.handle_packet(payload):
+            time.sleep(max(0.0, started + delay - time.time()))
+            header = struct.pack(str('>HHI'), PAYLOAD_REPLY, len(reply), sequence_number)
+            server.sendto(header + bytes(reply), client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated VISCA camera')
+    parser.add_argument('--pty', action='store_true', help='serve on a pty')
+    parser.add_argument('--udp', type=int, metavar='PORT', help='serve VISCA over IP on a udp port')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--ack-delay', type=float, default=0.002)
+    parser.add_argument('--completion-delay', type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.udp is not None:
+        camera = SimulatedCamera(ack_delay=args.ack_delay, completion_delay=args.completion_delay)
+        serve_udp(camera, args.udp or VISCA_UDP_PORT)
+    else:
+        line = SimulatedSerial(
+            baudrate=args.baudrate,
+            timeout=0,
+            ack_delay=args.ack_delay,
+            completion_delay=args.completion_delay,
+        )
+        serve_pty(line)
+
+
+if __name__ == "__main__":
+    main()
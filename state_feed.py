@@ -0,0 +1,160 @@
+#!/usr/bin/env python2
+
+"""Publishes the state of viscapi and its cameras on a Unix socket.
+
+A subscriber connects to the socket and reads JSON lines. The first line
+is the whole state, the following ones contain only what has changed:
+
+    {"seq": 7, "snapshot": {"cameras": {"0": {"name": "Stage", "wb-mode": "auto"}}}}
+    {"seq": 8, "diff": {"cameras": {"0": {"wb-mode": "manual"}}}}
+
+A diff is merged into the state like a JSON merge patch, a value of null
+removes the key. Values which are not known are left out of the state, so
+null is never a value. seq increases by one with every diff, so subscribers
+can tell that they missed one. Subscribers only read, whatever they send is
+ignored. A subscriber which does not keep up until its socket buffer is
+full is disconnected.
+"""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import json
+import os
+import socket
+import threading
+import time
+
+
+def prune_state(state):
+    """Copy of state without the keys of None values, which a merge patch would delete."""
+    pruned = {}
+    for key, value in state.items():
+        if isinstance(value, dict):
+            pruned[key] = prune_state(value)
+        elif value is not None:
+            pruned[key] = value
+    return pruned
+
+
+def diff_state(old, new):
+    """Changes from old to new as a merge patch, None if nothing changed."""
+    changes = {}
+    for key, value in new.items():
+        old_value = old.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            value = diff_state(old_value, value)
+            if value is not None:
+                changes[key] = value
+        elif key not in old or old_value != value:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes or None
+
+
+class StateFeed(object):
+    """Samples get_state() every interval seconds and sends the changes to subscribers.
+
+    get_state() is called from the feed thread and returns nested dicts of
+    JSON values. State is only read from memory, the cameras are never
+    asked, so subscribers add no traffic to the camera links.
+    """
+
+    def __init__(self, get_state, path, interval=0.1):
+        object.__init__(self)
+
+        self.get_state = get_state
+        self.path = path
+        self.interval = interval
+
+        # State last sent to the subscribers
+        self.state = {}
+        self.seq = 0
+        self.subscribers = []
+        # Held while sending, so that a new subscriber gets no diff older than its snapshot.
+        # Sends never block, a full socket buffer drops the subscriber instead.
+        self.lock = threading.Lock()
+        self.server_socket = None
+        self.threads = []
+        self.keep_running = False
+
+        self.diff_count = 0
+        self.dropped_count = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Left behind by a previous run
+            os.unlink(self.path)
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.path)
+        self.server_socket.listen(5)
+        self.state = prune_state(self.get_state())
+
+        self.keep_running = True
+        for name, target in (('state-feed-accept-thread', self._accept), ('state-feed-thread', self._publish)):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        print('State feed on {}'.format(self.path))
+
+    def stop(self):
+        self.keep_running = False
+        try:
+            # Wakes up the accept thread
+            self.server_socket.shutdown(socket.SHUT_RDWR)
+        except (IOError, OSError):
+            pass
+        self.server_socket.close()
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.close()
+            self.subscribers = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept(self):
+        while self.keep_running:
+            try:
+                subscriber, _ = self.server_socket.accept()
+            except (IOError, OSError):
+                continue
+            subscriber.setblocking(False)
+            with self.lock:
+                # The next diff follows with seq + 1
+                if self.send(subscriber, {"seq": self.seq, "snapshot": self.state}):
+                    self.subscribers.append(subscriber)
+
+    def _publish(self):
+        while self.keep_running:
+            time.sleep(self.interval)
+            self.publish(self.get_state())
+
+    def publish(self, state):
+        state = prune_state(state)
+        changes = diff_state(self.state, state)
+        if changes is None:
+            return
+        with self.lock:
+            self.state = state
+            self.seq += 1
+            self.diff_count += 1
+            message = {"seq": self.seq, "diff": changes}
+            self.subscribers = [subscriber for subscriber in self.subscribers if self.send(subscriber, message)]
+
+    def send(self, subscriber, message):
+        try:
+            subscriber.sendall((json.dumps(message, sort_keys=True) + '\n').encode('utf-8'))
+            return True
+        except (IOError, OSError):
+            self.dropped_count += 1
+            subscriber.close()
+            return False
+
+    def get_stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'diffs': self.diff_count,
+            'dropped': self.dropped_count,
+        }
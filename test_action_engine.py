@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+
+"""Feeds frames of actions to ActionEngine and checks what it dispatches."""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import unittest
+
+from action_engine import ActionEngine
+
+
+@unittest.skipIf(not hasattr(dict, 'iteritems'), 'the control pipeline runs on Python 2')
+class ActionEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatched = []
+        handlers = {
+            'zoom-in': self.handle,
+            'memory-recall': self.handle,
+            'wb-red-plus': self.handle,
+        }
+        self.engine = ActionEngine(handlers, {'wb-red-plus': 5.0}, repeat_delay=0.5)
+
+    def handle(self, action, **params):
+        self.dispatched.append((action, params))
+
+    def test_press_once(self):
+        self.engine.update({'memory-recall': {'mem': 2}}, 0.0)
+        self.engine.update({'memory-recall': {'mem': 2}}, 0.1)
+        self.engine.update({'memory-recall': {'mem': 2}}, 10.0)
+        self.assertEqual(self.dispatched, [('memory-recall', {'mem': 2})])
+
+        # Released and pressed again
+        self.engine.update({}, 10.1)
+        self.engine.update({'memory-recall': {'mem': 2}}, 10.2)
+        self.assertEqual(len(self.dispatched), 2)
+        self.assertEqual(self.engine.get_stats(), {'pressed': 2, 'changed': 0, 'repeated': 0, 'released': 1})
+
+    def test_change(self):
+        self.engine.update({'zoom-in': {'speed': 2}}, 0.0)
+        self.engine.update({'zoom-in': {'speed': 2}}, 0.1)
+        self.engine.update({'zoom-in': {'speed': 5}}, 0.2)
+        self.assertEqual(self.dispatched, [('zoom-in', {'speed': 2}), ('zoom-in', {'speed': 5})])
+        self.assertEqual(self.engine.get_stats()['changed'], 1)
+
+    def test_repeat_delay(self):
+        self.engine.update({'wb-red-plus': {}}, 0.0)
+        self.assertEqual(self.engine.get_next_repeat_time(), 0.5)
+        self.engine.repeat(0.49)
+        self.assertEqual(len(self.dispatched), 1)
+
+        # At the repeat delay, then at the repeat rate
+        self.engine.repeat(0.5)
+        self.engine.repeat(0.69)
+        self.engine.repeat(0.7)
+        self.assertEqual(len(self.dispatched), 3)
+        self.assertAlmostEqual(self.engine.get_next_repeat_time(), 0.9)
+
+        self.engine.update({}, 0.8)
+        self.assertIsNone(self.engine.get_next_repeat_time())
+        self.engine.repeat(2.0)
+        self.assertEqual(len(self.dispatched), 3)
+
+    def test_missed_repeats(self):
+        self.engine.update({'wb-red-plus': {}}, 0.0)
+        # The loop was busy for two seconds, the missed repeats are not made up for
+        self.engine.repeat(2.5)
+        self.engine.repeat(2.6)
+        self.assertEqual(len(self.dispatched), 2)
+        self.assertAlmostEqual(self.engine.get_next_repeat_time(), 2.7)
+        self.engine.repeat(2.7)
+        self.assertEqual(len(self.dispatched), 3)
+
+    def test_forget(self):
+        self.engine.update({'zoom-in': {'speed': 2}, 'wb-red-plus': {}}, 0.0)
+        self.engine.forget(['zoom-in', 'wb-red-plus'])
+        self.assertIsNone(self.engine.get_next_repeat_time())
+
+        # Still held, so pressed again on the next frame
+        self.engine.update({'zoom-in': {'speed': 2}, 'wb-red-plus': {}}, 0.1)
+        self.assertEqual(sorted(action for action, _ in self.dispatched),
+                         ['wb-red-plus', 'wb-red-plus', 'zoom-in', 'zoom-in'])
+        self.assertEqual(self.engine.get_next_repeat_time(), 0.6)
+
+    def test_configure(self):
+        self.engine.update({'wb-red-plus': {}}, 0.0)
+        self.engine.configure({'wb-red-plus': 10.0}, 0.2)
+        # Pending repeats are dropped, a new press uses the new delay and rate
+        self.assertIsNone(self.engine.get_next_repeat_time())
+        self.engine.update({}, 0.1)
+        self.engine.update({'wb-red-plus': {}}, 0.2)
+        self.engine.repeat(0.4)
+        self.assertAlmostEqual(self.engine.get_next_repeat_time(), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
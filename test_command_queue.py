@@ -0,0 +1,198 @@
+#!/usr/bin/env python2
+
+"""Puts commands of a fake camera to CommandQueue and checks what is sent."""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import threading
+import unittest
+
+import command_queue
+from command_queue import CommandQueue, PRIORITY_STOP, PRIORITY_MOTION, PRIORITY_LENS, PRIORITY_IMAGE
+
+PRIORITIES = {
+    'pan_tilt_stop': PRIORITY_STOP,
+    'zoom': PRIORITY_LENS,
+    'wb_red_plus': PRIORITY_IMAGE,
+}
+
+
+def priority(name, args, kwargs):
+    return PRIORITIES.get(name, PRIORITY_MOTION)
+
+
+class FakeTimeout(Exception):
+    pass
+
+
+class FakeClock(object):
+    def __init__(self):
+        object.__init__(self)
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeCamera(object):
+    def __init__(self):
+        object.__init__(self)
+        self.calls = []
+        self.fail = False
+        self.called = threading.Event()
+
+    def record(self, name, args, blocking):
+        self.calls.append((name,) + args)
+        self.called.set()
+        if self.fail:
+            raise FakeTimeout('no reply')
+
+    def pan_tilt(self, *args, **kwargs):
+        self.record('pan_tilt', args, **kwargs)
+
+    def pan_tilt_stop(self, *args, **kwargs):
+        self.record('pan_tilt_stop', args, **kwargs)
+
+    def zoom(self, *args, **kwargs):
+        self.record('zoom', args, **kwargs)
+
+    def set_memory(self, *args, **kwargs):
+        self.record('set_memory', args, **kwargs)
+
+    def wb_red_plus(self, *args, **kwargs):
+        self.record('wb_red_plus', args, **kwargs)
+
+
+class CommandQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time = command_queue.time
+        command_queue.time = self.clock
+        self.camera = FakeCamera()
+        self.queue = self.create_queue()
+
+    def tearDown(self):
+        self.queue.stop()
+        command_queue.time = self.time
+
+    def create_queue(self, **kwargs):
+        queue = CommandQueue(priority=priority, **kwargs)
+        # Commands are taken with _get() by the test instead of the worker
+        queue.keep_running = True
+        return queue
+
+    def take(self):
+        """Return the name and arguments of the commands in the order they would be sent."""
+        names = []
+        while self.queue.depth:
+            command = self.queue._get()
+            names.append((command.function.__name__,) + command.args)
+        return names
+
+    def test_coalescing(self):
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 1, 2)
+        self.queue.put(self.camera.set_memory, 1)
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 3, 4)
+
+        # The newer value is sent after the discrete command put before it
+        self.assertEqual(self.queue.get_stats()['coalesced'], 1)
+        self.assertEqual(self.take(), [('set_memory', 1), ('pan_tilt', 3, 4)])
+
+    def test_priority(self):
+        self.queue.put(self.camera.wb_red_plus)
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 1, 2)
+        self.queue.put(self.camera.pan_tilt_stop)
+        self.assertEqual(self.take(), [('pan_tilt_stop',), ('pan_tilt', 1, 2), ('zoom', 2), ('wb_red_plus',)])
+
+    def test_budget(self):
+        self.queue = self.create_queue(bytes_per_second=100, command_bytes={'pan_tilt': 14, 'zoom': 12})
+        # A burst of 30 bytes
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 1, 2)
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertEqual(self.take(), [('pan_tilt', 1, 2), ('zoom', 2)])
+
+        # 4 bytes left, an image adjustment also keeps room for a motion command
+        self.queue.put(self.camera.wb_red_plus)
+        command, wait_time = self.queue._next_command()
+        self.assertIsNone(command)
+        self.assertAlmostEqual(wait_time, (12 + 15 - 4) / 100)
+
+        # Motion is sent regardless of the budget
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 5, 6)
+        self.assertEqual(self.queue._get().args, (5, 6))
+
+        self.clock.now += 0.5
+        self.assertEqual(self.take(), [('wb_red_plus',)])
+
+    def test_suppressed(self):
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertEqual(self.take(), [('zoom', 2)])
+
+        # The camera is already doing the latest command sent
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertEqual(self.queue.get_stats()['suppressed'], 2)
+        self.assertEqual(self.take(), [])
+
+        self.queue.invalidate()
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertEqual(self.take(), [('zoom', 2)])
+
+        # Discrete commands are never suppressed
+        self.queue.put(self.camera.set_memory, 1)
+        self.queue.put(self.camera.set_memory, 1)
+        self.assertEqual(self.take(), [('set_memory', 1), ('set_memory', 1)])
+
+    def test_failed_command_forgotten(self):
+        self.queue = CommandQueue(priority=priority)
+        self.queue.start()
+        self.camera.fail = True
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertTrue(self.camera.called.wait(2.0))
+
+        self.camera.called.clear()
+        self.camera.fail = False
+        # Sent again, the camera may not be zooming
+        self.queue.put_latest('zoom', self.camera.zoom, 2)
+        self.assertTrue(self.camera.called.wait(2.0))
+        self.queue.stop()
+
+        self.assertEqual(self.camera.calls, [('zoom', 2), ('zoom', 2)])
+        self.assertEqual(self.queue.error_counts, {'FakeTimeout': 1})
+        self.assertEqual(self.queue.sent_counts, {'zoom': 1})
+        self.assertEqual(self.queue.consecutive_errors, 0)
+
+    def test_drop_oldest(self):
+        self.queue = self.create_queue(max_depth=3)
+        self.queue.put_latest('pan-tilt', self.camera.pan_tilt, 1, 2)
+        self.queue.put(self.camera.set_memory, 1)
+        self.queue.put(self.camera.wb_red_plus)
+        self.queue.put(self.camera.set_memory, 2)
+
+        # The discrete command of the lowest priority is dropped, continuous ones never are
+        self.assertEqual(self.queue.get_stats()['dropped'], 1)
+        self.assertEqual(self.take(), [('pan_tilt', 1, 2), ('set_memory', 1), ('set_memory', 2)])
+
+        self.queue.put(self.camera.set_memory, 3)
+        self.queue.put(self.camera.set_memory, 4)
+        self.queue.put(self.camera.set_memory, 5)
+        self.queue.put(self.camera.set_memory, 6)
+        self.assertEqual(self.take(), [('set_memory', 4), ('set_memory', 5), ('set_memory', 6)])
+
+    def test_min_intervals(self):
+        self.queue = self.create_queue(min_intervals={'wb_red_plus': 0.5})
+        self.queue.put(self.camera.wb_red_plus)
+        self.clock.now += 0.3
+        self.queue.put(self.camera.wb_red_plus)
+        # Other arguments are another command
+        self.queue.put(self.camera.wb_red_plus, 1)
+        self.clock.now += 0.3
+        self.queue.put(self.camera.wb_red_plus)
+
+        self.assertEqual(self.queue.get_stats()['rate-limited'], 1)
+        self.assertEqual(self.take(), [('wb_red_plus',), ('wb_red_plus', 1), ('wb_red_plus',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
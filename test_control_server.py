@@ -0,0 +1,101 @@
+#!/usr/bin/env python2
+
+"""Talks to the control server over loopback TCP and UDP."""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import json
+import socket
+import threading
+import time
+import unittest
+
+from control_server import ControlServer, RemoteInputs
+
+ACTION_PARAMS = {
+    "memory-recall": ("mem",),
+    "auto-focus": (),
+}
+
+
+class ControlServerTest(unittest.TestCase):
+    def setUp(self):
+        self.changed = threading.Event()
+        self.remote_inputs = RemoteInputs(self.changed.set, rate=5.0, timeout=0.2)
+        self.server = ControlServer(self.remote_inputs, ACTION_PARAMS, (24, 18, 7), port=0)
+        self.server.start()
+
+        self.connection = socket.create_connection(('127.0.0.1', self.server.port), timeout=2.0)
+        self.replies = self.connection.makefile('rb')
+
+    def tearDown(self):
+        self.replies.close()
+        self.connection.close()
+        self.server.stop()
+
+    def send(self, message):
+        self.changed.clear()
+        self.connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        return json.loads(self.replies.readline().decode('utf-8'))
+
+    def wait_for_snapshot(self, expected):
+        deadline = time.time() + 2.0
+        while True:
+            snapshot = self.remote_inputs.snapshot()
+            if snapshot == expected or time.time() > deadline:
+                return snapshot
+            time.sleep(0.01)
+
+    def test_tcp(self):
+        self.assertEqual(self.send({"ptz": [100, -3, 2.5]}), {"ok": True})
+        self.assertTrue(self.changed.is_set())
+        self.assertEqual(self.send({"press": "memory-recall", "params": {"mem": 2}}), {"ok": True})
+        self.assertTrue(self.changed.is_set())
+        self.assertEqual(self.remote_inputs.snapshot(), ((24, -3, 2), {"memory-recall": {"mem": 2}}, False))
+
+        self.assertEqual(self.send({"release": "memory-recall"}), {"ok": True})
+        self.assertEqual(self.send({"action": "auto-focus"}), {"ok": True})
+        # A pulse is seen by one snapshot only
+        self.assertEqual(self.remote_inputs.snapshot(), ((24, -3, 2), {"auto-focus": {}}, True))
+        self.assertEqual(self.remote_inputs.snapshot(), ((24, -3, 2), {}, False))
+
+    def test_tcp_errors(self):
+        self.assertEqual(self.send({"action": "zoom-in"}), {"error": "unknown action zoom-in"})
+        self.assertEqual(self.send({"press": "memory-recall", "params": {"speed": 2}}),
+                         {"error": "unknown parameter speed of memory-recall"})
+        self.assertFalse(self.changed.is_set())
+
+        for line in (b'{"ptz": [Infinity, 0, 0]}\n', b'{"ptz": [0, NaN, 0]}\n'):
+            self.connection.sendall(line)
+            self.assertEqual(json.loads(self.replies.readline().decode('utf-8')), {"error": "ptz values must be finite"})
+        self.assertEqual(self.remote_inputs.snapshot(), ((0, 0, 0), {}, False))
+
+        replies = [self.send({"action": "auto-focus"}) for _ in range(8)]
+        self.assertEqual(replies[-1], {"error": "rate limited"})
+
+    def test_inputs_released_on_close(self):
+        self.send({"press": "memory-recall", "params": {"mem": 1}})
+        self.changed.clear()
+        self.replies.close()
+        self.connection.close()
+        self.assertTrue(self.changed.wait(2.0))
+        self.assertEqual(self.wait_for_snapshot(((0, 0, 0), {}, False)), ((0, 0, 0), {}, False))
+
+    def test_udp(self):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.settimeout(2.0)
+        try:
+            client.sendto(b'{"ptz": [0, 0, -4]}', ('127.0.0.1', self.server.port))
+            self.assertEqual(self.wait_for_snapshot(((0, 0, -4), {}, False)), ((0, 0, -4), {}, False))
+
+            client.sendto(b'garbage', ('127.0.0.1', self.server.port))
+            self.assertIn('error', json.loads(client.recvfrom(1024)[0].decode('utf-8')))
+
+            # Released when the client stops sending
+            self.assertEqual(self.wait_for_snapshot(((0, 0, 0), {}, False)), ((0, 0, 0), {}, False))
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2
+
+"""Feeds packed input structs to the evdev_input devices through FIFOs."""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pygame
+
+import evdev_input
+from evdev_input import INPUT_EVENT, JS_EVENT
+
+
+class DeviceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'input.fifo')
+        os.mkfifo(self.path)
+        self.devices = []
+
+    def tearDown(self):
+        for device in self.devices:
+            device.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        os.write(fd, data)
+        os.close(fd)
+
+    def test_keyboard(self):
+        keyboard = evdev_input.KeyboardDevice(self.path)
+        self.devices.append(keyboard)
+        self.write(
+            INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 75, evdev_input.KEY_PRESS)
+            # Autorepeat, a key without a name and an event of another type
+            + INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 75, 2)
+            + INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 0x2FF, evdev_input.KEY_PRESS)
+            + INPUT_EVENT.pack(0, 0, 0x03, 75, 1)
+            # Split over two reads
+            + INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 75, evdev_input.KEY_RELEASE)[:5]
+        )
+        events = keyboard.read_events()
+        self.write(INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 75, evdev_input.KEY_RELEASE)[5:])
+        events += keyboard.read_events()
+
+        self.assertEqual([(event.type, event.key) for event in events], [
+            (pygame.KEYDOWN, pygame.K_KP4),
+            (pygame.KEYUP, pygame.K_KP4),
+        ])
+
+    def test_joystick(self):
+        # Two axes and a hat
+        joystick = evdev_input.JoystickDevice(self.path, 0, name='pad', num_axes=4, num_buttons=2, num_hats=1)
+        self.devices.append(joystick)
+        self.write(
+            JS_EVENT.pack(0, 1, evdev_input.JS_EVENT_BUTTON | evdev_input.JS_EVENT_INIT, 1)
+            + JS_EVENT.pack(0, -16384, evdev_input.JS_EVENT_AXIS, 1)
+            + JS_EVENT.pack(0, -32767, evdev_input.JS_EVENT_AXIS, 3)
+            + JS_EVENT.pack(0, 0, evdev_input.JS_EVENT_BUTTON, 1)
+        )
+        events = joystick.read_events()
+
+        self.assertEqual(joystick.num_axes, 2)
+        self.assertEqual(joystick.num_hats, 1)
+        self.assertEqual([event.type for event in events], [
+            pygame.JOYBUTTONDOWN, pygame.JOYAXISMOTION, pygame.JOYHATMOTION, pygame.JOYBUTTONUP,
+        ])
+        self.assertEqual(events[0].button, 1)
+        self.assertEqual((events[1].axis, events[1].value), (1, -0.5))
+        # Negative y is up
+        self.assertEqual((events[2].hat, events[2].value), (0, (0, 1)))
+
+    def test_fifo_without_writer(self):
+        keyboard = evdev_input.KeyboardDevice(self.path)
+        self.devices.append(keyboard)
+        # Neither before the first writer nor after the last one is the end of the file
+        self.assertEqual(keyboard.read_events(), [])
+        self.write(INPUT_EVENT.pack(0, 0, evdev_input.EV_KEY, 75, evdev_input.KEY_PRESS))
+        self.assertEqual(len(keyboard.read_events()), 1)
+        self.assertEqual(keyboard.read_events(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python2
+
+"""Runs UdpTransport against the simulated camera of simulator.py."""
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+import socket
+import threading
+import time
+import unittest
+
+import simulator
+from visca import UdpTransport, ViscaError
+
+
+def free_udp_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+class UdpTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.camera = simulator.SimulatedCamera(ack_delay=0.001, completion_delay=0.005, recall_delay=0.05)
+        port = free_udp_port()
+        server = threading.Thread(target=simulator.serve_udp, args=(self.camera, port))
+        server.daemon = True
+        server.start()
+
+        self.transport = UdpTransport('127.0.0.1', port, timeout=0.2, completion_timeout=2.0)
+        # The server thread may not be listening yet
+        deadline = time.time() + 2.0
+        while True:
+            try:
+                self.transport.reconnect()
+                break
+            except ViscaError:
+                if time.time() > deadline:
+                    raise
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_pan_tilt(self):
+        self.transport.pan_tilt(1, 10, -5, blocking=True)
+        time.sleep(0.1)
+        self.transport.pan_tilt(1, 0, 0, blocking=True)
+
+        pan, tilt = self.transport.get_pan_tilt_position(1)
+        self.assertGreater(pan, 0)
+        self.assertLess(tilt, 0)
+
+    def test_inquiry(self):
+        self.camera.zoom = 1234
+        self.assertEqual(self.transport.get_zoom_position(1), 1234)
+        self.assertEqual(self.camera.inquiry_count, 1)
+
+    def test_memory(self):
+        self.camera.pan, self.camera.tilt = 300.0, -200.0
+        self.transport.set_memory(1, 2, blocking=True)
+        self.camera.pan, self.camera.tilt = 0.0, 0.0
+
+        self.transport.recall_memory(1, 2, blocking=True)
+        self.assertEqual(self.transport.get_pan_tilt_position(1), (300, -200))
+
+
+if __name__ == '__main__':
+    unittest.main()
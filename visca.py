@@ -0,0 +1,685 @@
+#!/usr/bin/env python2
+
+from __future__ import division, absolute_import, unicode_literals, print_function
+
+from collections import deque
+import socket
+import struct
+import threading
+import time
+
+import serial
+
+# Pan and tilt directions
+PAN_LEFT = 0x01
+PAN_RIGHT = 0x02
+TILT_UP = 0x01
+TILT_DOWN = 0x02
+PAN_TILT_STOP = 0x03
+
+# Limits for visca commands
+MAX_PAN_SPEED = 0x18
+MAX_TILT_SPEED = 0x14
+MAX_ZOOM_SPEED = 0x07
+MAX_FOCUS_SPEED = 0x07
+
+# Commands a camera executes at the same time
+CAMERA_SOCKETS = 2
+
+# Reply types
+REPLY_ACK = 0x40
+REPLY_COMPLETION = 0x50
+REPLY_ERROR = 0x60
+
+# Error codes of error replies
+ERROR_SYNTAX = 0x02
+ERROR_NOT_EXECUTABLE = 0x41
+
+# VISCA over IP
+VISCA_UDP_PORT = 52381
+PAYLOAD_COMMAND = 0x0100
+PAYLOAD_INQUIRY = 0x0110
+PAYLOAD_REPLY = 0x0111
+PAYLOAD_CONTROL_COMMAND = 0x0200
+PAYLOAD_CONTROL_REPLY = 0x0201
+
+ZOOM_ACTIONS = {"stop": 0x00, "tele": 0x20, "wide": 0x30}
+FOCUS_ACTIONS = {"stop": 0x00, "far": 0x20, "near": 0x30}
+FOCUS_MODES = {"auto": 0x02, "manual": 0x03}
+WB_MODES = {"auto": 0x00, "indoor": 0x01, "outdoor": 0x02, "onepush": 0x03, "manual": 0x05}
+GAIN_ACTIONS = {"reset": 0x00, "up": 0x02, "down": 0x03}
+MEMORY_ACTIONS = {"reset": 0x00, "set": 0x01, "recall": 0x02}
+
+# Inquiries, replied with a completion on socket 0 carrying the data
+PAN_TILT_POSITION_INQUIRY = bytearray([0x09, 0x06, 0x12])
+ZOOM_POSITION_INQUIRY = bytearray([0x09, 0x04, 0x47])
+FOCUS_POSITION_INQUIRY = bytearray([0x09, 0x04, 0x48])
+FOCUS_MODE_INQUIRY = bytearray([0x09, 0x04, 0x38])
+WB_MODE_INQUIRY = bytearray([0x09, 0x04, 0x35])
+POWER_INQUIRY = bytearray([0x09, 0x04, 0x00])
+
+
+class ViscaError(Exception):
+    pass
+
+
+class ViscaTimeout(ViscaError):
+    pass
+
+
+class CameraError(ViscaError):
+    """Error reply of a camera, code is the error code of the reply."""
+
+    def __init__(self, device, code):
+        ViscaError.__init__(self, 'Camera {} error {:02x}'.format(device, code))
+        self.code = code
+
+
+def pan_tilt_packet(pan, tilt):
+    """Pan-tiltDrive, negative pan is left and negative tilt is up like in pysca."""
+    pan_direction = PAN_LEFT if pan < 0 else PAN_RIGHT if pan > 0 else PAN_TILT_STOP
+    tilt_direction = TILT_UP if tilt < 0 else TILT_DOWN if tilt > 0 else PAN_TILT_STOP
+    pan_speed = max(1, min(abs(int(pan)), MAX_PAN_SPEED))
+    tilt_speed = max(1, min(abs(int(tilt)), MAX_TILT_SPEED))
+    return bytearray([0x01, 0x06, 0x01, pan_speed, tilt_speed, pan_direction, tilt_direction])
+
+
+def zoom_packet(action, speed=None):
+    value = ZOOM_ACTIONS[action]
+    if value and speed is not None:
+        value |= max(0, min(int(speed), MAX_ZOOM_SPEED))
+    elif value:
+        # Standard speed tele and wide
+        value >>= 4
+    return bytearray([0x01, 0x04, 0x07, value])
+
+
+def focus_packet(action, speed=None):
+    value = FOCUS_ACTIONS[action]
+    if value and speed is not None:
+        value |= max(0, min(int(speed), MAX_FOCUS_SPEED))
+    elif value:
+        value >>= 4
+    return bytearray([0x01, 0x04, 0x08, value])
+
+
+def focus_mode_packet(mode):
+    if mode == "trigger":
+        # One push trigger
+        return bytearray([0x01, 0x04, 0x18, 0x01])
+    return bytearray([0x01, 0x04, 0x38, FOCUS_MODES[mode]])
+
+
+def wb_mode_packet(mode):
+    return bytearray([0x01, 0x04, 0x35, WB_MODES[mode]])
+
+
+def red_gain_packet(action):
+    return bytearray([0x01, 0x04, 0x03, GAIN_ACTIONS[action]])
+
+
+def blue_gain_packet(action):
+    return bytearray([0x01, 0x04, 0x04, GAIN_ACTIONS[action]])
+
+
+def memory_packet(action, mem):
+    return bytearray([0x01, 0x04, 0x3F, MEMORY_ACTIONS[action], mem & 0x7F])
+
+
+def power_packet(on):
+    return bytearray([0x01, 0x04, 0x00, 0x02 if on else 0x03])
+
+
+def decode_position(data, signed=False):
+    """Value of a position sent as one nibble per byte, most significant first."""
+    value = 0
+    for byte in data:
+        value = (value << 4) | (byte & 0x0F)
+    if signed and value & (1 << (4 * len(data) - 1)):
+        value -= 1 << (4 * len(data))
+    return value
+
+
+def command_packet(device, payload):
+    return bytearray([0x80 | device]) + payload + bytearray([0xFF])
+
+
+class Transport(object):
+    """Camera commands with the same signatures as the pysca functions.
+
+    Subclasses implement send() which transmits the payload of one command
+    to the camera at the given address, and inquire() which returns the
+    data of the reply to an inquiry.
+    """
+
+    def send(self, device, payload, blocking=False):
+        raise NotImplementedError()
+
+    def inquire(self, device, payload):
+        raise NotImplementedError()
+
+    def inquire_data(self, device, payload, length):
+        data = self.inquire(device, payload)
+        if len(data) < length:
+            raise ViscaError('Short inquiry reply from camera {}'.format(device))
+        return data
+
+    def get_pan_tilt_position(self, device):
+        """Return (pan, tilt), negative pan is left and negative tilt is up."""
+        data = self.inquire_data(device, PAN_TILT_POSITION_INQUIRY, 8)
+        return decode_position(data[0:4], signed=True), decode_position(data[4:8], signed=True)
+
+    def get_zoom_position(self, device):
+        return decode_position(self.inquire_data(device, ZOOM_POSITION_INQUIRY, 4)[0:4])
+
+    def get_focus_position(self, device):
+        return decode_position(self.inquire_data(device, FOCUS_POSITION_INQUIRY, 4)[0:4])
+
+    def get_focus_mode(self, device):
+        value = self.inquire_data(device, FOCUS_MODE_INQUIRY, 1)[0]
+        return dict((v, k) for k, v in FOCUS_MODES.items()).get(value)
+
+    def get_wb_mode(self, device):
+        value = self.inquire_data(device, WB_MODE_INQUIRY, 1)[0]
+        return dict((v, k) for k, v in WB_MODES.items()).get(value)
+
+    def get_power(self, device):
+        return self.inquire_data(device, POWER_INQUIRY, 1)[0] == 0x02
+
+    def set_power_on(self, device, on, blocking=False):
+        self.send(device, power_packet(on), blocking)
+
+    def pan_tilt(self, device, pan=0, tilt=0, blocking=False):
+        self.send(device, pan_tilt_packet(pan, tilt), blocking)
+
+    def zoom(self, device, action, speed=None, blocking=False):
+        self.send(device, zoom_packet(action, speed), blocking)
+
+    def focus(self, device, action, speed=None, blocking=False):
+        self.send(device, focus_packet(action, speed), blocking)
+
+    def set_focus_mode(self, device, mode, blocking=False):
+        self.send(device, focus_mode_packet(mode), blocking)
+
+    def set_wb_mode(self, device, mode, blocking=False):
+        self.send(device, wb_mode_packet(mode), blocking)
+
+    def set_red_gain(self, device, action, blocking=False):
+        self.send(device, red_gain_packet(action), blocking)
+
+    def set_blue_gain(self, device, action, blocking=False):
+        self.send(device, blue_gain_packet(action), blocking)
+
+    def set_memory(self, device, mem, blocking=False):
+        self.send(device, memory_packet("set", mem), blocking)
+
+    def recall_memory(self, device, mem, blocking=False):
+        self.send(device, memory_packet("recall", mem), blocking)
+
+
+class SerialTransport(Transport):
+    """VISCA over a serial port.
+
+    Unlike pysca which keeps a single module level connection, every
+    instance owns its own port so several ports can be driven in parallel.
+    The ACK must arrive within timeout and the completion of a blocking
+    command within completion_timeout seconds, otherwise ViscaError is
+    raised.
+
+    With pipelined a reader thread handles the replies, and up to two
+    commands per camera are executing at the same time, one on each
+    command socket of the camera. Completions and errors are matched to
+    the command by the socket number given in its ACK, so a memory recall
+    still moving the camera does not hold back the next pan/tilt command.
+    Inquiries are answered on socket 0 in the order they were sent.
+    """
+
+    def __init__(self, port, baudrate=9600, timeout=1.0, completion_timeout=8.0, pipelined=False):
+        Transport.__init__(self)
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.completion_timeout = completion_timeout
+        self.pipelined = pipelined
+        self.serial = None
+        self.lock = threading.Lock()
+        # Time when the ACK to the latest command was received
+        self.ack_time = None
+
+        # Pipelined mode, SerialCommand waiting for the ACK by camera address
+        # and executing by (camera address, socket number)
+        self.replies = threading.Condition()
+        self.unacked = {}
+        self.executing = {}
+        # Inquiries waiting for the reply by camera address
+        self.inquiries = {}
+        self.reader_thread = None
+        # Errors of commands which were not waited for
+        self.late_error_count = 0
+
+    def open_serial(self):
+        return serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+
+    def connect(self):
+        self.serial = self.open_serial()
+        if self.pipelined:
+            self.reader_thread = threading.Thread(
+                target=self._reader, args=(self.serial,), name='visca-serial-reader-thread')
+            self.reader_thread.daemon = True
+            self.reader_thread.start()
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+        self.fail_pending()
+
+    def reconnect(self):
+        # Waits for a command being sent to finish or fail
+        with self.lock:
+            self.close()
+            self.connect()
+
+    def disconnect(self):
+        with self.lock:
+            self.close()
+
+    def abort(self):
+        # Without the lock, makes a send stuck on a hung port fail
+        serial_port = self.serial
+        if serial_port is not None:
+            serial_port.close()
+        self.fail_pending()
+
+    def fail_pending(self):
+        with self.replies:
+            for unacked in self.unacked.values():
+                for command in unacked:
+                    command.closed = True
+            for command in self.executing.values():
+                command.closed = True
+            for inquiries in self.inquiries.values():
+                for inquiry in inquiries:
+                    inquiry.closed = True
+            self.unacked = {}
+            self.executing = {}
+            self.inquiries = {}
+            self.replies.notify_all()
+
+    def read_reply(self, deadline):
+        reply = bytearray()
+        while True:
+            if time.time() > deadline:
+                raise ViscaTimeout('Timeout waiting for reply from {}'.format(self.port))
+            # An empty read only means that no byte arrived within the port timeout
+            data = self.serial.read(1)
+            if not data:
+                continue
+            reply += bytearray(data)
+            if reply[-1] == 0xFF:
+                return reply
+
+    def send(self, device, payload, blocking=False):
+        if self.pipelined:
+            self._send_pipelined(device, payload, blocking)
+            return
+
+        with self.lock:
+            if self.serial is None:
+                raise ViscaError('{} is not connected'.format(self.port))
+            self.serial.write(command_packet(device, payload))
+
+            # Wait for ACK, and with blocking also for completion of the command.
+            # A completion before the ACK belongs to an earlier non blocking command.
+            acked = False
+            deadline = time.time() + self.timeout
+            while True:
+                # Replies to other cameras must not keep the exchange going forever
+                reply = self.read_reply(deadline)
+                if len(reply) < 3 or reply[0] >> 4 != device + 8:
+                    # Reply to another camera or garbage
+                    continue
+                reply_type = reply[1] & 0xF0
+                if reply_type == REPLY_ERROR:
+                    raise CameraError(device, reply[2])
+                if reply_type == REPLY_ACK:
+                    acked = True
+                    self.ack_time = time.time()
+                    if not blocking:
+                        return
+                    deadline = self.ack_time + self.completion_timeout
+                elif reply_type == REPLY_COMPLETION and acked:
+                    return
+
+    def inquire(self, device, payload):
+        if self.pipelined:
+            return self._inquire_pipelined(device, payload)
+
+        with self.lock:
+            if self.serial is None:
+                raise ViscaError('{} is not connected'.format(self.port))
+            self.serial.write(command_packet(device, payload))
+
+            deadline = time.time() + self.timeout
+            while True:
+                reply = self.read_reply(deadline)
+                if len(reply) < 3 or reply[0] >> 4 != device + 8:
+                    continue
+                # Replies on sockets 1 and 2 belong to earlier non blocking commands
+                if reply[1] == REPLY_ERROR:
+                    raise CameraError(device, reply[2])
+                if reply[1] == REPLY_COMPLETION:
+                    return reply[2:-1]
+
+    def count_busy_sockets(self, device):
+        return len(self.unacked.get(device, ())) + sum(1 for address, _ in self.executing if address == device)
+
+    def _send_pipelined(self, device, payload, blocking):
+        command = SerialCommand(device)
+
+        with self.replies:
+            # The camera answers a third command with a buffer full error
+            deadline = time.time() + self.completion_timeout
+            while self.count_busy_sockets(device) >= CAMERA_SOCKETS:
+                if time.time() >= deadline:
+                    raise ViscaError('No free command socket on camera {}'.format(device))
+                self.replies.wait(deadline - time.time())
+
+        with self.lock:
+            if self.serial is None:
+                raise ViscaError('{} is not connected'.format(self.port))
+            with self.replies:
+                # ACKs come in the order of the commands
+                self.unacked.setdefault(device, deque()).append(command)
+            self.serial.write(command_packet(device, payload))
+
+        try:
+            self.wait_for(command, 'ACK', time.time() + self.timeout)
+            self.ack_time = command.ack_time
+            if blocking:
+                self.wait_for(command, 'completion', command.ack_time + self.completion_timeout)
+        finally:
+            command.returned = True
+
+    def _inquire_pipelined(self, device, payload):
+        inquiry = SerialCommand(device)
+
+        with self.lock:
+            if self.serial is None:
+                raise ViscaError('{} is not connected'.format(self.port))
+            with self.replies:
+                self.inquiries.setdefault(device, deque()).append(inquiry)
+            self.serial.write(command_packet(device, payload))
+
+        try:
+            self.wait_for(inquiry, 'inquiry reply', time.time() + self.timeout)
+        finally:
+            inquiry.returned = True
+        return inquiry.data
+
+    def wait_for(self, command, reply_name, deadline):
+        with self.replies:
+            while command.error is None and not command.closed:
+                if command.completed or (command.acked and reply_name == 'ACK'):
+                    return
+                if time.time() >= deadline:
+                    self.forget(command)
+                    raise ViscaTimeout('Timeout waiting for {} from camera {} on {}'.format(
+                        reply_name, command.device, self.port))
+                self.replies.wait(deadline - time.time())
+
+        if command.closed:
+            raise ViscaError('{} was closed'.format(self.port))
+        raise CameraError(command.device, command.error)
+
+    def forget(self, command):
+        for waiting in (self.unacked.get(command.device), self.inquiries.get(command.device)):
+            if waiting and command in waiting:
+                waiting.remove(command)
+        if self.executing.get((command.device, command.socket)) is command:
+            del self.executing[(command.device, command.socket)]
+
+    def _reader(self, serial_port):
+        reply = bytearray()
+        # Ends when the port is closed or reopened
+        while self.serial is serial_port:
+            try:
+                data = serial_port.read(1)
+            except Exception:
+                break
+            if not data:
+                continue
+            reply += bytearray(data)
+            if reply[-1] == 0xFF:
+                self.handle_reply(reply)
+                reply = bytearray()
+
+    def handle_reply(self, reply):
+        if len(reply) < 3:
+            return
+        device = (reply[0] >> 4) - 8
+        reply_type = reply[1] & 0xF0
+        socket_number = reply[1] & 0x0F
+
+        with self.replies:
+            command = None
+            if reply_type == REPLY_ACK:
+                unacked = self.unacked.get(device)
+                if unacked:
+                    command = unacked.popleft()
+                    command.acked = True
+                    command.ack_time = time.time()
+                    command.socket = socket_number
+                    self.executing[(device, socket_number)] = command
+            elif reply_type == REPLY_COMPLETION and socket_number:
+                command = self.executing.pop((device, socket_number), None)
+                if command is not None:
+                    command.completed = True
+            elif reply_type == REPLY_COMPLETION:
+                # Inquiry reply
+                if self.inquiries.get(device):
+                    command = self.inquiries[device].popleft()
+                    command.data = reply[2:-1]
+                    command.completed = True
+            elif reply_type == REPLY_ERROR:
+                if socket_number:
+                    command = self.executing.pop((device, socket_number), None)
+                if command is None and self.unacked.get(device):
+                    # Syntax error or buffer full instead of the ACK
+                    command = self.unacked[device].popleft()
+                if command is None and self.inquiries.get(device):
+                    command = self.inquiries[device].popleft()
+                if command is not None:
+                    command.error = reply[2]
+                    if command.returned:
+                        self.late_error_count += 1
+                        print('Camera {} error {:02x} on socket {}'.format(device, reply[2], socket_number))
+            self.replies.notify_all()
+
+
+class SerialCommand(object):
+    __slots__ = ('device', 'socket', 'acked', 'completed', 'error', 'closed', 'returned', 'ack_time', 'data')
+
+    def __init__(self, device):
+        self.device = device
+        self.socket = None
+        # Data of an inquiry reply
+        self.data = None
+        self.ack_time = None
+        self.acked = False
+        self.completed = False
+        self.error = None
+        self.closed = False
+        # Set when send() no longer waits for the replies
+        self.returned = False
+
+
+class PendingCommand(object):
+    __slots__ = ('acked', 'completed', 'error', 'ack_time', 'data')
+
+    def __init__(self):
+        self.ack_time = None
+        self.acked = False
+        self.completed = False
+        self.error = None
+        self.data = None
+
+
+class UdpTransport(Transport):
+    """VISCA over IP.
+
+    Every packet has an 8 byte header with the payload type, payload length
+    and a sequence number, and replies are matched to commands by the
+    sequence number. A receiver thread handles the replies, so several
+    commands can be outstanding at the same time. A command is retransmitted
+    if it is not acknowledged within the timeout, and the completion of a
+    blocking command must arrive within completion_timeout seconds.
+    """
+
+    def __init__(self, host, port=VISCA_UDP_PORT, timeout=0.1, retries=3, completion_timeout=8.0):
+        Transport.__init__(self)
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.completion_timeout = completion_timeout
+
+        self.socket = None
+        self.sequence_number = 0
+        # PendingCommand by sequence number
+        self.pending = {}
+        self.lock = threading.Condition()
+        self.receiver_thread = None
+        self.keep_running = False
+        self.ack_time = None
+
+    def connect(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect((self.host, self.port))
+        # Lets the receiver thread notice when the transport is closed
+        self.socket.settimeout(0.5)
+        self.keep_running = True
+        self.receiver_thread = threading.Thread(target=self._receiver, name='visca-udp-receiver-thread')
+        self.receiver_thread.daemon = True
+        self.receiver_thread.start()
+
+        # Camera expects the sequence numbers to start from zero after reset
+        self._send_packet(PAYLOAD_CONTROL_COMMAND, bytearray([0x01]), blocking=False)
+        with self.lock:
+            self.sequence_number = 0
+
+    def close(self):
+        self.keep_running = False
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def reconnect(self):
+        self.close()
+        if self.receiver_thread is not None:
+            self.receiver_thread.join(1.0)
+        self.connect()
+
+    def disconnect(self):
+        self.close()
+
+    def abort(self):
+        # Senders waiting for a completion notice keep_running
+        with self.lock:
+            self.keep_running = False
+            self.lock.notify_all()
+
+    def send(self, device, payload, blocking=False):
+        self._send_packet(PAYLOAD_COMMAND, command_packet(device, payload), blocking)
+
+    def inquire(self, device, payload):
+        return self._send_packet(PAYLOAD_INQUIRY, command_packet(device, payload), blocking=True)
+
+    def _send_packet(self, payload_type, payload, blocking):
+        udp_socket = self.socket
+        if udp_socket is None:
+            raise ViscaError('{}:{} is not connected'.format(self.host, self.port))
+        with self.lock:
+            sequence_number = self.sequence_number
+            self.sequence_number = (self.sequence_number + 1) & 0xFFFFFFFF
+            pending = PendingCommand()
+            self.pending[sequence_number] = pending
+
+        packet = bytearray(struct.pack(str('>HHI'), payload_type, len(payload), sequence_number)) + payload
+
+        try:
+            for _ in range(0, self.retries + 1):
+                udp_socket.send(packet)
+                deadline = time.time() + self.timeout
+                with self.lock:
+                    while not pending.acked and pending.error is None and time.time() < deadline:
+                        self.lock.wait(deadline - time.time())
+                if pending.acked or pending.error is not None:
+                    self.ack_time = pending.ack_time
+                    break
+            else:
+                raise ViscaTimeout('Timeout waiting for ACK from {}:{}'.format(self.host, self.port))
+
+            deadline = time.time() + self.completion_timeout
+            with self.lock:
+                while blocking and not pending.completed and pending.error is None:
+                    if not self.keep_running:
+                        raise ViscaError('Connection to {}:{} closed'.format(self.host, self.port))
+                    if time.time() >= deadline:
+                        raise ViscaTimeout('Timeout waiting for completion from {}:{}'.format(self.host, self.port))
+                    self.lock.wait(min(self.timeout, deadline - time.time()))
+
+            if pending.error is not None:
+                raise CameraError(self.host, pending.error)
+            return pending.data
+        finally:
+            with self.lock:
+                del self.pending[sequence_number]
+
+    def _receiver(self):
+        while self.keep_running:
+            udp_socket = self.socket
+            if udp_socket is None:
+                break
+            try:
+                data = bytearray(udp_socket.recv(1024))
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                if not self.keep_running:
+                    # Closed by close()
+                    break
+                # For example port unreachable while the camera is off, the next reply may arrive
+                print('Receiving from {}:{} failed: {}'.format(self.host, self.port, e))
+                continue
+
+            if len(data) < 8:
+                continue
+            payload_type, length, sequence_number = struct.unpack(str('>HHI'), bytes(data[:8]))
+            reply = data[8:8 + length]
+
+            with self.lock:
+                pending = self.pending.get(sequence_number)
+                if pending is None:
+                    continue
+
+                if payload_type == PAYLOAD_CONTROL_REPLY:
+                    pending.acked = True
+                    pending.completed = True
+                elif payload_type == PAYLOAD_REPLY and len(reply) >= 3:
+                    reply_type = reply[1] & 0xF0
+                    if reply_type == REPLY_ACK:
+                        pending.acked = True
+                        pending.ack_time = time.time()
+                    elif reply_type == REPLY_COMPLETION:
+                        if not pending.acked:
+                            # Inquiry replies come without an ACK
+                            pending.acked = True
+                            pending.ack_time = time.time()
+                        pending.data = reply[2:-1]
+                        pending.completed = True
+                    elif reply_type == REPLY_ERROR:
+                        pending.error = reply[2]
+                self.lock.notify_all()
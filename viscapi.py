@@ -2,16 +2,34 @@
 
 from __future__ import division, absolute_import, unicode_literals, print_function
 
-import copy
 import os
 import signal
 import threading
+import time
+from array import array
 
 import json
 from numpy import clip
 import pygame
 from pysca import pysca
 
+from action_engine import ActionEngine
+from control_server import ControlServer, RemoteInputs
+from command_queue import CommandQueue, PRIORITY_STOP, PRIORITY_MOTION, PRIORITY_LENS, PRIORITY_IMAGE, PRIORITY_IDLE
+import evdev_input
+from hotplug import DeviceMonitor, FileMonitor
+from inquiry_poller import CameraState, InquiryPoller
+from link_watchdog import LinkWatchdog
+from metrics import LatencyStats, MetricsServer, latency_family
+from recorder import EventRecorder
+from response_curves import SensitivityTable, SpeedTable, axis_index, get_curve, sensitivity_row
+from simulator import SimulatedTransport
+from state_feed import StateFeed
+from visca import SerialTransport, UdpTransport, ViscaError, VISCA_UDP_PORT
+
+SETTINGS_FILE = 'configs/viscapi.json'
+CONFIG_FILES = 'configs/*.json'
+
 # JSON keywords
 CONFIG_BUTTONS = 'buttons'
 CONFIG_KEYS = 'keys'
@@ -64,6 +82,8 @@ ZOOM_AXIS_ON = 'zoom-axis-on'
 ZOOM_AXIS_OFF = 'zoom-axis-off'
 ZOOM_AXIS_TOGGLE = 'zoom-axis-toggle'
 
+CAMERA_SELECT = 'camera-select'
+
 # Axes
 PAN_AXIS = 'pan-axis'
 TILT_AXIS = 'tilt-axis'
@@ -86,6 +106,135 @@ PAN_AXIS_DEAD_ZONE = 'pan-axis-dead-zone'
 TILT_AXIS_DEAD_ZONE = 'tilt-axis-dead-zone'
 ZOOM_AXIS_DEAD_ZONE = 'zoom-axis-dead-zone'
 SENSITIVITY_AXIS_DEAD_ZONE = 'sensitivity-axis-dead-zone'
+PAN_AXIS_CURVE = 'pan-axis-curve'
+TILT_AXIS_CURVE = 'tilt-axis-curve'
+ZOOM_AXIS_CURVE = 'zoom-axis-curve'
+SENSITIVITY_AXIS_CURVE = 'sensitivity-axis-curve'
+
+# Settings
+LOOP_MODE = 'loop-mode'
+LOOP_MODE_POLL = 'poll'
+LOOP_MODE_EVENT = 'event'
+POLL_RATE = 'poll-rate'
+MAX_RATE = 'max-rate'
+IDLE_TIMEOUT = 'idle-timeout'
+COMMAND_QUEUE_SIZE = 'command-queue-size'
+RECORD_FILE = 'record-file'
+INPUT_BACKEND = 'input-backend'
+INPUT_BACKEND_PYGAME = 'pygame'
+INPUT_BACKEND_EVDEV = 'evdev'
+JOYSTICK_DEVICES = 'joystick-devices'
+KEYBOARD_DEVICES = 'keyboard-devices'
+DEVICE_POLL_INTERVAL = 'device-poll-interval'
+WATCHDOG_TIMEOUT = 'watchdog-timeout'
+WATCHDOG_ERRORS = 'watchdog-errors'
+REPEAT_RATES = 'repeat-rates'
+REPEAT_DELAY = 'repeat-delay'
+INQUIRY_INTERVAL = 'inquiry-interval'
+CONTROL_HOST = 'control-host'
+CONTROL_PORT = 'control-port'
+CONTROL_RATE = 'control-rate'
+CONTROL_TIMEOUT = 'control-timeout'
+CONFIG_RELOAD = 'config-reload'
+METRICS_HOST = 'metrics-host'
+METRICS_PORT = 'metrics-port'
+STATE_SOCKET = 'state-socket'
+STATE_INTERVAL = 'state-interval'
+ROUTES = 'routes'
+ROUTE_NAME = 'name'
+ROUTE_CAMERA = 'camera'
+ROUTE_JOYSTICKS = 'joysticks'
+ROUTE_KEYBOARD = 'keyboard'
+ROUTE_REMOTE = 'remote'
+CAMERAS = 'cameras'
+CAMERA_NAME = 'name'
+CAMERA_PORT = 'port'
+CAMERA_ADDRESS = 'address'
+CAMERA_TRANSPORT = 'transport'
+CAMERA_BAUDRATE = 'baudrate'
+CAMERA_HOST = 'host'
+CAMERA_TIMEOUT = 'timeout'
+CAMERA_ACK_DELAY = 'ack-delay'
+CAMERA_COMPLETION_DELAY = 'completion-delay'
+CAMERA_COMPLETION_TIMEOUT = 'completion-timeout'
+CAMERA_BANDWIDTH = 'bandwidth'
+CAMERA_PIPELINED = 'pipelined'
+CAMERA_TELE_SPEED_SCALE = 'tele-speed-scale'
+CAMERA_ZOOM_MAX = 'zoom-max'
+
+# Transports
+TRANSPORT_PYSCA = 'pysca'
+TRANSPORT_SERIAL = 'serial'
+TRANSPORT_UDP = 'udp'
+TRANSPORT_SIMULATOR = 'simulator'
+
+DEFAULT_CAMERA = {
+    CAMERA_NAME: 'camera',
+    CAMERA_PORT: '/dev/ttyUSB0',
+    CAMERA_ADDRESS: 1,
+    CAMERA_TRANSPORT: TRANSPORT_SERIAL,
+}
+
+# All controllers drive the selected camera together
+DEFAULT_ROUTE = {
+    ROUTE_NAME: 'all',
+    ROUTE_CAMERA: 0,
+    ROUTE_KEYBOARD: True,
+    ROUTE_REMOTE: True,
+}
+
+# Keys of continuous commands in the command queue
+PAN_TILT_COMMAND = 'pan-tilt'
+ZOOM_COMMAND = 'zoom'
+FOCUS_COMMAND = 'focus'
+
+# Priority classes of the commands, stops of moves have PRIORITY_STOP
+COMMAND_PRIORITIES = {
+    'pan_tilt': PRIORITY_MOTION,
+    'recall_memory': PRIORITY_MOTION,
+    'zoom': PRIORITY_LENS,
+    'focus': PRIORITY_LENS,
+    'set_focus_mode': PRIORITY_LENS,
+    'set_power_on': PRIORITY_LENS,
+    'set_wb_mode': PRIORITY_IMAGE,
+    'set_red_gain': PRIORITY_IMAGE,
+    'set_blue_gain': PRIORITY_IMAGE,
+    'set_memory': PRIORITY_IMAGE,
+    'inquire': PRIORITY_IDLE,
+}
+
+# Bytes of the commands and their ACK and completion on the link
+COMMAND_BYTES = {
+    'pan_tilt': 15,
+    'recall_memory': 13,
+    'set_memory': 13,
+    'inquire': 16,
+}
+
+# Repeats per second of actions held down, other actions fire once per press
+DEFAULT_REPEAT_RATES = {
+    WB_RED_PLUS: 5.0,
+    WB_RED_MINUS: 5.0,
+    WB_BLUE_PLUS: 5.0,
+    WB_BLUE_MINUS: 5.0,
+}
+
+# Continuous actions sent again to a newly selected camera while held
+CONTINUOUS_ACTIONS = (ZOOM_IN, ZOOM_OUT, FOCUS_FAR, FOCUS_NEAR)
+
+# Integer parameters of the actions accepted from network clients, continuous
+# pan, tilt and zoom speeds are sent as ptz vectors instead of actions
+REMOTE_ACTION_PARAMS = {
+    MEMORY_SET: ('mem',),
+    MEMORY_RECALL: ('mem',),
+    CAMERA_SELECT: ('camera', 'route'),
+}
+for action in (
+        AUTO_FOCUS, FOCUS_FAR, FOCUS_NEAR, FOCUS_STOP, AUTO_WB, WB_BLUE_PLUS, WB_BLUE_MINUS, WB_RED_PLUS,
+        WB_RED_MINUS, ZOOM_IN, ZOOM_OUT, ZOOM_STOP, TILT_INVERT_ON, TILT_INVERT_OFF, TILT_INVERT_TOGGLE,
+        PAN_INVERT_ON, PAN_INVERT_OFF, PAN_INVERT_TOGGLE, ZOOM_INVERT_ON, ZOOM_INVERT_OFF, ZOOM_INVERT_TOGGLE,
+        ZOOM_AXIS_ON, ZOOM_AXIS_OFF, ZOOM_AXIS_TOGGLE):
+    REMOTE_ACTION_PARAMS[action] = ()
 
 # Limits for visca commands
 MAX_PAN_VALUE = 24
@@ -95,19 +244,70 @@ MIN_TILT_VALUE = -18
 MAX_ZOOM_VALUE = 7
 MIN_ZOOM_VALUE = -7
 
+# Foo attributes holding the parameters of each joystick, with their key and default in the config
+JOYSTICK_PARAMETERS = (
+    ('param_pan_axis_multiplier', PAN_AXIS_MULTIPLIER, False),
+    ('param_tilt_axis_multiplier', TILT_AXIS_MULTIPLIER, False),
+    ('param_zoom_axis_multiplier', ZOOM_AXIS_MULTIPLIER, 1),
+    ('param_zoom_axis_enabled', ZOOM_AXIS_ENABLED, True),
+    ('param_invert_pan_axis', INVERT_PAN_AXIS, False),
+    ('param_invert_tilt_axis', INVERT_TILT_AXIS, False),
+    ('param_invert_zoom_axis', INVERT_ZOOM_AXIS, False),
+    ('param_invert_sensitivity_axis', INVERT_SENSITIVITY_AXIS, False),
+    ('param_pan_axis_dead_zone', PAN_AXIS_DEAD_ZONE, 0.1),
+    ('param_tilt_axis_dead_zone', TILT_AXIS_DEAD_ZONE, 0.1),
+    ('param_zoom_axis_dead_zone', ZOOM_AXIS_DEAD_ZONE, 0.1),
+    ('param_sensitivity_axis_dead_zone', SENSITIVITY_AXIS_DEAD_ZONE, 0.1),
+)
+# Parameters changed at runtime by actions, kept when the configs are reloaded
+TOGGLE_PARAMETERS = (
+    'param_invert_pan_axis',
+    'param_invert_tilt_axis',
+    'param_invert_zoom_axis',
+    'param_zoom_axis_enabled',
+)
+
+# Zoom positions are divided into this many steps for scaling pan/tilt speed
+ZOOM_SCALE_STEPS = 32
+# Older zoom positions are not used for scaling pan/tilt speed
+ZOOM_POSITION_MAX_AGE = 5.0
+
 
 class JoystickState(object):
+    """Joystick state stored in fixed size arrays.
+
+    Hats are stored flat as x and y values, hat i is at hats_value[2 * i] and
+    hats_value[2 * i + 1]. version is incremented on every change so that
+    snapshots can be refreshed without comparing the values.
+    """
+    __slots__ = ('axes_value', 'hats_value', 'buttons_value', 'version')
+
     def __init__(
             self,
             axes_value,
             hats_value,
             buttons_value,
     ):
-        object.__init__(self)
-
-        self.axes_value = axes_value
-        self.hats_value = hats_value
-        self.buttons_value = buttons_value
+        self.axes_value = array(str('d'), axes_value)
+        self.hats_value = array(str('b'), [value for hat in hats_value for value in hat])
+        self.buttons_value = array(str('b'), buttons_value)
+        self.version = 0
+
+    def copy(self):
+        state = JoystickState([], [], [])
+        state.axes_value.extend(self.axes_value)
+        state.hats_value.extend(self.hats_value)
+        state.buttons_value.extend(self.buttons_value)
+        state.version = self.version
+        return state
+
+    def copy_from(self, other):
+        # Slice assignment of equally sized arrays copies in place
+        if self.version != other.version:
+            self.axes_value[:] = other.axes_value
+            self.hats_value[:] = other.hats_value
+            self.buttons_value[:] = other.buttons_value
+            self.version = other.version
 
     def __eq__(self, other):
         if other is None:
@@ -123,20 +323,230 @@ class JoystickState(object):
         return not (self == other)
 
 
+def command_priority(name, args, kwargs):
+    if name == 'pan_tilt' and not kwargs.get('pan') and not kwargs.get('tilt'):
+        return PRIORITY_STOP
+    # args are the address and the action
+    if name in ('zoom', 'focus') and args[1:2] == ("stop",):
+        return PRIORITY_STOP
+    return COMMAND_PRIORITIES.get(name, PRIORITY_LENS)
+
+
+def compile_zoom_speed_table(max_value, tele_scale):
+    """Speeds scaled by the zoom, indexed by zoom step and by speed + max_value.
+
+    The speed at full telephoto is multiplied by tele_scale, and the scale
+    changes exponentially in between like the focal length does. Speeds
+    which are not zero stay at least 1.
+    """
+    table = []
+    for step in range(0, ZOOM_SCALE_STEPS + 1):
+        scale = tele_scale ** (step / ZOOM_SCALE_STEPS)
+        row = []
+        for value in range(-max_value, max_value + 1):
+            scaled = int(round(value * scale))
+            if value and not scaled:
+                scaled = 1 if value > 0 else -1
+            row.append(scaled)
+        table.append(row)
+    return table
+
+
+def compile_joystick_tables(parameters, values):
+    """Lookup tables of the sensitivity, pan, tilt and zoom axes of a joystick.
+
+    parameters are the parameters of the joystick config, values the
+    current values of JOYSTICK_PARAMETERS by config key, which differ from
+    the config when an axis has been inverted at runtime.
+    """
+    pan_axis_multiplier = values[PAN_AXIS_MULTIPLIER]
+    pan_invert_value = -1 if values[INVERT_PAN_AXIS] else 1
+
+    def pan_speed(value, sensitivity):
+        pan = int((1 + sensitivity * pan_axis_multiplier) * value)
+        return pan_invert_value * max(MIN_PAN_VALUE, min(pan, MAX_PAN_VALUE))
+
+    tilt_axis_multiplier = values[TILT_AXIS_MULTIPLIER]
+    tilt_invert_value = 1 if values[INVERT_TILT_AXIS] else -1
+
+    def tilt_speed(value, sensitivity):
+        tilt = int((1 + sensitivity * tilt_axis_multiplier) * value)
+        return tilt_invert_value * max(MIN_TILT_VALUE, min(tilt, MAX_TILT_VALUE))
+
+    zoom_axis_multiplier = values[ZOOM_AXIS_MULTIPLIER]
+    zoom_invert_value = -1 if values[INVERT_ZOOM_AXIS] else 1
+
+    def zoom_speed(value, sensitivity):
+        if value == 0.0:
+            return 0
+        zoom_value = value - 1.0 if value < 0 else value + 1.0
+        zoom = int(zoom_value + (sensitivity * zoom_axis_multiplier * value))
+        return zoom_invert_value * max(MIN_ZOOM_VALUE - 1, min(zoom, MAX_ZOOM_VALUE + 1))
+
+    return (
+        SensitivityTable(
+            values[SENSITIVITY_AXIS_DEAD_ZONE],
+            get_curve(parameters.get(SENSITIVITY_AXIS_CURVE, None)),
+            values[INVERT_SENSITIVITY_AXIS],
+        ),
+        SpeedTable(values[PAN_AXIS_DEAD_ZONE], get_curve(parameters.get(PAN_AXIS_CURVE, None)), pan_speed),
+        SpeedTable(values[TILT_AXIS_DEAD_ZONE], get_curve(parameters.get(TILT_AXIS_CURVE, None)), tilt_speed),
+        SpeedTable(values[ZOOM_AXIS_DEAD_ZONE], get_curve(parameters.get(ZOOM_AXIS_CURVE, None)), zoom_speed),
+    )
+
+
+class Camera(object):
+    """Camera at a VISCA address behind a transport.
+
+    Commands are put to the command queue of the port, which is shared by
+    all cameras daisy chained on the same port.
+    """
+
+    def __init__(self, name, link, address, transport, command_queue):
+        object.__init__(self)
+
+        self.name = name
+        self.link = link
+        self.address = address
+        self.transport = transport
+        self.command_queue = command_queue
+
+        # Zoom and focus drive are deduplicated by the command queue
+        self.wb_mode = "auto"
+        self.focus_mode = "auto"
+        # Memory last recalled, None if none since start
+        self.memory = None
+        # Position and modes reported by the camera, updated by the inquiry poller
+        self.state = CameraState()
+        # Pan and tilt speeds scaled by the zoom, None if not scaled
+        self.zoom_pan_speeds = None
+        self.zoom_tilt_speeds = None
+        self.zoom_max = 0x4000
+
+    def put(self, command, *args, **kwargs):
+        self.command_queue.put(getattr(self.transport, command), self.address, *args, **kwargs)
+
+    def put_latest(self, key, command, *args, **kwargs):
+        function = getattr(self.transport, command)
+        self.command_queue.put_latest((self.address, key), function, self.address, *args, **kwargs)
+
+
+class Route(object):
+    """Controllers driving one camera, with the action state of their own.
+
+    joysticks lists the names or indexes of the joysticks of the route,
+    None takes every joystick not listed by another route. The inputs of
+    the controllers of a route are merged like before, and the routes are
+    dispatched independently of each other, so that every operator keeps
+    their own held actions, repeats and zoom and focus state.
+    """
+
+    def __init__(self, name, camera, joysticks, keyboard, remote, handlers):
+        object.__init__(self)
+
+        self.name = name
+        # Index of the camera in Foo.cameras, changed by camera-select
+        self.camera = camera
+        self.joysticks = joysticks
+        self.keyboard = keyboard
+        self.remote = remote
+        # Indexes of the open joysticks of the route, updated when joysticks are reopened
+        self.joystick_indexes = []
+
+        self.action_engine = ActionEngine(handlers, DEFAULT_REPEAT_RATES)
+        self.zoom_active = False
+        self.focus_active = False
+        # Pan and tilt of the latest frame before scaling by the zoom
+        self.unscaled_pan_tilt = None
+        # Pan and tilt put to the camera by the route, an idle route does not keep sending stops
+        self.pan_tilt = None
+
+
+class Binding(object):
+    """Action bound to a single input in a compiled layout."""
+    __slots__ = ('order', 'action', 'config', 'params')
+
+    def __init__(self, order, action, config, params):
+        self.order = order
+        self.action = action
+        self.config = config
+        # Prebuilt parameters, None if they have to be resolved every frame
+        self.params = params
+
+
+class CompiledLayout(object):
+    """Bindings of one layout indexed by button id, (hat id, direction) or pygame key."""
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.buttons = {}
+        self.hats = {}
+        self.keys = {}
+
+
+class CompiledConfig(object):
+    def __init__(self, default_layout, layouts):
+        object.__init__(self)
+
+        self.default_layout = default_layout
+        # List of (layout button or pygame key, CompiledLayout)
+        self.layouts = layouts
+
+
 class Foo(object):
     def __init__(self):
         object.__init__(self)
 
         self.joysticks = []
+        # Names used to load the joystick configs
+        self.joystick_names = []
         self.joystick_states = []
         self.joystick_configs = []
         self.keyboard_config = {}
-
-        self.current_joystick_states = None
-        self.pressed_keys = None
+        self.joystick_bindings = []
+        self.keyboard_bindings = None
+        self.settings = {}
+
+        # Double buffered snapshots of joystick_states used by _main_loop
+        self.current_joystick_states = []
+        self.previous_joystick_states = []
+        self.pressed_keys = set()
+        # Keys held down according to KEYDOWN and KEYUP events, updated by joystick_thread
+        self.key_states = set()
+        self.recorder = None
+        # Reads the input devices when not using pygame for input
+        self.evdev_input = None
+        # Set when a joystick is added or removed, the joysticks are reopened by _main_loop
+        self.joysticks_changed = False
+        # Index of the open pygame 2 joysticks by SDL instance id, which their events carry
+        self.joystick_instance_indexes = {}
+        self.device_monitor = None
+        # Watches the configs, and the new pipeline attributes compiled from them
+        self.config_monitor = None
+        self.staged_config = None
         self.joystick_thread = None
         self.keep_running = False
 
+        self.cameras = []
+        # Controllers and the camera each of them drives, and the route being dispatched
+        self.routes = []
+        self.route = None
+        # One command queue and worker thread for each port
+        self.command_queues = []
+        # (transport, command_queue) by port
+        self.links = {}
+        self.disconnected_links = set()
+        self.watchdog = None
+        self.inquiry_poller = None
+        # Inputs of network clients, and their state in the current snapshot
+        self.remote_inputs = None
+        self.control_server = None
+        self.state_feed = None
+        self.remote_ptz = (0, 0, 0)
+        self.remote_actions = {}
+        self.pysca_port = None
+
         self.param_pan_axis_multiplier = []
         self.param_tilt_axis_multiplier = []
         self.param_zoom_axis_multiplier = []
@@ -150,16 +560,32 @@ class Foo(object):
         self.param_zoom_axis_dead_zone = []
         self.param_sensitivity_axis_dead_zone = []
 
-        self.prev_zoom = 1
-        self.zoom_mode = "stop"
-        self.wb_mode = "auto"
-        self.focus_mode = "auto"
-        self.focus_action = "stop"
+        # Compiled response curves of the axes of each joystick
+        self.sensitivity_tables = []
+        self.pan_tables = []
+        self.tilt_tables = []
+        self.zoom_tables = []
 
-        self.zoom_active = False
-        self.focus_active = False
+        # Kill buttons of the first joystick were all pressed on the previous event
+        self.kill_pressed = False
 
+        # Notified by joystick_thread whenever input state may have changed
         self.state_read_lock = threading.Condition()
+        # Incremented on every input change, snapshot_version is the version _main_loop has read
+        self.state_version = 0
+        self.snapshot_version = 0
+        # Set by wait_for_input when the idle timeout passed without input
+        self.idle_frame = False
+        # Time of the first input event not yet read by _main_loop, and of the events in the current snapshot
+        self.input_time = None
+        self.snapshot_input_time = None
+        self.latency = LatencyStats()
+        # Counters for the metrics endpoint, each written by one thread only
+        self.metrics_server = None
+        self.event_count = 0
+        self.frame_count = 0
+        self.unchanged_frame_count = 0
+        self.reconnect_counts = {}
 
         self.event_handlers = {
             pygame.QUIT: self._on_quit,
@@ -167,6 +593,8 @@ class Foo(object):
             pygame.JOYBUTTONDOWN: self._on_joy_button_down,
             pygame.JOYBUTTONUP: self._on_joy_button_up,
             pygame.JOYHATMOTION: self._on_joy_hat_motion,
+            pygame.KEYDOWN: self._on_key_down,
+            pygame.KEYUP: self._on_key_up,
         }
 
         self.command_handlers = {
@@ -196,6 +624,7 @@ class Foo(object):
             ZOOM_AXIS_ON: self._set_zoom_axis,
             ZOOM_AXIS_OFF: self._set_zoom_axis,
             ZOOM_AXIS_TOGGLE: self._set_zoom_axis,
+            CAMERA_SELECT: self._select_camera,
         }
 
         self.param_getters = {
@@ -203,6 +632,11 @@ class Foo(object):
             ZOOM_OUT: self._get_zoom_out_param
         }
 
+        # Joystick hotplug events of pygame 2
+        if hasattr(pygame, 'JOYDEVICEADDED'):
+            self.event_handlers[pygame.JOYDEVICEADDED] = self._on_joy_device_added
+            self.event_handlers[pygame.JOYDEVICEREMOVED] = self._on_joy_device_removed
+
     def joystick_thread_runner(self):
         while self.keep_running:
             try:
@@ -212,33 +646,67 @@ class Foo(object):
                 pass
 
     def proc_event(self, event):
+        received_time = time.time()
         with self.state_read_lock:
             handler = self.event_handlers.get(event.type)
             if not handler:
                 # print('Unknown event {}'.format(event.type))
                 return
+            joy = self.get_joystick_index(event)
+            if joy is None or joy >= len(self.joystick_states):
+                # From a joystick added after the joysticks were last opened
+                return
+            if joy != getattr(event, 'joy', joy):
+                # The device index of pygame is not updated when an earlier joystick is removed
+                event = pygame.event.Event(event.type, dict(event.dict, joy=joy))
 
+            state_version = self.state_version
+            self.event_count += 1
             handler(event)
-
-        # Very crude but somewhat working solution to kill the program
-        # if serial communication hangs for some reason
-        kill_buttons = self.joystick_configs[0][CONFIG_PARAMETERS].get(KILL, None)
-        if kill_buttons is not None:
-            all_pressed = True
-            for button in kill_buttons:
-                if self.joystick_states[0].buttons_value[button] == 0:
-                    all_pressed = False
-            if all_pressed:
-                print('Ending program')
-                pygame.quit()
-                os.kill(os.getpid(), signal.SIGKILL)
+            if self.state_version != state_version:
+                if self.input_time is None:
+                    self.input_time = received_time
+                if self.recorder is not None:
+                    self.recorder.record(event, received_time)
+
+            # Wake up _main_loop when running in event driven mode
+            self.state_read_lock.notify()
+
+            # Kill buttons reconnect the link of the active camera in case
+            # the watchdog has not noticed that it hangs
+            kill_buttons = self.joystick_configs[0][CONFIG_PARAMETERS].get(KILL, None)
+            if kill_buttons is not None:
+                all_pressed = True
+                for button in kill_buttons:
+                    if self.joystick_states[0].buttons_value[button] == 0:
+                        all_pressed = False
+                if all_pressed and not self.kill_pressed and self.watchdog is not None:
+                    route = self.get_joystick_route(0) or self.routes[0]
+                    self.watchdog.request_recovery(self.cameras[route.camera].link)
+                self.kill_pressed = all_pressed
 
     def _on_quit(self, event):
         self.keep_running = False
+        # Called from proc_event with state_read_lock held
+        self.state_read_lock.notify()
         print("Received event 'Quit', exiting.")
         pygame.quit()
         exit(0)
 
+    def _on_sigusr1(self, signal, frame):
+        print(self.latency.format())
+        for command_queue in self.command_queues:
+            print('{}: {}'.format(command_queue.name, command_queue.get_stats()))
+        if self.inquiry_poller is not None:
+            print('inquiries: {}'.format(self.inquiry_poller.get_stats()))
+        if self.remote_inputs is not None:
+            print('control clients: {}'.format(self.remote_inputs.get_stats()))
+        if self.state_feed is not None:
+            print('state feed: {}'.format(self.state_feed.get_stats()))
+        for camera in self.cameras:
+            print('{}: {}'.format(camera.name, ', '.join(
+                '{} {}'.format(name, camera.state.get(name)) for name in sorted(camera.state.values))))
+
     def _on_sigint(self, signal, frame):
         self.keep_running = False
         print("Received event 'CTRL-C', exiting.")
@@ -246,71 +714,141 @@ class Foo(object):
         exit(0)
 
     def _on_joy_axis_motion(self, event):
-        self.joystick_states[event.joy].axes_value[event.axis] = event.value
+        joystick_state = self.joystick_states[event.joy]
+        joystick_state.axes_value[event.axis] = event.value
+        joystick_state.version += 1
+        self.state_version += 1
 
     def _on_joy_button_down(self, event):
-        self.joystick_states[event.joy].buttons_value[event.button] = 1
+        joystick_state = self.joystick_states[event.joy]
+        joystick_state.buttons_value[event.button] = 1
+        joystick_state.version += 1
+        self.state_version += 1
 
     def _on_joy_button_up(self, event):
-        self.joystick_states[event.joy].buttons_value[event.button] = 0
+        joystick_state = self.joystick_states[event.joy]
+        joystick_state.buttons_value[event.button] = 0
+        joystick_state.version += 1
+        self.state_version += 1
 
     def _on_joy_hat_motion(self, event):
-        self.joystick_states[event.joy].hats_value[event.hat] = event.value
+        joystick_state = self.joystick_states[event.joy]
+        joystick_state.hats_value[2 * event.hat] = event.value[0]
+        joystick_state.hats_value[2 * event.hat + 1] = event.value[1]
+        joystick_state.version += 1
+        self.state_version += 1
+
+    def _on_key_down(self, event):
+        self.key_states.add(event.key)
+        self.state_version += 1
+
+    def _on_key_up(self, event):
+        self.key_states.discard(event.key)
+        self.state_version += 1
+
+    def _on_remote_input(self):
+        received_time = time.time()
+        with self.state_read_lock:
+            self.state_version += 1
+            if self.input_time is None:
+                self.input_time = received_time
+            self.state_read_lock.notify()
+
+    def _on_camera_state_change(self, camera, name):
+        # The speed of a held pan/tilt follows the zoom, also when no input arrives in event mode
+        if name != 'zoom' or camera.zoom_pan_speeds is None:
+            return
+        with self.state_read_lock:
+            for route in self.routes:
+                if self.cameras[route.camera] is camera and route.unscaled_pan_tilt not in (None, (0, 0)):
+                    self.state_version += 1
+                    self.state_read_lock.notify()
+                    return
+
+    def get_joystick_index(self, event):
+        instance_id = getattr(event, 'instance_id', None)
+        if instance_id is not None and self.joystick_instance_indexes:
+            return self.joystick_instance_indexes.get(instance_id)
+        return getattr(event, 'joy', 0)
+
+    def _on_joy_device_added(self, event):
+        # SDL also posts it for every joystick already open when its joystick subsystem starts
+        joystick = pygame.joystick.Joystick(event.device_index)
+        instance_id = joystick.get_instance_id()
+        if any(open_joystick.get_instance_id() == instance_id for open_joystick in self.joysticks):
+            return
+        # Opened here in the joystick thread, which is the one reading the pygame events
+        joystick.init()
+        self.joysticks.append(joystick)
+        self.joysticks_changed = True
+        self.state_version += 1
+
+    def _on_joy_device_removed(self, event):
+        for joystick in self.joysticks:
+            if joystick.get_instance_id() == event.instance_id:
+                joystick.quit()
+                self.joysticks.remove(joystick)
+                self.joysticks_changed = True
+                self.state_version += 1
+                return
+
+    def _on_devices_changed(self, added, removed):
+        """Called by device_monitor when device nodes are added or removed.
+
+        Serial ports are reopened right away, joysticks are reopened by
+        _main_loop. Returns the ports which could not be opened.
+        """
+        failed = set()
+        for path in removed:
+            if path in self.links:
+                self.disconnect_link(path)
+        for path in added:
+            if path in self.links and not self.reconnect_link(path):
+                failed.add(path)
+
+        if any(path not in self.links for path in added | removed):
+            with self.state_read_lock:
+                self.joysticks_changed = True
+                self.state_version += 1
+                self.state_read_lock.notify()
+        return failed
 
     def main(self):
-        os.environ["SDL_AUDIODRIVER"] = "dummy"
-        pygame.init()
-        pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-        #pygame.display.set_mode((100, 100), pygame.RESIZABLE)
-        pysca.connect('/dev/ttyUSB0')
-        pysca.set_power_on(1, True)
-        pysca.set_wb_mode(1, "auto", blocking=True)
-        pysca.set_focus_mode(1, "auto", blocking=True)
+        self.load_settings()
+        evdev = self.settings.get(INPUT_BACKEND, INPUT_BACKEND_PYGAME) == INPUT_BACKEND_EVDEV
+        if evdev:
+            # No display and no X server needed
+            self.open_evdev_input()
+        else:
+            self.open_pygame_input()
+        self.initialize_cameras()
+        self.start_watchdog()
+        self.start_inquiry_poller()
         signal.signal(signal.SIGINT, self._on_sigint)
-
-        for i in range(0, pygame.joystick.get_count()):
-            joystick = pygame.joystick.Joystick(i)
-            joystick.init()
-
-            num_axes = joystick.get_numaxes()
-            num_hats = joystick.get_numhats()
-            num_buttons = joystick.get_numbuttons()
-            joystick_state = JoystickState(
-                axes_value=[0.0] * num_axes,
-                hats_value=[(0, 0)] * num_hats,
-                buttons_value=[0] * num_buttons,
-            )
-
-            config_file_name = "configs/" + joystick.get_name() + ".json"
-            # print("Opening joystick config: {}".format(config_file_name))
-            with open(config_file_name, 'rt') as f:
-                config = json.load(f)
-
-            self.joystick_configs.append(config)
-            self.joysticks.append(joystick)
-            self.joystick_states.append(joystick_state)
+        signal.signal(signal.SIGUSR1, self._on_sigusr1)
 
         if not self.joystick_configs:
-            config_file_name = "configs/" + "no_joystick" + ".json"
-            with open(config_file_name, 'rt') as f:
-                config = json.load(f)
-            self.joystick_configs.append(config)
-            joystick_state = JoystickState(
-                axes_value=[0.0] * 1,
-                hats_value=[(0, 0)] * 1,
-                buttons_value=[0] * 1,
-            )
-            self.joystick_states.append(joystick_state)
+            self.add_joystick("no_joystick", 1, 1, 1)
             # print("Joystick not connected")
 
-        config_file_name = "configs/" + "keyboard" + ".json"
-        # print("Opening keyboard config: {}".format(config_file_name))
-        with open(config_file_name, 'rt') as f:
-            config = json.load(f)
-        self.keyboard_config = config
+        self.load_keyboard_config()
+        self.initialize_pipeline()
+        self.start_device_monitor(evdev)
+        self.start_config_monitor()
+        self.start_control_server()
+        self.start_state_feed()
+        self.start_metrics_server()
+
+        record_file = self.settings.get(RECORD_FILE, None)
+        if record_file is not None:
+            self.recorder = EventRecorder(time.strftime(record_file), self.get_joystick_descriptions())
+            self.recorder.start()
 
         self.keep_running = True
-        joystick_thread = threading.Thread(target=self.joystick_thread_runner, name="joystick-reader-thread")
+        joystick_thread = threading.Thread(
+            target=self.evdev_input.run if evdev else self.joystick_thread_runner,
+            name="joystick-reader-thread",
+        )
         joystick_thread.start()
 
         try:
@@ -322,42 +860,782 @@ class Foo(object):
         finally:
             if self.keep_running:
                 self.keep_running = False
+            if self.evdev_input is not None:
+                self.evdev_input.stop()
+            if self.device_monitor is not None:
+                self.device_monitor.stop()
+            if self.config_monitor is not None:
+                self.config_monitor.stop()
+            if self.watchdog is not None:
+                self.watchdog.stop()
+            if self.inquiry_poller is not None:
+                self.inquiry_poller.stop()
+            if self.control_server is not None:
+                self.control_server.stop()
+            if self.state_feed is not None:
+                self.state_feed.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
 
             joystick_thread.join(5)
+            if self.evdev_input is not None:
+                self.evdev_input.close()
+            for command_queue in self.command_queues:
+                command_queue.stop()
+            if self.recorder is not None:
+                self.recorder.stop()
+
+    def open_pygame_input(self):
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        pygame.init()
+        pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+        #pygame.display.set_mode((100, 100), pygame.RESIZABLE)
+        self.open_pygame_joysticks()
 
-    def get_joystick_layout(self, joystick_index):
-        i = 1
-        while True:
-            layout_str_key = LAYOUT + str(i)
-            if layout_str_key in self.joystick_configs[joystick_index]:
-                layout_button = self.joystick_configs[joystick_index][layout_str_key][LAYOUT_BUTTON]
-                if self.joystick_states[joystick_index].buttons_value[layout_button] == 1:
-                    return self.joystick_configs[joystick_index][layout_str_key]
-            else:
-                break
-            i += 1
-        return self.joystick_configs[joystick_index][DEFAULT_LAYOUT]
+    def open_pygame_joysticks(self):
+        for i in range(0, pygame.joystick.get_count()):
+            joystick = pygame.joystick.Joystick(i)
+            joystick.init()
+            self.joysticks.append(joystick)
+            self.add_pygame_joystick(joystick)
+
+    def add_pygame_joystick(self, joystick):
+        if hasattr(joystick, 'get_instance_id'):
+            self.joystick_instance_indexes[joystick.get_instance_id()] = len(self.joystick_states)
+        self.add_joystick(
+            joystick.get_name(),
+            joystick.get_numaxes(),
+            joystick.get_numhats(),
+            joystick.get_numbuttons(),
+        )
+
+        # A joystick opened while running may already have buttons pressed
+        joystick_state = self.joystick_states[-1]
+        for axis in range(0, joystick.get_numaxes()):
+            joystick_state.axes_value[axis] = joystick.get_axis(axis)
+        for hat in range(0, joystick.get_numhats()):
+            joystick_state.hats_value[2 * hat], joystick_state.hats_value[2 * hat + 1] = joystick.get_hat(hat)
+        for button in range(0, joystick.get_numbuttons()):
+            joystick_state.buttons_value[button] = joystick.get_button(button)
+
+    def open_evdev_devices(self):
+        joysticks = evdev_input.open_joysticks(
+            self.settings.get(JOYSTICK_DEVICES, [evdev_input.JOYSTICK_DEVICES]))
+        keyboards = evdev_input.open_keyboards(
+            self.settings.get(KEYBOARD_DEVICES, [evdev_input.KEYBOARD_DEVICES]))
+
+        for joystick in joysticks:
+            self.joysticks.append(joystick)
+            self.add_joystick(joystick.name, joystick.num_axes, joystick.num_hats, joystick.num_buttons)
+        return joysticks, keyboards
+
+    def open_evdev_input(self):
+        joysticks, keyboards = self.open_evdev_devices()
+
+        self.evdev_input = evdev_input.EvdevInput(joysticks, keyboards, self.proc_event)
+
+    def reload_joysticks(self):
+        """Rebuild the joystick states and bindings after one was added or removed.
+
+        With pygame 2 the joystick thread has already opened or closed the
+        device, the others stay open. Called by take_snapshot with state_read_lock held, so the joystick
+        states and bindings are replaced between two frames.
+        """
+        # Toggled inverts and zoom axis are kept for joysticks with the same name
+        toggles = dict(zip(self.joystick_names, zip(
+            self.param_invert_pan_axis,
+            self.param_invert_tilt_axis,
+            self.param_invert_zoom_axis,
+            self.param_zoom_axis_enabled,
+        )))
+
+        self.joystick_names = []
+        self.joystick_configs = []
+        self.joystick_states = []
+        self.joystick_instance_indexes = {}
+
+        if self.evdev_input is not None:
+            # Keyboards are reopened too, keys pressed meanwhile are released
+            self.key_states.clear()
+            self.joysticks = []
+            self.evdev_input.set_devices(*self.open_evdev_devices())
+        elif hasattr(pygame, 'JOYDEVICEADDED'):
+            # Opened and closed one by one by the joystick thread as they come and go
+            for joystick in self.joysticks:
+                self.add_pygame_joystick(joystick)
+        else:
+            # pygame 1 finds new joysticks only by restarting its joystick subsystem
+            self.joysticks = []
+            pygame.joystick.quit()
+            pygame.joystick.init()
+            self.open_pygame_joysticks()
 
-    def get_keyboard_layout(self):
-        i = 1
-        while True:
-            layout_str_key = LAYOUT + str(i)
-            if layout_str_key in self.keyboard_config:
-                layout_key = self.keyboard_config[layout_str_key][LAYOUT_KEY]
-                key = getattr(pygame, layout_key)
-                if key in self.pressed_keys:
-                    return self.keyboard_config[layout_str_key]
+        if not self.joystick_configs:
+            self.add_joystick("no_joystick", 1, 1, 1)
+        self.initialize_pipeline()
+
+        for i, name in enumerate(self.joystick_names):
+            if name in toggles:
+                (
+                    self.param_invert_pan_axis[i],
+                    self.param_invert_tilt_axis[i],
+                    self.param_invert_zoom_axis[i],
+                    self.param_zoom_axis_enabled[i],
+                ) = toggles[name]
+                self.compile_axis_tables(i)
+        print('Joysticks: {}'.format(', '.join(self.joystick_names)))
+
+    def start_device_monitor(self, evdev):
+        if evdev:
+            device_configs = self.settings.get(JOYSTICK_DEVICES, [evdev_input.JOYSTICK_DEVICES]) + \
+                self.settings.get(KEYBOARD_DEVICES, [evdev_input.KEYBOARD_DEVICES])
+            patterns = [
+                device_config["path"] if isinstance(device_config, dict) else device_config
+                for device_config in device_configs
+            ]
+        elif not hasattr(pygame, 'JOYDEVICEADDED'):
+            patterns = [evdev_input.JOYSTICK_DEVICES]
+        else:
+            patterns = []
+        # Serial ports, other links are not device nodes
+        patterns += list(self.links.keys())
+        patterns = [pattern for pattern in patterns if pattern.startswith('/dev/')]
+        if not patterns:
+            return
+
+        self.device_monitor = DeviceMonitor(
+            patterns,
+            self._on_devices_changed,
+            poll_interval=self.settings.get(DEVICE_POLL_INTERVAL, 1.0),
+        )
+        self.device_monitor.start()
+        for port in self.disconnected_links:
+            self.device_monitor.retry(port)
+
+    def start_config_monitor(self):
+        if not self.settings.get(CONFIG_RELOAD, True):
+            return
+        self.config_monitor = FileMonitor(
+            [CONFIG_FILES],
+            self._on_configs_changed,
+            poll_interval=self.settings.get(DEVICE_POLL_INTERVAL, 1.0),
+        )
+        self.config_monitor.start()
+
+    def _on_configs_changed(self, paths):
+        """Called by config_monitor, compiles the changed configs for the next frame.
+
+        The configs are loaded, validated and compiled in the monitor
+        thread, the control loop only swaps in the result.
+        """
+        try:
+            staged = self.stage_configs()
+        except (IOError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print('Configs not reloaded: {}'.format(e))
+            return
+        with self.state_read_lock:
+            self.staged_config = staged
+            self.state_version += 1
+            self.state_read_lock.notify()
+        print('Reloaded configs: {}'.format(', '.join(sorted(paths))))
+
+    def stage_configs(self):
+        """Compile the configs of the open joysticks and the keyboard.
+
+        Returns the new values by Foo attribute. Toggled inverts and zoom
+        axis are taken over from the running pipeline.
+        """
+        with self.state_read_lock:
+            joystick_names = list(self.joystick_names)
+            toggles = dict((attribute, list(getattr(self, attribute))) for attribute in TOGGLE_PARAMETERS)
+
+        joystick_configs = [self.load_joystick_config(name) for name in joystick_names]
+        keyboard_config = self.read_keyboard_config()
+
+        staged = self.load_joystick_parameters(joystick_configs)
+        staged.update(toggles)
+        tables = []
+        for i, joystick_config in enumerate(joystick_configs):
+            values = dict((key, staged[attribute][i]) for attribute, key, _ in JOYSTICK_PARAMETERS)
+            tables.append(compile_joystick_tables(joystick_config[CONFIG_PARAMETERS], values))
+
+        staged.update({
+            'joystick_names': joystick_names,
+            'joystick_configs': joystick_configs,
+            'keyboard_config': keyboard_config,
+            'joystick_bindings': [self.compile_config(config, i) for i, config in enumerate(joystick_configs)],
+            'keyboard_bindings': self.compile_config(keyboard_config),
+            'sensitivity_tables': [table[0] for table in tables],
+            'pan_tables': [table[1] for table in tables],
+            'tilt_tables': [table[2] for table in tables],
+            'zoom_tables': [table[3] for table in tables],
+        })
+        return staged
+
+    def apply_staged_config(self):
+        """Swap in the staged configs, called by take_snapshot with state_read_lock held."""
+        staged = self.staged_config
+        self.staged_config = None
+        if staged['joystick_names'] != self.joystick_names:
+            # The joysticks have been reopened with their configs meanwhile
+            return
+        toggles = dict((attribute, getattr(self, attribute)) for attribute in TOGGLE_PARAMETERS)
+        for attribute, value in staged.items():
+            setattr(self, attribute, value)
+        # Toggled since the configs were staged
+        for i in range(0, len(self.joystick_names)):
+            if any(toggles[attribute][i] != staged[attribute][i] for attribute in TOGGLE_PARAMETERS):
+                for attribute in TOGGLE_PARAMETERS:
+                    getattr(self, attribute)[i] = toggles[attribute][i]
+                self.compile_axis_tables(i)
+
+    def add_joystick(self, name, num_axes, num_hats, num_buttons):
+        joystick_state = JoystickState(
+            axes_value=[0.0] * num_axes,
+            hats_value=[(0, 0)] * num_hats,
+            buttons_value=[0] * num_buttons,
+        )
+
+        if not os.path.isfile("configs/" + name + ".json"):
+            print("No config for joystick '{}', using configs/no_joystick.json".format(name))
+        config = self.load_joystick_config(name)
+
+        self.joystick_names.append(name)
+        self.joystick_configs.append(config)
+        self.joystick_states.append(joystick_state)
+
+    def get_joystick_descriptions(self):
+        return [
+            {
+                "name": name,
+                "axes": len(joystick_state.axes_value),
+                "hats": len(joystick_state.hats_value) // 2,
+                "buttons": len(joystick_state.buttons_value),
+            }
+            for name, joystick_state in zip(self.joystick_names, self.joystick_states)
+        ]
+
+    def load_joystick_config(self, name):
+        config_file_name = "configs/" + name + ".json"
+        if not os.path.isfile(config_file_name):
+            config_file_name = "configs/no_joystick.json"
+        # print("Opening joystick config: {}".format(config_file_name))
+        with open(config_file_name, 'rt') as f:
+            return json.load(f)
+
+    def read_keyboard_config(self):
+        config_file_name = "configs/" + "keyboard" + ".json"
+        # print("Opening keyboard config: {}".format(config_file_name))
+        with open(config_file_name, 'rt') as f:
+            return json.load(f)
+
+    def load_keyboard_config(self):
+        self.keyboard_config = self.read_keyboard_config()
+
+    def initialize_pipeline(self):
+        self.initialize_bindings()
+        self.initialize_joystick_parameters()
+        self.initialize_snapshots()
+        self.initialize_routes()
+        self.initialize_repeat_rates()
+
+    def initialize_routes(self):
+        # Routes keep their camera when the joysticks are reopened
+        if not self.routes:
+            num_cameras = len(self.settings.get(CAMERAS, [DEFAULT_CAMERA]))
+            for i, route_config in enumerate(self.settings.get(ROUTES, [DEFAULT_ROUTE])):
+                camera = route_config.get(ROUTE_CAMERA, 0)
+                if camera >= num_cameras:
+                    print('Route {} has no camera {}, using camera 0'.format(i, camera))
+                    camera = 0
+                self.routes.append(Route(
+                    name=route_config.get(ROUTE_NAME, str(i)),
+                    camera=camera,
+                    joysticks=route_config.get(ROUTE_JOYSTICKS, None),
+                    keyboard=route_config.get(ROUTE_KEYBOARD, False),
+                    remote=route_config.get(ROUTE_REMOTE, False),
+                    handlers=self.command_handlers,
+                ))
+            self.route = self.routes[0]
+        self.assign_route_joysticks()
+
+    def assign_route_joysticks(self):
+        for route in self.routes:
+            route.joystick_indexes = []
+        for i, name in enumerate(self.joystick_names):
+            routes = [route for route in self.routes if route.joysticks is not None and (
+                i in route.joysticks or name in route.joysticks)]
+            routes += [route for route in self.routes if route.joysticks is None]
+            # Joysticks of no route are ignored
+            if routes:
+                routes[0].joystick_indexes.append(i)
+
+    def get_joystick_route(self, joystick_index):
+        for route in self.routes:
+            if joystick_index in route.joystick_indexes:
+                return route
+        return None
+
+    def initialize_repeat_rates(self):
+        repeat_rates = dict(DEFAULT_REPEAT_RATES)
+        repeat_rates.update(self.settings.get(REPEAT_RATES, {}))
+        for route in self.routes:
+            route.action_engine.configure(repeat_rates, self.settings.get(REPEAT_DELAY, 0.5))
+
+    def load_settings(self):
+        if os.path.isfile(SETTINGS_FILE):
+            with open(SETTINGS_FILE, 'rt') as f:
+                self.settings = json.load(f)
+
+    def simulate_cameras(self):
+        """Replace the configured cameras with simulated cameras at the same addresses."""
+        self.settings[CAMERAS] = [
+            {
+                CAMERA_NAME: camera_config.get(CAMERA_NAME, 'camera'),
+                CAMERA_ADDRESS: camera_config.get(CAMERA_ADDRESS, DEFAULT_CAMERA[CAMERA_ADDRESS]),
+                CAMERA_PORT: 'simulator',
+                CAMERA_TRANSPORT: TRANSPORT_SIMULATOR,
+            }
+            for camera_config in self.settings.get(CAMERAS, [DEFAULT_CAMERA])
+        ]
+
+    def get_link_name(self, camera_config):
+        # Cameras sharing a link share a command queue
+        if camera_config.get(CAMERA_TRANSPORT, DEFAULT_CAMERA[CAMERA_TRANSPORT]) == TRANSPORT_UDP:
+            return '{}:{}'.format(camera_config[CAMERA_HOST], camera_config.get(CAMERA_PORT, VISCA_UDP_PORT))
+        return camera_config.get(CAMERA_PORT, DEFAULT_CAMERA[CAMERA_PORT])
+
+    def get_link_bandwidth(self, camera_config):
+        """Bytes per second the link can carry, None if not limited by a serial line."""
+        bandwidth = camera_config.get(CAMERA_BANDWIDTH, None)
+        if bandwidth is not None:
+            return bandwidth
+        transport_type = camera_config.get(CAMERA_TRANSPORT, DEFAULT_CAMERA[CAMERA_TRANSPORT])
+        if transport_type == TRANSPORT_UDP:
+            return None
+        # Start bit, 8 data bits and stop bit
+        baudrate = camera_config.get(CAMERA_BAUDRATE, 9600)
+        return baudrate / 10 if baudrate else None
+
+    def is_pipelined(self, camera_config):
+        """Whether the commands on the link are sent without waiting for the completion of the previous one."""
+        if not camera_config.get(CAMERA_PIPELINED, False):
+            return False
+        # pysca reads the replies only while sending a command
+        return camera_config.get(CAMERA_TRANSPORT, DEFAULT_CAMERA[CAMERA_TRANSPORT]) != TRANSPORT_PYSCA
+
+    def create_transport(self, camera_config):
+        port = camera_config.get(CAMERA_PORT, DEFAULT_CAMERA[CAMERA_PORT])
+        transport_type = camera_config.get(CAMERA_TRANSPORT, DEFAULT_CAMERA[CAMERA_TRANSPORT])
+
+        if transport_type == TRANSPORT_UDP:
+            transport = UdpTransport(
+                camera_config[CAMERA_HOST],
+                port=camera_config.get(CAMERA_PORT, VISCA_UDP_PORT),
+                timeout=camera_config.get(CAMERA_TIMEOUT, 0.1),
+                completion_timeout=camera_config.get(CAMERA_COMPLETION_TIMEOUT, 8.0),
+            )
+            try:
+                transport.connect()
+            except (IOError, OSError, ViscaError) as e:
+                # Reconnected by the watchdog when its commands keep failing
+                link = self.get_link_name(camera_config)
+                print('Cannot connect to {}: {}'.format(link, e))
+                self.disconnected_links.add(link)
+            return transport
+
+        if transport_type == TRANSPORT_SIMULATOR:
+            transport = SimulatedTransport(
+                baudrate=camera_config.get(CAMERA_BAUDRATE, 9600),
+                timeout=camera_config.get(CAMERA_TIMEOUT, 1.0),
+                ack_delay=camera_config.get(CAMERA_ACK_DELAY, 0.002),
+                completion_delay=camera_config.get(CAMERA_COMPLETION_DELAY, 0.01),
+                pipelined=self.is_pipelined(camera_config),
+            )
+            transport.connect()
+            return transport
+
+        if transport_type == TRANSPORT_SERIAL:
+            transport = SerialTransport(
+                port,
+                baudrate=camera_config.get(CAMERA_BAUDRATE, 9600),
+                timeout=camera_config.get(CAMERA_TIMEOUT, 1.0),
+                completion_timeout=camera_config.get(CAMERA_COMPLETION_TIMEOUT, 8.0),
+                pipelined=self.is_pipelined(camera_config),
+            )
+            try:
+                transport.connect()
+            except (IOError, OSError) as e:
+                # Opened by device_monitor when the port appears
+                print('Cannot open {}: {}'.format(port, e))
+                self.disconnected_links.add(port)
+            return transport
+
+        if transport_type == TRANSPORT_PYSCA:
+            # pysca has a single module level connection
+            if self.pysca_port is not None:
+                raise ValueError("Transport 'pysca' supports only one port, use 'serial' for {}".format(port))
+            self.pysca_port = port
+            try:
+                pysca.connect(port)
+            except (IOError, OSError) as e:
+                print('Cannot open {}: {}'.format(port, e))
+                self.disconnected_links.add(port)
+            return pysca
+
+        raise ValueError('Unknown transport {}'.format(transport_type))
+
+    def initialize_cameras(self):
+        """Create the cameras listed in settings and a command queue for each port.
+
+        Commands to cameras behind different ports are sent in parallel by
+        the worker threads of the queues.
+        """
+        max_depth = self.settings.get(COMMAND_QUEUE_SIZE, 32)
+        ports = {}
+
+        for camera_config in self.settings.get(CAMERAS, [DEFAULT_CAMERA]):
+            link = self.get_link_name(camera_config)
+            if link not in ports:
+                command_queue = CommandQueue(
+                    name='visca-command-thread-' + link,
+                    max_depth=max_depth,
+                    latency=self.latency,
+                    bytes_per_second=self.get_link_bandwidth(camera_config),
+                    priority=command_priority,
+                    command_bytes=COMMAND_BYTES,
+                    wait_for_completion=not self.is_pipelined(camera_config),
+                )
+                ports[link] = (self.create_transport(camera_config), command_queue)
+                self.command_queues.append(command_queue)
+                self.links[link] = ports[link]
+
+            transport, command_queue = ports[link]
+            camera = Camera(
+                name=camera_config.get(CAMERA_NAME, link),
+                link=link,
+                address=camera_config.get(CAMERA_ADDRESS, DEFAULT_CAMERA[CAMERA_ADDRESS]),
+                transport=transport,
+                command_queue=command_queue,
+            )
+            tele_speed_scale = camera_config.get(CAMERA_TELE_SPEED_SCALE, None)
+            if tele_speed_scale is not None:
+                camera.zoom_pan_speeds = compile_zoom_speed_table(MAX_PAN_VALUE, tele_speed_scale)
+                camera.zoom_tilt_speeds = compile_zoom_speed_table(MAX_TILT_VALUE, tele_speed_scale)
+                camera.zoom_max = camera_config.get(CAMERA_ZOOM_MAX, 0x4000)
+            camera.put('set_power_on', True)
+            camera.put('set_wb_mode', "auto")
+            camera.put('set_focus_mode', "auto")
+            self.cameras.append(camera)
+
+        for command_queue in self.command_queues:
+            command_queue.start()
+
+    def reconnect_link(self, link):
+        transport, command_queue = self.links[link]
+        try:
+            if transport is pysca:
+                pysca.connect(link)
             else:
-                break
-            i += 1
-        return self.keyboard_config[DEFAULT_LAYOUT]
+                transport.reconnect()
+        except (IOError, OSError, ViscaError) as e:
+            print('Cannot reopen {}: {}'.format(link, e))
+            return False
+        self.disconnected_links.discard(link)
+        self.reconnect_counts[link] = self.reconnect_counts.get(link, 0) + 1
+        print('Reconnected {}'.format(link))
+        self.restore_cameras(link)
+        return True
+
+    def recover_link(self, link):
+        """Close and reopen a link found hanging by the watchdog."""
+        transport, command_queue = self.links[link]
+        if link in self.disconnected_links and not isinstance(transport, UdpTransport):
+            # Reopened by device_monitor when the port appears again
+            return
+        if transport is pysca:
+            # pysca has no deadlines, closing its port makes a read blocked in it fail
+            pysca_serial = getattr(pysca, '_serial', None)
+            if pysca_serial is not None:
+                try:
+                    pysca_serial.close()
+                except (IOError, OSError):
+                    pass
+        else:
+            transport.abort()
+        self.reconnect_link(link)
+
+    def restore_cameras(self, link):
+        """Restore the state of the cameras on a link which was reconnected.
+
+        The cameras may have been power cycled, and moves which were
+        running when the link was lost are stopped.
+        """
+        transport, command_queue = self.links[link]
+        command_queue.invalidate()
+        for camera in self.cameras:
+            if camera.link != link:
+                continue
+            camera.put('set_power_on', True)
+            camera.put('set_wb_mode', camera.wb_mode)
+            camera.put('set_focus_mode', camera.focus_mode)
+            camera.put_latest(PAN_TILT_COMMAND, 'pan_tilt', pan=0, tilt=0)
+            camera.put_latest(ZOOM_COMMAND, 'zoom', "stop")
+            camera.put_latest(FOCUS_COMMAND, 'focus', "stop")
+
+    def start_watchdog(self):
+        self.watchdog = LinkWatchdog(
+            dict((link, command_queue) for link, (transport, command_queue) in self.links.items()),
+            self.recover_link,
+            stuck_timeout=self.settings.get(WATCHDOG_TIMEOUT, 10.0),
+            max_errors=self.settings.get(WATCHDOG_ERRORS, 3),
+        )
+        self.watchdog.start()
+
+    def start_inquiry_poller(self):
+        interval = self.settings.get(INQUIRY_INTERVAL, 1.0)
+        if not interval:
+            return
+        self.inquiry_poller = InquiryPoller(self.cameras, interval=interval, on_change=self._on_camera_state_change)
+        self.inquiry_poller.start()
+
+    def start_control_server(self):
+        port = self.settings.get(CONTROL_PORT, None)
+        if port is None:
+            return
+        self.remote_inputs = RemoteInputs(
+            self._on_remote_input,
+            rate=self.settings.get(CONTROL_RATE, 20.0),
+            timeout=self.settings.get(CONTROL_TIMEOUT, 1.0),
+        )
+        self.control_server = ControlServer(
+            self.remote_inputs,
+            REMOTE_ACTION_PARAMS,
+            (MAX_PAN_VALUE, MAX_TILT_VALUE, MAX_ZOOM_VALUE + 1),
+            host=self.settings.get(CONTROL_HOST, '127.0.0.1'),
+            port=port,
+        )
+        self.control_server.start()
+
+    def start_state_feed(self):
+        path = self.settings.get(STATE_SOCKET, None)
+        if path is None:
+            return
+        self.state_feed = StateFeed(self.get_state, path, interval=self.settings.get(STATE_INTERVAL, 0.1))
+        self.state_feed.start()
+
+    def get_state(self):
+        """State of the cameras, routes and joysticks published by the state feed.
+
+        Called from the state feed thread, reads only values which are
+        replaced as a whole by the other threads.
+        """
+        cameras = {}
+        for i, camera in enumerate(self.cameras):
+            camera_state = camera.state.get_values()
+            camera_state.update({
+                "name": camera.name,
+                "wb-mode": camera.wb_mode,
+                "focus-mode": camera.focus_mode,
+                "memory": camera.memory,
+            })
+            cameras[str(i)] = camera_state
+        routes = {}
+        for i, route in enumerate(self.routes):
+            routes[str(i)] = {
+                "name": route.name,
+                "camera": route.camera,
+                "joysticks": list(route.joystick_indexes),
+            }
+        joysticks = {}
+        for i, toggles in enumerate(zip(
+                self.joystick_names,
+                self.param_invert_pan_axis,
+                self.param_invert_tilt_axis,
+                self.param_invert_zoom_axis,
+                self.param_zoom_axis_enabled)):
+            joysticks[str(i)] = {
+                "name": toggles[0],
+                "invert-pan": toggles[1],
+                "invert-tilt": toggles[2],
+                "invert-zoom": toggles[3],
+                "zoom-axis": toggles[4],
+            }
+        return {"cameras": cameras, "routes": routes, "joysticks": joysticks}
+
+    def start_metrics_server(self):
+        port = self.settings.get(METRICS_PORT, None)
+        if port is None:
+            return
+        self.metrics_server = MetricsServer(
+            self.collect_metrics, host=self.settings.get(METRICS_HOST, '127.0.0.1'), port=port)
+        self.metrics_server.start()
+
+    def collect_metrics(self):
+        """Metric families for the metrics endpoint, called from its thread."""
+        links = sorted(self.links.items())
+        queue_counters = (
+            ('viscapi_commands_coalesced_total', 'coalesced_count', 'Continuous commands replaced by newer ones'),
+            ('viscapi_commands_dropped_total', 'dropped_count', 'Commands dropped from a full queue'),
+            ('viscapi_commands_rate_limited_total', 'rate_limited_count', 'Commands held back by the byte budget'),
+            ('viscapi_commands_suppressed_total', 'suppressed_count', 'Commands the camera was already doing'),
+        )
+        families = [
+            ('viscapi_input_events_total', 'counter', 'Input events processed',
+             [('viscapi_input_events_total', {}, self.event_count)]),
+            ('viscapi_frames_total', 'counter', 'Iterations of the control loop',
+             [('viscapi_frames_total', {}, self.frame_count)]),
+            ('viscapi_unchanged_frames_total', 'counter', 'Iterations without input changes',
+             [('viscapi_unchanged_frames_total', {}, self.unchanged_frame_count)]),
+            ('viscapi_commands_sent_total', 'counter', 'Commands sent by link and command', [
+                ('viscapi_commands_sent_total', {'link': link, 'command': name}, count)
+                for link, (transport, command_queue) in links
+                for name, count in sorted(list(command_queue.sent_counts.items()))
+            ]),
+            ('viscapi_command_errors_total', 'counter', 'Failed commands by link and error, timeouts are ViscaTimeout', [
+                ('viscapi_command_errors_total', {'link': link, 'error': name}, count)
+                for link, (transport, command_queue) in links
+                for name, count in sorted(list(command_queue.error_counts.items()))
+            ]),
+            ('viscapi_command_queue_depth', 'gauge', 'Commands waiting to be sent', [
+                ('viscapi_command_queue_depth', {'link': link}, command_queue.depth)
+                for link, (transport, command_queue) in links
+            ]),
+            ('viscapi_link_busy_seconds_total', 'counter', 'Seconds spent sending commands, blocked in pysca for pysca', [
+                ('viscapi_link_busy_seconds_total', {'link': link}, command_queue.busy_time)
+                for link, (transport, command_queue) in links
+            ]),
+            ('viscapi_link_connected', 'gauge', 'Whether the link is connected', [
+                ('viscapi_link_connected', {'link': link}, 0 if link in self.disconnected_links else 1)
+                for link, (transport, command_queue) in links
+            ]),
+            ('viscapi_link_reconnects_total', 'counter', 'Reconnects of the link', [
+                ('viscapi_link_reconnects_total', {'link': link}, self.reconnect_counts.get(link, 0))
+                for link, (transport, command_queue) in links
+            ]),
+            ('viscapi_late_errors_total', 'counter', 'Errors of pipelined commands which had already returned', [
+                ('viscapi_late_errors_total', {'link': link}, transport.late_error_count)
+                for link, (transport, command_queue) in links if hasattr(transport, 'late_error_count')
+            ]),
+        ]
+        for name, attribute, help_text in queue_counters:
+            families.append((name, 'counter', help_text, [
+                (name, {'link': link}, getattr(command_queue, attribute))
+                for link, (transport, command_queue) in links
+            ]))
+        families.append(latency_family(
+            'viscapi_latency_seconds', 'Latency of the control pipeline and the commands', self.latency, 'stage'))
+        return families
+
+    def disconnect_link(self, port):
+        transport, command_queue = self.links[port]
+        print('Lost {}'.format(port))
+        if transport is not pysca:
+            transport.disconnect()
+        self.disconnected_links.add(port)
+
+    def get_camera(self):
+        # Camera of the route whose commands are being dispatched
+        return self.cameras[self.route.camera]
+
+    def get_next_repeat_time(self):
+        repeat_times = [route.action_engine.get_next_repeat_time() for route in self.routes]
+        repeat_times = [repeat_time for repeat_time in repeat_times if repeat_time is not None]
+        return min(repeat_times) if repeat_times else None
+
+    def wait_for_input(self, clock):
+        """Block until joystick_thread reports an input change.
+
+        In poll mode the loop simply runs at a fixed rate. In event mode the
+        loop sleeps on state_read_lock until an input, a held action repeating
+        or a new zoom position needs a frame, or at most the optional idle
+        timeout. The frame after the idle timeout puts the held pan/tilt, zoom
+        and focus again, and the command queues send what the camera is not
+        already doing, for example a command dropped from a full queue. An
+        optional max rate caps how often the loop may run.
+        """
+        if self.settings.get(LOOP_MODE, LOOP_MODE_POLL) != LOOP_MODE_EVENT:
+            clock.tick(self.settings.get(POLL_RATE, 10))
+            return
+
+        max_rate = self.settings.get(MAX_RATE, 0)
+        if max_rate:
+            clock.tick(max_rate)
+
+        idle_timeout = self.settings.get(IDLE_TIMEOUT, 1.0)
+        idle_time = time.time() + idle_timeout if idle_timeout else None
+        with self.state_read_lock:
+            while self.state_version == self.snapshot_version and self.keep_running:
+                wake_times = [wake_time for wake_time in (self.get_next_repeat_time(), idle_time) if wake_time is not None]
+                if not wake_times:
+                    # Untimed wait, Condition.wait(timeout) polls on python 2
+                    self.state_read_lock.wait()
+                    continue
+                # Only while a held action repeats or with an idle timeout
+                timeout = min(wake_times) - time.time()
+                if timeout <= 0:
+                    self.idle_frame = idle_time is not None and time.time() >= idle_time
+                    return
+                self.state_read_lock.wait(timeout)
+
+    def take_snapshot(self):
+        """Copy joystick_states into the snapshot buffers if input has changed.
+
+        Returns False if nothing has changed since the previous snapshot. The
+        buffers are swapped so that previous_joystick_states holds the state
+        of the previous frame, no new objects are allocated.
+        """
+        with self.state_read_lock:
+            # self.joystick_states is updated by joystick_thread
+            if self.state_version == self.snapshot_version:
+                return False
+            if self.joysticks_changed:
+                self.joysticks_changed = False
+                self.staged_config = None
+                self.reload_joysticks()
+            if self.staged_config is not None:
+                self.apply_staged_config()
+            self.snapshot_version = self.state_version
+            self.snapshot_input_time = self.input_time
+            self.input_time = None
+
+            current_states = self.previous_joystick_states
+            self.previous_joystick_states = self.current_joystick_states
+            self.current_joystick_states = current_states
+            for i, joystick_state in enumerate(self.joystick_states):
+                current_states[i].copy_from(joystick_state)
+
+            self.pressed_keys.clear()
+            self.pressed_keys.update(self.key_states)
+
+            if self.remote_inputs is not None:
+                self.remote_ptz, self.remote_actions, pulsed = self.remote_inputs.snapshot()
+                if pulsed:
+                    # Release the pulsed actions on the next frame
+                    self.state_version += 1
+
+        return True
+
+    def initialize_snapshots(self):
+        with self.state_read_lock:
+            self.current_joystick_states = [state.copy() for state in self.joystick_states]
+            self.previous_joystick_states = [state.copy() for state in self.joystick_states]
+            # Force reading the initial state on the first iteration
+            self.state_version += 1
 
-    def get_pressed_keys(self):
-        pressed_keys = set()
-        for i, value in enumerate(pygame.key.get_pressed()):
-            if value == 1:
-                pressed_keys.add(i)
-        return pressed_keys
+    def get_joystick_layout(self, joystick_index):
+        bindings = self.joystick_bindings[joystick_index]
+        buttons_value = self.current_joystick_states[joystick_index].buttons_value
+        for layout_button, layout in bindings.layouts:
+            if buttons_value[layout_button] == 1:
+                return layout
+        return bindings.default_layout
+
+    def get_keyboard_layout(self):
+        for layout_key, layout in self.keyboard_bindings.layouts:
+            if layout_key in self.pressed_keys:
+                return layout
+        return self.keyboard_bindings.default_layout
 
     def get_pressed_buttons(self, joystick_index):
         pressed_buttons = set()
@@ -369,15 +1647,17 @@ class Foo(object):
     def get_active_hats(self, joystick_index):
         active_hats = []
         hats_states = self.current_joystick_states[joystick_index].hats_value
-        for i, hat in enumerate(hats_states):
-            if hat[0] == 1:
-                active_hats.append([i, "right"])
-            if hat[0] == -1:
-                active_hats.append([i, "left"])
-            if hat[1] == 1:
-                active_hats.append([i, "up"])
-            if hat[1] == -1:
-                active_hats.append([i, "down"])
+        for i in range(0, len(hats_states) // 2):
+            hat_x = hats_states[2 * i]
+            hat_y = hats_states[2 * i + 1]
+            if hat_x == 1:
+                active_hats.append((i, "right"))
+            if hat_x == -1:
+                active_hats.append((i, "left"))
+            if hat_y == 1:
+                active_hats.append((i, "up"))
+            if hat_y == -1:
+                active_hats.append((i, "down"))
         return active_hats
 
     def merge_two_dicts(self, d1, d2):
@@ -402,95 +1682,143 @@ class Foo(object):
 
         return params
 
-    def find_actions_for_buttons(self, buttons, joystick_index, actions):
-        layout = self.get_joystick_layout(joystick_index)
-        layout_buttons = layout[CONFIG_BUTTONS]
-
-        for key, value in layout_buttons.iteritems():
+    def compile_bindings(self, bindings, input_field, joystick_index, layout, order):
+        for action, value in bindings.iteritems():
             if isinstance(value, list):
-                # List of dicts where "button" stores button id and "param" parameter for command
-                for d in value:
-                    if d["button"] in buttons:
-                        actions[key] = self.get_params(d, key, joystick_index)
+                # List of dicts where input_field stores input id and "params" parameters for command
+                entries = value
             elif isinstance(value, dict):
-                # Dict where "button" stores button id and "param" parameter for command
-                if value["button"] in buttons:
-                    actions[key] = self.get_params(value, key, joystick_index)
+                # Dict where input_field stores input id and "params" parameters for command
+                entries = [value]
             else:
-                # Just the id for the button
-                if value in buttons:
-                    actions[key] = self.get_params({}, key, joystick_index)
+                # Just the id for the input
+                entries = [{input_field: value}]
+
+            for entry in entries:
+                if input_field == "key":
+                    input_id = getattr(pygame, entry["key"])
+                elif input_field == "hat":
+                    input_id = (entry["id"], entry["dir"])
+                else:
+                    input_id = entry[input_field]
+
+                # Parameters of actions having a param getter depend on the current state
+                params = None
+                if action not in self.param_getters:
+                    params = self.get_params(entry, action, joystick_index)
+
+                binding = Binding(order, action, entry, params)
+                layout.setdefault(input_id, []).append(binding)
+                order += 1
+
+        return order
+
+    def compile_layout(self, config, joystick_index):
+        layout = CompiledLayout()
+        order = 0
+        if joystick_index is not None:
+            order = self.compile_bindings(config.get(CONFIG_BUTTONS, {}), "button", joystick_index, layout.buttons, order)
+            self.compile_bindings(config.get(CONFIG_HATS, {}), "hat", joystick_index, layout.hats, order)
+        else:
+            self.compile_bindings(config.get(CONFIG_KEYS, {}), "key", joystick_index, layout.keys, order)
+        return layout
+
+    def compile_config(self, config, joystick_index=None):
+        """Compile a joystick or keyboard config into a CompiledConfig.
+
+        Done once when the config is loaded so that resolving actions only
+        has to look up the inputs that are active instead of scanning the
+        whole config on every frame.
+        """
+        selector_field = LAYOUT_KEY if joystick_index is None else LAYOUT_BUTTON
+        layouts = []
+        i = 1
+        while True:
+            layout_str_key = LAYOUT + str(i)
+            if layout_str_key not in config:
+                break
+            layout_config = config[layout_str_key]
+            selector = layout_config[selector_field]
+            if joystick_index is None:
+                selector = getattr(pygame, selector)
+            layouts.append((selector, self.compile_layout(layout_config, joystick_index)))
+            i += 1
+
+        default_layout = self.compile_layout(config[DEFAULT_LAYOUT], joystick_index)
+        return CompiledConfig(default_layout, layouts)
+
+    def initialize_bindings(self):
+        self.joystick_bindings = [
+            self.compile_config(joystick_config, i) for i, joystick_config in enumerate(self.joystick_configs)
+        ]
+        self.keyboard_bindings = self.compile_config(self.keyboard_config)
+
+    def find_bound_actions(self, bindings, inputs, joystick_index, actions):
+        # Several active inputs may be bound to the same action, the binding
+        # listed last in the config wins like when scanning the config
+        found = {}
+        for input_id in inputs:
+            for binding in bindings.get(input_id, ()):
+                previous = found.get(binding.action)
+                if previous is None or previous.order < binding.order:
+                    found[binding.action] = binding
+
+        for action, binding in found.iteritems():
+            if binding.params is not None:
+                actions[action] = binding.params
+            else:
+                actions[action] = self.get_params(binding.config, action, joystick_index)
 
         return actions
 
-    def find_actions_for_hats(self, hats, joystick_index, actions):
+    def find_actions_for_buttons(self, buttons, joystick_index, actions):
         layout = self.get_joystick_layout(joystick_index)
-        layout_hats = layout[CONFIG_HATS]
+        return self.find_bound_actions(layout.buttons, buttons, joystick_index, actions)
 
-        for key, value in layout_hats.iteritems():
-            if isinstance(value, list):
-                # List of dicts where "id" stores hat id, "dir" hat direction and "param" parameter for command
-                for d in value:
-                    if [d["id"], d["dir"]] in hats:
-                        actions[key] = self.get_params(d, key, joystick_index)
-            else:
-                # Dict where "id" stores hat id, "dir" hat direction and "param" parameter for command
-                if [value["id"], value["dir"]] in hats:
-                    actions[key] = self.get_params(value, key, joystick_index)
-
-        return actions
+    def find_actions_for_hats(self, hats, joystick_index, actions):
+        layout = self.get_joystick_layout(joystick_index)
+        return self.find_bound_actions(layout.hats, hats, joystick_index, actions)
 
     def find_actions_for_keys(self, keys, actions):
         layout = self.get_keyboard_layout()
-        layout_keys = layout[CONFIG_KEYS]
-
-        for key, value in layout_keys.iteritems():
-            if isinstance(value, list):
-                # List of dicts where "key" stores key id and "param" parameter for command
-                for d in value:
-                    if getattr(pygame, d["key"]) in keys:
-                        actions[key] = self.get_params(d, key)
-            elif isinstance(value, dict):
-                # Dict where "key" stores key id and "param" parameter for command
-                if getattr(pygame, value["key"]) in keys:
-                    actions[key] = self.get_params(value, key)
-            else:
-                # Just the id for the key
-                if getattr(pygame, value) in keys:
-                    actions[key] = self.get_params({}, key)
+        return self.find_bound_actions(layout.keys, keys, None, actions)
 
-        return actions
-
-    def get_actions(self):
+    def get_actions(self, route):
         actions = {}
 
-        for joystick_index in range(0,len(self.joystick_configs)):
+        for joystick_index in route.joystick_indexes:
             self.find_actions_for_hats(self.get_active_hats(joystick_index), joystick_index, actions)
             self.find_actions_for_buttons(self.get_pressed_buttons(joystick_index), joystick_index, actions)
 
-        self.find_actions_for_keys(self.pressed_keys, actions)
+        if route.keyboard:
+            self.find_actions_for_keys(self.pressed_keys, actions)
+
+        if route.remote:
+            for action, params in self.remote_actions.iteritems():
+                if action not in actions:
+                    actions[action] = params
 
         return actions
 
-    def handle_zoom_and_focus(self, zoom, actions):
+    def handle_zoom_and_focus(self, route, zoom, actions):
         if zoom > 0:
             actions[ZOOM_IN] = {"speed": zoom}
         elif zoom < 0:
             actions[ZOOM_OUT] = {"speed": zoom}
 
         if ZOOM_IN not in actions and ZOOM_OUT not in actions:
-            if self.zoom_active is True:
+            if route.zoom_active is True:
                 actions[ZOOM_STOP] = {}
-                self.zoom_active = False
+                route.zoom_active = False
         else:
-            self.zoom_active = True
+            route.zoom_active = True
 
         if FOCUS_FAR not in actions and FOCUS_NEAR not in actions and AUTO_FOCUS not in actions:
-            if self.focus_active is True:
+            if route.focus_active is True:
                 actions[FOCUS_STOP] = {}
-                self.focus_active = False
+                route.focus_active = False
         else:
-            self.focus_active = True
+            route.focus_active = True
 
         return actions
 
@@ -514,85 +1842,67 @@ class Foo(object):
         return (pan, tilt, actions)
 
     def initialize_joystick_parameters(self):
-        for i, joystick_config in enumerate(self.joystick_configs):
-            self.param_pan_axis_multiplier.append(joystick_config[CONFIG_PARAMETERS].get(PAN_AXIS_MULTIPLIER, False))
-            self.param_tilt_axis_multiplier.append(joystick_config[CONFIG_PARAMETERS].get(TILT_AXIS_MULTIPLIER, False))
-            self.param_zoom_axis_multiplier.append(joystick_config[CONFIG_PARAMETERS].get(ZOOM_AXIS_MULTIPLIER, 1))
-            self.param_zoom_axis_enabled.append(joystick_config[CONFIG_PARAMETERS].get(ZOOM_AXIS_ENABLED, True))
-            self.param_invert_pan_axis.append(joystick_config[CONFIG_PARAMETERS].get(INVERT_PAN_AXIS, False))
-            self.param_invert_tilt_axis.append(joystick_config[CONFIG_PARAMETERS].get(INVERT_TILT_AXIS, False))
-            self.param_invert_zoom_axis.append(joystick_config[CONFIG_PARAMETERS].get(INVERT_ZOOM_AXIS, False))
-            self.param_invert_sensitivity_axis.append(joystick_config[CONFIG_PARAMETERS].get(INVERT_SENSITIVITY_AXIS, False))
-            self.param_pan_axis_dead_zone.append(joystick_config[CONFIG_PARAMETERS].get(PAN_AXIS_DEAD_ZONE, 0.1))
-            self.param_tilt_axis_dead_zone.append(joystick_config[CONFIG_PARAMETERS].get(TILT_AXIS_DEAD_ZONE, 0.1))
-            self.param_zoom_axis_dead_zone.append(joystick_config[CONFIG_PARAMETERS].get(ZOOM_AXIS_DEAD_ZONE, 0.1))
-            self.param_sensitivity_axis_dead_zone.append(joystick_config[CONFIG_PARAMETERS].get(SENSITIVITY_AXIS_DEAD_ZONE, 0.1))
+        for attribute, values in self.load_joystick_parameters(self.joystick_configs).items():
+            setattr(self, attribute, values)
+        self.sensitivity_tables = [None] * len(self.joystick_configs)
+        self.pan_tables = [None] * len(self.joystick_configs)
+        self.tilt_tables = [None] * len(self.joystick_configs)
+        self.zoom_tables = [None] * len(self.joystick_configs)
+        for i in range(0, len(self.joystick_configs)):
+            self.compile_axis_tables(i)
+
+    def load_joystick_parameters(self, joystick_configs):
+        """Lists of the parameters of the joysticks by Foo attribute."""
+        return dict(
+            (attribute, [joystick_config[CONFIG_PARAMETERS].get(key, default) for joystick_config in joystick_configs])
+            for attribute, key, default in JOYSTICK_PARAMETERS
+        )
+
+    def compile_axis_tables(self, joystick_index):
+        """Compile the response curves of a joystick, again whenever an axis is inverted."""
+        values = dict((key, getattr(self, attribute)[joystick_index]) for attribute, key, _ in JOYSTICK_PARAMETERS)
+        (
+            self.sensitivity_tables[joystick_index],
+            self.pan_tables[joystick_index],
+            self.tilt_tables[joystick_index],
+            self.zoom_tables[joystick_index],
+        ) = compile_joystick_tables(self.joystick_configs[joystick_index][CONFIG_PARAMETERS], values)
+
+    def get_axis_value(self, joystick_index, axis_name):
+        axis = self.joystick_configs[joystick_index][CONFIG_AXES].get(axis_name, None)
+        if axis is None:
+            return None
+        return self.current_joystick_states[joystick_index].axes_value[axis]
 
     def get_sensitivity(self, joystick_index):
-        sensitivity_axis = self.joystick_configs[joystick_index][CONFIG_AXES].get(SENSITIVITY_AXIS, None)
-        sensitivity_axis_value = 1.0
-        if sensitivity_axis is not None:
-            sensitivity_axis_value = self.current_joystick_states[joystick_index].axes_value[sensitivity_axis]
-            if abs(sensitivity_axis_value) <= self.param_sensitivity_axis_dead_zone[joystick_index]:
-                sensitivity_axis_value = 0.0
-            sensitivity_axis_value = (sensitivity_axis_value * -1) + 1.0
-            if self.param_invert_sensitivity_axis[joystick_index]:
-                sensitivity_axis_value = -1 * (sensitivity_axis_value - 2.0)
-        return sensitivity_axis_value
-
-    def get_pan(self, joystick_index, sensitivity_multiplier):
-        pan_axis = self.joystick_configs[joystick_index][CONFIG_AXES].get(PAN_AXIS, None)
-        pan_axis_value = 0.0
-
-        if pan_axis is not None:
-            pan_axis_value = self.current_joystick_states[joystick_index].axes_value[pan_axis]
-
-        if abs(pan_axis_value) <= self.param_pan_axis_dead_zone[joystick_index]:
-            pan_axis_value = 0.0
-
-        pan_axis_multiplier = 1 + sensitivity_multiplier * self.param_pan_axis_multiplier[joystick_index]
-        pan_invert_value = -1 if self.param_invert_pan_axis[joystick_index] else 1
-        pan = pan_invert_value * clip(int(pan_axis_multiplier * pan_axis_value), MIN_PAN_VALUE, MAX_PAN_VALUE)
-        
-        return pan
-    
-    def get_tilt(self, joystick_index, sensitivity_multiplier):
-        tilt_axis = self.joystick_configs[joystick_index][CONFIG_AXES].get(TILT_AXIS, None)
-        tilt_axis_value = 0.0
-
-        if tilt_axis is not None:
-            tilt_axis_value = self.current_joystick_states[joystick_index].axes_value[tilt_axis]
-
-        if abs(tilt_axis_value) <= self.param_tilt_axis_dead_zone[joystick_index]:
-            tilt_axis_value = 0.0
-
-        tilt_axis_multiplier = 1 + sensitivity_multiplier * self.param_tilt_axis_multiplier[joystick_index]
-        tilt_invert_value = 1 if self.param_invert_tilt_axis[joystick_index] else -1
-        tilt = tilt_invert_value * clip(int(tilt_axis_multiplier * tilt_axis_value), MIN_TILT_VALUE, MAX_TILT_VALUE)
-
-        return tilt
-
-    def get_zoom(self, joystick_index, sensitivity_multiplier):
-        zoom_axis = self.joystick_configs[joystick_index][CONFIG_AXES].get(ZOOM_AXIS, None)
-        zoom_axis_value = 0.0
-
-        if zoom_axis is not None:
-            zoom_axis_value = self.current_joystick_states[joystick_index].axes_value[zoom_axis]
-
-        if abs(zoom_axis_value) <= self.param_zoom_axis_dead_zone[joystick_index]:
-            zoom_axis_value = 0.0
-
-        zoom_axis_multiplier = sensitivity_multiplier * self.param_zoom_axis_multiplier[joystick_index]
-        zoom = 0
-        if self.param_zoom_axis_enabled[joystick_index] and zoom_axis_value != 0.0:
-            if zoom_axis_value < 0:
-                zoom_value = zoom_axis_value - 1.0
-            else:
-                zoom_value = zoom_axis_value + 1.0
-            zoom = clip(int(zoom_value + (zoom_axis_multiplier * zoom_axis_value)), MIN_ZOOM_VALUE-1, MAX_ZOOM_VALUE+1)
-            zoom = zoom if not self.param_invert_zoom_axis[joystick_index] else -1 * zoom
-
-        return zoom
+        sensitivity_axis_value = self.get_axis_value(joystick_index, SENSITIVITY_AXIS)
+        if sensitivity_axis_value is None:
+            return 1.0
+        return self.sensitivity_tables[joystick_index].values[axis_index(sensitivity_axis_value)]
+
+    def get_sensitivity_row(self, joystick_index):
+        sensitivity_axis_value = self.get_axis_value(joystick_index, SENSITIVITY_AXIS)
+        if sensitivity_axis_value is None:
+            return sensitivity_row(1.0)
+        return self.sensitivity_tables[joystick_index].rows[axis_index(sensitivity_axis_value)]
+
+    def get_pan(self, joystick_index, sensitivity_row):
+        pan_axis_value = self.get_axis_value(joystick_index, PAN_AXIS)
+        if pan_axis_value is None:
+            return 0
+        return self.pan_tables[joystick_index].lookup(sensitivity_row, pan_axis_value)
+
+    def get_tilt(self, joystick_index, sensitivity_row):
+        tilt_axis_value = self.get_axis_value(joystick_index, TILT_AXIS)
+        if tilt_axis_value is None:
+            return 0
+        return self.tilt_tables[joystick_index].lookup(sensitivity_row, tilt_axis_value)
+
+    def get_zoom(self, joystick_index, sensitivity_row):
+        zoom_axis_value = self.get_axis_value(joystick_index, ZOOM_AXIS)
+        if zoom_axis_value is None or not self.param_zoom_axis_enabled[joystick_index]:
+            return 0
+        return self.zoom_tables[joystick_index].lookup(sensitivity_row, zoom_axis_value)
 
     def _get_zoom_in_param(self, joystick_index):
         param = {}
@@ -610,82 +1920,98 @@ class Foo(object):
             param["speed"] = -1 * zoom
         return param
 
-    def get_ptz_from_axes(self):
+    def get_ptz_from_axes(self, route):
         pan = 0
         tilt = 0
         zoom = 0
-        for i, joystick_config in enumerate(self.joystick_configs):
-            sensitivity_axis_value = self.get_sensitivity(i)
+        for i in route.joystick_indexes:
+            sensitivity_row = self.get_sensitivity_row(i)
+            if pan == 0:
+                pan = self.get_pan(i, sensitivity_row)
+            if tilt == 0:
+                tilt = self.get_tilt(i, sensitivity_row)
+            if zoom == 0:
+                zoom = self.get_zoom(i, sensitivity_row)
+        # Network clients come after the local controllers
+        if route.remote:
             if pan == 0:
-                pan = self.get_pan(i, sensitivity_axis_value)
+                pan = self.remote_ptz[0]
             if tilt == 0:
-                tilt = self.get_tilt(i, sensitivity_axis_value)
+                tilt = self.remote_ptz[1]
             if zoom == 0:
-                zoom = self.get_zoom(i, sensitivity_axis_value)
+                zoom = self.remote_ptz[2]
         return (pan, tilt, zoom)
 
+    def scale_pan_tilt_by_zoom(self, pan, tilt):
+        """Slow down pan and tilt the more the active camera is zoomed in."""
+        camera = self.get_camera()
+        if camera.zoom_pan_speeds is None:
+            return (pan, tilt)
+        # Cached by the inquiry poller, never asked from the camera here
+        zoom = camera.state.get('zoom', ZOOM_POSITION_MAX_AGE)
+        if zoom is None:
+            return (pan, tilt)
+        step = min(max(zoom, 0) * ZOOM_SCALE_STEPS // camera.zoom_max, ZOOM_SCALE_STEPS)
+        pan = camera.zoom_pan_speeds[step][min(max(pan, MIN_PAN_VALUE), MAX_PAN_VALUE) + MAX_PAN_VALUE]
+        tilt = camera.zoom_tilt_speeds[step][min(max(tilt, MIN_TILT_VALUE), MAX_TILT_VALUE) + MAX_TILT_VALUE]
+        return (pan, tilt)
+
     def _memory(self, cmd, mem=0, joystick_index=None):
+        camera = self.get_camera()
         if cmd == MEMORY_SET:
-            pysca.set_memory(1, mem, blocking=True)
+            camera.put('set_memory', mem)
         elif cmd == MEMORY_RECALL:
-            pysca.recall_memory(1, mem, blocking=True)
+            camera.put('recall_memory', mem)
+            camera.memory = mem
 
     def _focus(self, cmd, joystick_index=None):
+        camera = self.get_camera()
         if cmd == AUTO_FOCUS:
-            if self.focus_mode != "auto":
-                pysca.set_focus_mode(1, "auto", blocking=True)
-                self.focus_mode = "auto"
-            pysca.set_focus_mode(1, "trigger", blocking=True)
+            if camera.focus_mode != "auto":
+                camera.put('set_focus_mode', "auto")
+                camera.focus_mode = "auto"
+            camera.put('set_focus_mode', "trigger")
 
         if cmd in {FOCUS_FAR, FOCUS_NEAR}:
-            if self.focus_mode != "manual":
-                pysca.set_focus_mode(1, "manual", blocking=True)
-                self.focus_mode = "manual"
+            if camera.focus_mode != "manual":
+                camera.put('set_focus_mode', "manual")
+                camera.focus_mode = "manual"
             if cmd == FOCUS_FAR:
-                if self.focus_action != "far":
-                    pysca.focus(1, "far", speed=2, blocking=True)
-                    self.focus_action = "far"
+                camera.put_latest(FOCUS_COMMAND, 'focus', "far", speed=2)
             elif cmd == FOCUS_NEAR:
-                if self.focus_action != "near":
-                    pysca.focus(1, "near", speed=2, blocking=True)
-                    self.focus_action = "near"
+                camera.put_latest(FOCUS_COMMAND, 'focus', "near", speed=2)
 
-        if cmd == FOCUS_STOP and self.focus_action != "stop":
-            pysca.focus(1, "stop", blocking=True)
-            self.focus_action = "stop"
+        if cmd == FOCUS_STOP:
+            camera.put_latest(FOCUS_COMMAND, 'focus', "stop")
 
     def _wb(self, cmd, joystick_index=None):
+        camera = self.get_camera()
         if cmd == AUTO_WB:
-            if self.wb_mode != "auto":
-                pysca.set_wb_mode(1, "auto", blocking=True)
-                self.wb_mode = "auto"
+            if camera.wb_mode != "auto":
+                camera.put('set_wb_mode', "auto")
+                camera.wb_mode = "auto"
 
         if cmd in {WB_RED_PLUS, WB_RED_MINUS, WB_BLUE_PLUS, WB_BLUE_MINUS}:
-            if self.wb_mode != "manual":
-                pysca.set_wb_mode(1, "manual", blocking=True)
-                self.wb_mode = "manual"
+            if camera.wb_mode != "manual":
+                camera.put('set_wb_mode', "manual")
+                camera.wb_mode = "manual"
             if cmd == WB_RED_PLUS:
-                pysca.set_red_gain(1, "up", blocking=True)
+                camera.put('set_red_gain', "up")
             elif cmd == WB_RED_MINUS:
-                pysca.set_red_gain(1, "down", blocking=True)
+                camera.put('set_red_gain', "down")
             elif cmd == WB_BLUE_PLUS:
-                pysca.set_blue_gain(1, "up", blocking=True)
+                camera.put('set_blue_gain', "up")
             elif cmd == WB_BLUE_MINUS:
-                pysca.set_blue_gain(1, "down", blocking=True)
+                camera.put('set_blue_gain', "down")
 
     def _zoom(self, cmd, speed=0, joystick_index=None):
-        if cmd == ZOOM_OUT and (self.zoom_mode != "wide" or self.prev_zoom != speed):
-            pysca.zoom(1, "wide", speed=-1*speed, blocking=True)
-            self.zoom_mode = "wide"
-            self.prev_zoom = speed
-        elif cmd == ZOOM_IN and (self.zoom_mode != "tele" or self.prev_zoom != speed):
-            pysca.zoom(1, "tele", speed=speed, blocking=True)
-            self.zoom_mode = "tele"
-            self.prev_zoom = speed
-        elif (cmd == ZOOM_STOP) and self.zoom_mode != "stop":
-            pysca.zoom(1, "stop", blocking=True)
-            self.zoom_mode = "stop"
-            self.prev_zoom = speed
+        camera = self.get_camera()
+        if cmd == ZOOM_OUT:
+            camera.put_latest(ZOOM_COMMAND, 'zoom', "wide", speed=-1*speed)
+        elif cmd == ZOOM_IN:
+            camera.put_latest(ZOOM_COMMAND, 'zoom', "tele", speed=speed)
+        elif cmd == ZOOM_STOP:
+            camera.put_latest(ZOOM_COMMAND, 'zoom', "stop")
 
     def _set_tilt_invert(self, cmd, joystick_index=0):
         if cmd == TILT_INVERT_ON:
@@ -694,6 +2020,7 @@ class Foo(object):
             self.param_invert_tilt_axis[joystick_index] = False
         if cmd == TILT_INVERT_TOGGLE:
             self.param_invert_tilt_axis[joystick_index] = not self.param_invert_tilt_axis[joystick_index]
+        self.compile_axis_tables(joystick_index)
 
     def _set_pan_invert(self, cmd, joystick_index=0):
         if cmd == PAN_INVERT_ON:
@@ -702,6 +2029,7 @@ class Foo(object):
             self.param_invert_pan_axis[joystick_index] = False
         if cmd == PAN_INVERT_TOGGLE:
             self.param_invert_pan_axis[joystick_index] = not self.param_invert_pan_axis[joystick_index]
+        self.compile_axis_tables(joystick_index)
 
     def _set_zoom_invert(self, cmd, joystick_index=0):
         if cmd == PAN_INVERT_ON:
@@ -710,6 +2038,7 @@ class Foo(object):
             self.param_invert_zoom_axis[joystick_index] = False
         if cmd == PAN_INVERT_TOGGLE:
             self.param_invert_zoom_axis[joystick_index] = not self.param_invert_pan_axis[joystick_index]
+        self.compile_axis_tables(joystick_index)
 
     def _set_zoom_axis(self, cmd, joystick_index=0):
         if cmd == ZOOM_AXIS_ON:
@@ -719,49 +2048,105 @@ class Foo(object):
         if cmd == ZOOM_AXIS_TOGGLE:
             self.param_zoom_axis_enabled[joystick_index] = not self.param_zoom_axis_enabled[joystick_index]
 
-    def _main_loop(self):
-        clock = pygame.time.Clock()
-        prev_joystick_states = None
-        prev_pressed_keys = None
-
-        self.initialize_joystick_parameters()
-
-        while self.keep_running:
-            clock.tick(10)
+    def _select_camera(self, cmd, camera=0, route=None, joystick_index=None):
+        # Another route is switched when given, by default the route of the controller
+        if route is not None and route >= len(self.routes):
+            return
+        route = self.route if route is None else self.routes[route]
+        if camera == route.camera or camera >= len(self.cameras):
+            return
+
+        # Stop the previous camera so that it does not keep on moving, unless another route drives it
+        if not any(other.camera == route.camera for other in self.routes if other is not route):
+            previous_camera = self.cameras[route.camera]
+            previous_camera.put_latest(PAN_TILT_COMMAND, 'pan_tilt', pan=0, tilt=0)
+            previous_camera.put_latest(ZOOM_COMMAND, 'zoom', "stop")
+            previous_camera.put_latest(FOCUS_COMMAND, 'focus', "stop")
+
+        route.camera = camera
+        # Pan/tilt, zoom and focus still held start on the new camera with the next frame
+        route.pan_tilt = None
+        route.action_engine.forget(CONTINUOUS_ACTIONS)
+        print("Route {} selected camera {}".format(route.name, self.cameras[camera].name))
+
+    def process_frame(self):
+        """Read the input state and send the resulting commands if it has changed.
+
+        Returns a list with the (pan, tilt, actions) sent by every route, or
+        None if the input has not changed since the previous frame.
+        """
+        # TODO not interested in pressed keys, but in found actions
+        self.frame_count += 1
+        if not self.take_snapshot():
+            self.unchanged_frame_count += 1
+            now = time.time()
+            for route in self.routes:
+                self.route = route
+                # Held actions repeat while the input does not change
+                route.action_engine.repeat(now)
+                # Pan/tilt speed follows the zoom while the stick is held
+                if route.unscaled_pan_tilt is not None:
+                    self.put_pan_tilt(route, *self.scale_pan_tilt_by_zoom(*route.unscaled_pan_tilt))
+                if self.idle_frame:
+                    route.action_engine.refresh(CONTINUOUS_ACTIONS)
+            self.idle_frame = False
+            return None
+        self.idle_frame = False
+
+        input_time = self.snapshot_input_time
+        if input_time is not None:
+            self.latency.record('input-to-snapshot', time.time() - input_time)
+        for command_queue in self.command_queues:
+            command_queue.origin_time = input_time
+
+        results = []
+        for route in self.routes:
+            self.route = route
+            results.append(self.process_route(route, input_time))
+        return results
+
+    def process_route(self, route, input_time):
+        ptz = self.get_ptz_from_axes(route)
+        pan = ptz[0]
+        tilt = ptz[1]
+        zoom = ptz[2]
+
+        actions = self.get_actions(route)
+        actions = self.handle_zoom_and_focus(route, zoom, actions)
+        modified = self.handle_pan_and_tilt(pan, tilt, actions)
+        pan = modified[0]
+        tilt = modified[1]
+        actions = modified[2]
+        route.unscaled_pan_tilt = (pan, tilt)
+        pan, tilt = self.scale_pan_tilt_by_zoom(pan, tilt)
+
+        if input_time is not None:
+            self.latency.record('input-to-actions', time.time() - input_time)
+
+        # print("Actions: {}".format(actions))
+        # print("Pan: {}, tilt: {}".format(pan, tilt))
+
+        self.dispatch_commands(route, pan, tilt, actions)
 
-            with self.state_read_lock:
-                # self.joystick_states is updated by joystick_thread
-                self.current_joystick_states = copy.deepcopy(self.joystick_states)
-
-            self.pressed_keys = self.get_pressed_keys()
-
-            # TODO not interested in pressed keys, but in found actions
-            if prev_joystick_states == self.current_joystick_states and prev_pressed_keys == self.pressed_keys:
-                continue
-
-            prev_joystick_states = copy.deepcopy(self.current_joystick_states)
-            prev_pressed_keys = copy.deepcopy(self.pressed_keys)
-
-            ptz = self.get_ptz_from_axes()
-            pan = ptz[0]
-            tilt = ptz[1]
-            zoom = ptz[2]
+        return (pan, tilt, actions)
 
-            actions = self.get_actions()
-            actions = self.handle_zoom_and_focus(zoom, actions)
-            modified = self.handle_pan_and_tilt(pan, tilt, actions)
-            pan = modified[0]
-            tilt = modified[1]
-            actions = modified[2]
+    def put_pan_tilt(self, route, pan, tilt):
+        # Routes sharing a camera would otherwise stop each other on every frame
+        if (pan, tilt) == (0, 0) and route.pan_tilt == (0, 0):
+            return
+        route.pan_tilt = (pan, tilt)
+        self.get_camera().put_latest(PAN_TILT_COMMAND, 'pan_tilt', pan=pan, tilt=tilt)
 
-            # print("Actions: {}".format(actions))
-            # print("Pan: {}, tilt: {}".format(pan, tilt))
+    def dispatch_commands(self, route, pan, tilt, actions):
+        self.put_pan_tilt(route, pan, tilt)
+        route.action_engine.update(actions, time.time())
 
-            pysca.pan_tilt(1, pan=pan, tilt=tilt, blocking=True)
+    def _main_loop(self):
+        clock = pygame.time.Clock()
 
-            for action, params in actions.iteritems():
-                handler = self.command_handlers.get(action)
-                handler(action, **params)
+        while self.keep_running:
+            self.wait_for_input(clock)
+            self.process_frame()
 
 
 if __name__ == "__main__":